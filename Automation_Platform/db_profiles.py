@@ -0,0 +1,78 @@
+"""
+数据库配置方案模块
+由settings.DATABASE_PROFILE（环境变量DATABASE_PROFILE）选择默认数据库的配置：
+
+    sqlite      单文件SQLite（默认），rollback日志；与Django默认的SQLite配置不同，
+                事务以IMMEDIATE模式开始（开始时即获取写锁），等待写锁最多SQLITE_BUSY_TIMEOUT（20）秒
+    sqlite-wal  高并发SQLite：在sqlite方案的基础上使用WAL日志（读写互不阻塞）、synchronous=NORMAL和mmap_size，
+                并开启DATABASE_SERIALIZE_WRITES，执行器的写操作由进程内唯一的写线程串行执行
+    postgresql  PostgreSQL，使用持久连接（CONN_MAX_AGE）并在复用前检查连接，需安装psycopg；
+                连接参数从环境变量POSTGRES_DB、POSTGRES_USER、POSTGRES_PASSWORD、POSTGRES_HOST、
+                POSTGRES_PORT读取，DATABASE_CONN_MAX_AGE设置持久连接的最长时间（秒）
+
+本模块只依赖标准库，可在settings中导入；两种SQLite方案的对比见 manage.py benchmark_db
+"""
+
+import os
+from typing import Any, Dict, Mapping, Optional
+
+PROFILES = ('sqlite', 'sqlite-wal', 'postgresql')
+
+# SQLite等待写锁的时间（秒），超过后抛出database is locked；两种SQLite方案相同（Django默认为5秒）
+SQLITE_BUSY_TIMEOUT = 20
+
+# WAL方案每个连接初始化时执行的PRAGMA
+SQLITE_WAL_PRAGMAS = {
+    # 读取不阻塞写入，写入也不阻塞读取
+    'journal_mode': 'WAL',
+    # WAL模式下只在检查点时同步磁盘，断电可能丢失最近的事务但不会损坏数据库
+    'synchronous': 'NORMAL',
+    # 通过内存映射读取数据库文件（256MB），减少读取时的系统调用
+    'mmap_size': 256 * 1024 * 1024,
+    # 临时表和排序使用内存
+    'temp_store': 'MEMORY',
+}
+
+
+def sqlite_database(name, wal: bool = False, timeout: float = SQLITE_BUSY_TIMEOUT) -> Dict[str, Any]:
+    """SQLite数据库配置"""
+    options = {
+        # Web服务、worker和设备代理多个进程同时写入：事务开始时即获取写锁，
+        # 避免读后写升级锁失败（database is locked），等待写锁最多timeout秒
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': timeout,
+    }
+    if wal:
+        options['init_command'] = ';'.join(f"PRAGMA {key}={value}" for key, value in SQLITE_WAL_PRAGMAS.items())
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'OPTIONS': options,
+    }
+
+
+def postgresql_database(env: Mapping[str, str]) -> Dict[str, Any]:
+    """PostgreSQL数据库配置（持久连接）"""
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env.get('POSTGRES_DB', 'automation_platform'),
+        'USER': env.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': env.get('POSTGRES_PASSWORD', ''),
+        'HOST': env.get('POSTGRES_HOST', 'localhost'),
+        'PORT': env.get('POSTGRES_PORT', '5432'),
+        # worker线程和Web请求复用连接，避免每次请求重新建立连接
+        'CONN_MAX_AGE': int(env.get('DATABASE_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+
+
+def get_database(profile: str, base_dir, env: Optional[Mapping[str, str]] = None) -> Dict[str, Any]:
+    """获取配置方案对应的默认数据库配置"""
+    env = os.environ if env is None else env
+    if profile == 'sqlite':
+        return sqlite_database(base_dir / 'db.sqlite3')
+    if profile == 'sqlite-wal':
+        return sqlite_database(base_dir / 'db.sqlite3', wal=True)
+    if profile == 'postgresql':
+        return postgresql_database(env)
+    raise ValueError(f"未知的数据库配置方案: {profile}（可选: {', '.join(PROFILES)}）")
@@ -0,0 +1,90 @@
+"""
+数据库写入队列模块
+SQLite同一时间只允许一个写事务，执行器的大量设备线程同时写入时会在写锁上反复等待重试；
+开启DATABASE_SERIALIZE_WRITES后，执行器的写操作交给进程内唯一的写线程依次执行，
+调用线程阻塞等待结果，进程内的线程不再相互争抢写锁。未开启时直接在调用线程中执行
+"""
+
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable
+
+from django.conf import settings
+from django.db import connection, connections
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueue:
+    """单线程写入队列"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """提交写操作，返回Future"""
+        self.start()
+        future = Future()
+        self._queue.put((func, args, kwargs, future))
+        return future
+
+    def stop(self, timeout: float = 5):
+        """执行完已提交的写操作后结束写线程，并关闭写线程的数据库连接"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+
+    def run(self, func: Callable, *args, **kwargs) -> Any:
+        """在写线程中执行写操作并等待结果（在写线程中调用时直接执行）"""
+        if threading.current_thread() is self._thread:
+            return func(*args, **kwargs)
+        return self.submit(func, *args, **kwargs).result()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                connections.close_all()
+                return
+            func, args, kwargs, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+                # 出错后重新建立连接，避免后续写操作使用已损坏的连接
+                connections.close_all()
+
+
+_write_queue = WriteQueue()
+
+
+def get_write_queue() -> WriteQueue:
+    return _write_queue
+
+
+def run_write(func: Callable, *args, **kwargs) -> Any:
+    """
+    执行写操作（便捷函数）
+
+    开启DATABASE_SERIALIZE_WRITES时在写线程中执行；调用方处于事务中时直接执行，
+    以免写线程等待调用方事务持有的写锁
+    """
+    if not getattr(settings, 'DATABASE_SERIALIZE_WRITES', False) or connection.in_atomic_block:
+        return func(*args, **kwargs)
+    return _write_queue.run(func, *args, **kwargs)
@@ -0,0 +1,233 @@
+"""
+进程内事件发布/订阅模块
+用于将设备变化、任务进度等事件通过SSE推送到浏览器
+
+ASGI下SSE响应使用异步生成器，等待事件时不占用线程；WSGI下使用同步生成器，每个连接占用一个工作线程。
+两种情况下连接都在SSE_STREAM_TIMEOUT秒后结束，由浏览器自动重连，避免断开的客户端长期占用资源
+"""
+
+import json
+import time
+import queue
+import asyncio
+import threading
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """单个订阅者的事件队列"""
+
+    def __init__(self, broker: 'EventBroker', topic: str, maxsize: int):
+        self.broker = broker
+        self.topic = topic
+        self.queue = queue.Queue(maxsize=maxsize)
+        # 异步等待者：(事件循环, asyncio.Event)，发布方在其他线程中通过call_soon_threadsafe唤醒
+        self._waiter = None
+        self._lock = threading.Lock()
+
+    def put(self, event: Dict[str, Any]):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # 消费过慢的订阅者丢弃最旧的事件，避免阻塞发布方
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.queue.put_nowait(event)
+        self._wake()
+
+    def _wake(self):
+        with self._lock:
+            waiter = self._waiter
+        if waiter is not None:
+            loop, ready = waiter
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """异步等待事件，超时返回None"""
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        ready = asyncio.Event()
+        with self._lock:
+            self._waiter = (asyncio.get_running_loop(), ready)
+        try:
+            # 注册等待者之后再检查一次，避免错过注册前放入的事件
+            try:
+                return self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                await asyncio.wait_for(ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            try:
+                return self.queue.get_nowait()
+            except queue.Empty:
+                return None
+        finally:
+            with self._lock:
+                self._waiter = None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    """事件代理类"""
+
+    def __init__(self, maxsize: int = 100):
+        self.maxsize = maxsize
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic: str) -> Subscription:
+        subscription = Subscription(self, topic, self.maxsize)
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic)
+            if subscribers:
+                subscribers.discard(subscription)
+
+    def publish(self, topic: str, event: Dict[str, Any]) -> int:
+        """发布事件，返回收到事件的订阅者数量"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+        return len(subscribers)
+
+    def subscriber_count(self, topic: str) -> int:
+        with self._lock:
+            return len(self._subscribers.get(topic, ()))
+
+
+broker = EventBroker()
+
+
+def format_sse(event: Dict[str, Any], event_type: Optional[str] = None) -> str:
+    """将事件格式化为SSE消息"""
+    message = ''
+    if event.get('id') is not None:
+        # 浏览器断线重连时会在Last-Event-ID请求头中带回该值
+        message += f"id: {event['id']}\n"
+    if event_type:
+        message += f"event: {event_type}\n"
+    message += f"data: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+    return message
+
+
+def _initial_events(initial: Union[Dict[str, Any], Iterable[Dict[str, Any]], None]) -> List[Dict[str, Any]]:
+    if isinstance(initial, dict):
+        return [initial]
+    return list(initial or ())
+
+
+def _format_event(event: Dict[str, Any], predicate: Optional[Callable[[Dict[str, Any]], bool]]) -> Optional[str]:
+    if predicate is not None and not predicate(event):
+        return None
+    return format_sse(event, event.get('type'))
+
+
+async def sse_stream(subscription: Subscription,
+                     initial: Union[Dict[str, Any], Iterable[Dict[str, Any]], None] = None,
+                     keepalive: float = 15,
+                     timeout: Optional[float] = None,
+                     predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> AsyncIterator[str]:
+    """
+    持续输出订阅到的事件，空闲时发送注释行保持连接，timeout秒后结束（浏览器随后重连）
+
+    initial: 连接建立后先发送的一个或多个事件
+    predicate: 只发送返回True的事件
+    """
+    deadline = time.monotonic() + (timeout or get_stream_timeout())
+    try:
+        # 让浏览器断线后3秒重连
+        yield "retry: 3000\n\n"
+        for event in _initial_events(initial):
+            message = _format_event(event, predicate)
+            if message:
+                yield message
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            event = await subscription.aget(timeout=min(keepalive, remaining))
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            message = _format_event(event, predicate)
+            if message:
+                yield message
+    finally:
+        subscription.close()
+
+
+def sse_stream_sync(subscription: Subscription,
+                    initial: Union[Dict[str, Any], Iterable[Dict[str, Any]], None] = None,
+                    keepalive: float = 15,
+                    timeout: Optional[float] = None,
+                    predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Iterator[str]:
+    """sse_stream的同步版本，用于WSGI"""
+    deadline = time.monotonic() + (timeout or get_stream_timeout())
+    try:
+        yield "retry: 3000\n\n"
+        for event in _initial_events(initial):
+            message = _format_event(event, predicate)
+            if message:
+                yield message
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            event = subscription.get(timeout=min(keepalive, remaining))
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            message = _format_event(event, predicate)
+            if message:
+                yield message
+    finally:
+        subscription.close()
+
+
+def get_stream_timeout() -> float:
+    return getattr(settings, 'SSE_STREAM_TIMEOUT', 300)
+
+
+def sse_response(request, subscription: Subscription,
+                 initial: Union[Dict[str, Any], Iterable[Dict[str, Any]], None] = None,
+                 predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> StreamingHttpResponse:
+    """构建SSE流式响应，ASGI下使用异步生成器"""
+    if isinstance(request, ASGIRequest):
+        stream = sse_stream(subscription, initial=initial, predicate=predicate)
+    else:
+        stream = sse_stream_sync(subscription, initial=initial, predicate=predicate)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
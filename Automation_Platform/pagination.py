@@ -0,0 +1,126 @@
+"""
+游标分页模块
+列表按(排序时间, id)倒序分页，翻页时以上一页首尾记录作为游标定位（WHERE 时间 <= 游标），
+不使用OFFSET，也不执行COUNT(*)，任意深度的页面与首页的查询开销相同；
+总数只在需要时按主键范围（PostgreSQL使用统计信息）返回近似值
+"""
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, List, Optional, Tuple
+
+from django.db import connections, router
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class InvalidCursor(ValueError):
+    """无法解析的分页游标"""
+
+
+def encode_cursor(value: datetime, pk: int) -> str:
+    """将(时间, id)编码为游标：<微秒时间戳>_<id>（整数运算，不丢失精度）"""
+    return f"{(value - EPOCH) // timedelta(microseconds=1)}_{pk}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        micros, pk = cursor.split('_')
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        raise InvalidCursor(f"无效的游标: {cursor}")
+
+
+def estimate_row_count(model) -> int:
+    """表的近似行数：PostgreSQL读取统计信息，其他数据库按主键范围估算（删除过的记录会使结果偏大）"""
+    connection = connections[router.db_for_read(model)]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                           [model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+
+    # 分开查询最小值和最大值，各自只需读取主键索引的一端
+    pks = model._base_manager.values_list('pk', flat=True)
+    first = pks.order_by('pk').first()
+    if first is None:
+        return 0
+    return pks.order_by('-pk').first() - first + 1
+
+
+class CursorPage:
+    """游标分页的一页"""
+
+    def __init__(self, object_list: List[Any], field: str, has_next: bool, has_previous: bool,
+                 approximate_count: Optional[int] = None):
+        self.object_list = object_list
+        self.field = field
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.approximate_count = approximate_count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        if not self.has_next or not self.object_list:
+            return None
+        last = self.object_list[-1]
+        return encode_cursor(getattr(last, self.field), last.pk)
+
+    @property
+    def previous_cursor(self) -> Optional[str]:
+        if not self.has_previous or not self.object_list:
+            return None
+        first = self.object_list[0]
+        return encode_cursor(getattr(first, self.field), first.pk)
+
+
+class CursorPaginator:
+    """
+    按(field, id)倒序的游标分页器
+
+    page(after=游标)返回游标之后（更早）的一页，page(before=游标)返回游标之前（更新）的一页；
+    需要(field, id)上的索引
+    """
+
+    def __init__(self, queryset, field: str, per_page: int):
+        self.queryset = queryset
+        self.field = field
+        self.per_page = per_page
+
+    def page(self, after: Optional[str] = None, before: Optional[str] = None,
+             with_count: bool = False) -> CursorPage:
+        if before:
+            value, pk = decode_cursor(before)
+            rows = list(self.queryset.filter(**{f'{self.field}__gte': value})
+                        .exclude(**{self.field: value, 'pk__lte': pk})
+                        .order_by(self.field, 'pk')[:self.per_page + 1])
+            if len(rows) <= self.per_page:
+                # 已回到第一页
+                return self.page(with_count=with_count)
+            page = CursorPage(rows[:self.per_page][::-1], self.field, has_next=True, has_previous=True)
+        else:
+            queryset = self.queryset
+            if after:
+                value, pk = decode_cursor(after)
+                queryset = (queryset.filter(**{f'{self.field}__lte': value})
+                            .exclude(**{self.field: value, 'pk__gte': pk}))
+            rows = list(queryset.order_by(f'-{self.field}', '-pk')[:self.per_page + 1])
+            page = CursorPage(rows[:self.per_page], self.field, has_next=len(rows) > self.per_page,
+                              has_previous=bool(after))
+
+        if with_count:
+            page.approximate_count = self.approximate_count()
+        return page
+
+    def approximate_count(self) -> Optional[int]:
+        """近似总数，只支持未筛选的查询集，否则返回None"""
+        if self.queryset.query.where:
+            return None
+        return estimate_row_count(self.queryset.model)
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from Automation_Platform.db_profiles import get_database
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -75,13 +78,18 @@ WSGI_APPLICATION = 'Automation_Platform.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# 数据库配置方案：sqlite（默认，IMMEDIATE事务、20秒写锁等待）、sqlite-wal（高并发SQLite）、postgresql（持久连接），
+# 通过环境变量DATABASE_PROFILE选择，各方案说明见Automation_Platform/db_profiles.py
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'sqlite')
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': get_database(DATABASE_PROFILE, BASE_DIR),
 }
 
+# 执行器的写操作（设备结果、进度、事件、设备租约释放）是否交给进程内唯一的写线程串行执行，
+# 避免大量设备线程在SQLite写锁上反复等待；sqlite-wal方案默认开启
+DATABASE_SERIALIZE_WRITES = DATABASE_PROFILE == 'sqlite-wal'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -124,3 +132,139 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Task execution
+# 本机同时执行的设备总数上限（所有任务共享）
+TASK_MAX_CONCURRENT_DEVICES = 8
+
+# 单个任务同时执行的设备数上限
+TASK_MAX_DEVICES_PER_TASK = 4
+
+# worker队列为空时的轮询间隔（秒）
+TASK_WORKER_POLL_INTERVAL = 2
+
+# worker上报任务心跳的间隔（秒）
+TASK_WORKER_HEARTBEAT_INTERVAL = 10
+
+# 任务心跳超过该时间未更新则视为worker已失效，任务重新入队（秒）
+TASK_WORKER_STALE_TIMEOUT = 60
+
+# worker检查失效任务和租约过期的设备作业的间隔（秒）
+TASK_STALE_SWEEP_INTERVAL = 30
+
+# Web进程读取任务进度事件并推送到浏览器的间隔（秒），仅在有浏览器订阅时读取
+TASK_EVENT_RELAY_INTERVAL = 0.5
+
+# 增量任务变化接口的回看时长（秒），覆盖更新时间生成后才提交的写入
+TASK_CHANGES_LOOKBACK = 5
+
+# SSE连接的最长持续时间（秒），到期后结束响应由浏览器自动重连（任务事件按Last-Event-ID补发）
+SSE_STREAM_TIMEOUT = 300
+
+# 执行器批量写入任务进度和事件的间隔（秒），设备或任务结束的事件立即写入；0表示每次都立即写入
+TASK_PROGRESS_FLUSH_INTERVAL = 1.0
+
+
+# Device registry
+# 设备注册表后台刷新间隔（秒），页面和任务提交读取的设备快照最多滞后该时间；
+# 设备跟踪器连接正常时Android设备实时更新，该间隔只用于检测iOS设备
+DEVICE_REGISTRY_TTL = 15
+
+# 负责检测本机设备（后台刷新和adb track-devices）的进程角色：web（Web服务）或 worker（run_worker），
+# 其他进程只读取数据库中的设备快照；Web服务以多进程部署时应设置为worker并只运行一个worker进程
+DEVICE_REGISTRY_REFRESH_ROLE = os.environ.get('DEVICE_REGISTRY_REFRESH_ROLE', 'web')
+
+# 设备检测时同时探测的设备数上限
+DEVICE_PROBE_MAX_WORKERS = 16
+
+# 是否保持 adb track-devices 长连接，设备插拔时立即更新注册表并推送到浏览器
+DEVICE_TRACKER_ENABLED = True
+
+
+# APK cache
+# 按内容哈希缓存上传的APK，总大小超过配额时按最近使用时间淘汰
+APK_CACHE_DIR = os.path.join('uploads', 'apk_cache')
+APK_CACHE_MAX_BYTES = 5 * 1024 * 1024 * 1024
+
+# 本机同时安装APK的设备数上限（受USB Hub带宽限制）
+APK_INSTALL_FANOUT = 4
+
+# 安装方式：install（adb install）、streamed（流式安装）、push（推送一次后pm install，可复用已推送的文件）
+APK_INSTALL_MODE = 'streamed'
+
+# 单台设备安装超时（秒）
+APK_INSTALL_TIMEOUT = 60
+
+# Script cache
+# ZIP测试项目按内容哈希解压一次供所有设备共享，总大小超过配额时按最近使用时间淘汰
+SCRIPT_CACHE_DIR = os.path.join('uploads', 'script_cache')
+SCRIPT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Airtest日志根目录，每次执行写入其下的 task_<任务ID>/<设备ID>/ 子目录
+AIRTEST_LOG_ROOT = os.path.join('logs', 'airtest')
+
+# 脚本输出写入每次执行日志目录下的output.log，超过大小后滚动，保留的备份数
+SCRIPT_OUTPUT_MAX_BYTES = 5 * 1024 * 1024
+SCRIPT_OUTPUT_BACKUP_COUNT = 2
+
+# 执行中检查Airtest日志、上报脚本步骤的间隔（秒）
+SCRIPT_STEP_POLL_INTERVAL = 1.0
+
+# Data retention（manage.py apply_retention）
+# 结束超过指定天数的任务归档到TASK_ARCHIVE_DIR下的压缩文件，任务表中只保留摘要（TaskArchive）
+TASK_RETENTION_DAYS = 30
+TASK_ARCHIVE_DIR = os.path.join('archive', 'tasks')
+# 已结束任务的进度事件保留时长（小时）
+TASK_EVENT_RETENTION_HOURS = 24
+# 执行日志中截图和整个日志目录的保留天数，以及日志目录的总大小配额
+AIRTEST_SCREENSHOT_RETENTION_DAYS = 7
+AIRTEST_LOG_RETENTION_DAYS = 30
+AIRTEST_LOG_MAX_BYTES = 10 * 1024 * 1024 * 1024
+
+# 设备执行引擎：thread（每台设备占用一个工作线程）或 asyncio（所有设备共用一个事件循环，适合大量设备）
+TASK_EXECUTION_ENGINE = 'thread'
+
+# asyncio引擎本机同时执行的设备会话数上限
+TASK_ASYNC_MAX_SESSIONS = 256
+
+# 各阶段超时（秒）：install为检查版本+等待安装名额+安装，run为执行脚本
+TASK_STAGE_TIMEOUTS = {
+    'install': 180,
+    'run': 300,
+}
+
+# worker检查任务取消请求的间隔（秒）
+TASK_CANCEL_POLL_INTERVAL = 1
+
+# Device scheduling
+# 设备租约心跳超过该时间未更新则视为失效，设备可被其他任务使用（秒）
+DEVICE_LEASE_TIMEOUT = 120
+
+# worker每次领取任务时最多检查的等待中任务数（设备被占用的任务跳过，留在队列中）
+TASK_SCHEDULER_SCAN_LIMIT = 50
+
+# Device agents
+# 本机adb server地址，Airtest通过该地址连接设备（设备代理可用--adb-port指定独立的adb server）
+ADB_SERVER_HOST = '127.0.0.1'
+ADB_SERVER_PORT = 5037
+
+# 设备代理超过该时间未上报则不再向其设备分配任务（秒）
+DEVICE_HOST_TIMEOUT = 60
+
+# 设备代理下载任务文件使用的中心服务器地址（也可通过run_agent --server指定）
+AGENT_SERVER_URL = ''
+
+# 设备代理下载单个任务文件的超时（秒）
+AGENT_DOWNLOAD_TIMEOUT = 300
+
+# 设备代理下载任务文件时携带的共享令牌（请求头X-Agent-Token），中心服务器和代理需配置相同的值；
+# 为空时中心服务器不提供任务文件下载
+AGENT_TOKEN = os.environ.get('AGENT_TOKEN', '')
+
+# Toolchain
+# 工具的绝对路径，未配置的工具从PATH中查找，如 {'adb': '/opt/platform-tools/adb'}
+TOOLCHAIN_PATHS = {}
+
+# worker和设备代理启动时必须可用的工具
+TOOLCHAIN_REQUIRED = ['adb', 'airtest']
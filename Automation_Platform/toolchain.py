@@ -0,0 +1,125 @@
+"""
+工具链模块
+一次性解析adb、airtest、idevice_id、ideviceinfo的绝对路径并检查版本，结果缓存在进程内，
+执行命令时直接使用缓存的路径，不再在每次运行前调用which/where；
+TOOLCHAIN_PATHS配置或PATH环境变量变化时自动重新解析，工具缺失时立即抛出带明确提示的异常
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+import logging
+from importlib import metadata
+from typing import Any, Dict, List
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 工具名称 -> (查看版本的参数, 用途)；airtest的版本从已安装的Python包读取
+TOOLS = {
+    'adb': (['version'], 'Android设备检测、安装和执行'),
+    'airtest': (None, '执行测试脚本'),
+    'idevice_id': (['--version'], 'iOS设备检测'),
+    'ideviceinfo': (['--version'], 'iOS设备信息读取'),
+}
+
+# 检查版本的超时（秒）
+VERSION_TIMEOUT = 10
+
+
+class ToolNotFoundError(FileNotFoundError):
+    """工具不可用（继承FileNotFoundError，调用方原有的命令不存在处理仍然有效）"""
+
+    def __init__(self, tool: str, error: str = ''):
+        self.tool = tool
+        message = f"{tool}未安装或不在PATH中，可在TOOLCHAIN_PATHS中配置绝对路径"
+        if error:
+            message = f"{message}（{error}）"
+        super().__init__(message)
+
+
+class Toolchain:
+    """工具链注册表类"""
+
+    def __init__(self):
+        self._tools: Dict[str, Dict[str, Any]] = {}
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def probe(self, force: bool = False) -> Dict[str, Dict[str, Any]]:
+        """解析并检查所有工具；配置未变化时直接返回缓存结果"""
+        signature = self._current_signature()
+        with self._lock:
+            if force or signature != self._signature:
+                configured = getattr(settings, 'TOOLCHAIN_PATHS', {})
+                self._tools = {name: self._probe_tool(name, configured.get(name)) for name in TOOLS}
+                self._signature = signature
+                missing = [name for name, info in self._tools.items() if not info['available']]
+                if missing:
+                    logger.warning(f"以下工具不可用: {', '.join(missing)}")
+            return {name: dict(info) for name, info in self._tools.items()}
+
+    def get_path(self, tool: str) -> str:
+        """获取工具的绝对路径，工具不可用时抛出ToolNotFoundError"""
+        info = self.probe()[tool]
+        if not info['available']:
+            raise ToolNotFoundError(tool, info['error'])
+        return info['path']
+
+    @staticmethod
+    def _current_signature():
+        configured = getattr(settings, 'TOOLCHAIN_PATHS', {})
+        return tuple(sorted(configured.items())), os.environ.get('PATH', '')
+
+    @staticmethod
+    def _probe_tool(tool: str, configured: str = None) -> Dict[str, Any]:
+        version_args, purpose = TOOLS[tool]
+        info = {'path': None, 'version': '', 'available': False, 'purpose': purpose, 'error': ''}
+
+        path = shutil.which(configured or tool)
+        if path is None:
+            info['error'] = f"未找到 {configured or tool}"
+            return info
+        info['path'] = os.path.abspath(path)
+
+        try:
+            if version_args is None:
+                info['version'] = metadata.version(tool)
+            else:
+                result = subprocess.run([info['path']] + version_args, capture_output=True, text=True,
+                                        timeout=VERSION_TIMEOUT, encoding='utf-8', errors='ignore')
+                lines = [line.strip() for line in (result.stdout or result.stderr).splitlines() if line.strip()]
+                info['version'] = lines[0] if lines else ''
+        except metadata.PackageNotFoundError:
+            # 命令存在但不是当前Python环境中安装的
+            pass
+        except (OSError, subprocess.TimeoutExpired) as e:
+            info['error'] = f"无法执行 {info['path']}: {e}"
+            return info
+
+        info['available'] = True
+        return info
+
+
+_toolchain = Toolchain()
+
+
+def get_toolchain() -> Toolchain:
+    return _toolchain
+
+
+def tool_path(tool: str) -> str:
+    """获取工具的绝对路径（便捷函数），工具不可用时抛出ToolNotFoundError"""
+    return _toolchain.get_path(tool)
+
+
+def probe_toolchain(force: bool = False) -> Dict[str, Dict[str, Any]]:
+    """解析并检查所有工具（便捷函数）"""
+    return _toolchain.probe(force=force)
+
+
+def get_required_tools() -> List[str]:
+    """本机执行任务必须可用的工具"""
+    return list(getattr(settings, 'TOOLCHAIN_REQUIRED', ['adb', 'airtest']))
@@ -16,10 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from .views import home
+from .views import home, health
 
 urlpatterns = [
     path('', home, name='home'),
+    path('health/', health, name='health'),  # 工具链健康检查
     path('cases/', include('cases.urls')),
     path('tasks/', include('tasks.urls')),
     path('admin/', admin.site.urls),
@@ -1,4 +1,24 @@
 from django.shortcuts import render
+from django.http import JsonResponse
+from .toolchain import probe_toolchain, get_required_tools
 
 def home(request):
-    return render(request, 'home.html', {'nav': 'home'})
\ No newline at end of file
+    return render(request, 'home.html', {'nav': 'home'})
+
+def health(request):
+    """
+    健康检查API：返回本进程解析的工具路径和版本
+
+    查询参数：
+        refresh  为1时重新解析工具链
+    必需的工具（TOOLCHAIN_REQUIRED）不可用时返回503
+    """
+    tools = probe_toolchain(force=request.GET.get('refresh') == '1')
+    required = get_required_tools()
+    missing = [name for name in required if not tools.get(name, {}).get('available')]
+    return JsonResponse({
+        'success': not missing,
+        'message': f"以下工具不可用: {', '.join(missing)}" if missing else '',
+        'required': required,
+        'tools': tools,
+    }, status=503 if missing else 200)
@@ -6,46 +6,100 @@
 import subprocess
 import re
 import json
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable
 import logging
 
+from Automation_Platform.toolchain import ToolNotFoundError, tool_path
+
 logger = logging.getLogger(__name__)
 
+# getprop 输出格式: [ro.product.model]: [Pixel 6]
+GETPROP_LINE_RE = re.compile(r'^\[(?P<key>[^\]]+)\]: \[(?P<value>.*)\]$')
+
+ANDROID_PROP_KEYS = {
+    'model': 'ro.product.model',
+    'version': 'ro.build.version.release',
+    'manufacturer': 'ro.product.manufacturer',
+}
+
+IOS_INFO_KEYS = {
+    'name': 'DeviceName',
+    'version': 'ProductVersion',
+    'model': 'ProductType',
+}
+
 
 class DeviceDetector:
     """设备检测器类"""
 
-    def __init__(self):
+    def __init__(self, batch_probe: bool = True, max_workers: int = 16):
+        """
+        batch_probe: 每台设备只调用一次getprop/ideviceinfo读取全部属性后解析，
+                     为False时按属性逐个调用（兼容旧行为）
+        max_workers: 同时探测的设备数上限
+        """
         self.connected_devices = []
+        self.batch_probe = batch_probe
+        self.max_workers = max_workers
+
+    def _probe_all(self, device_ids: List[str], probe: Callable[[str], Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """并发探测多台设备，返回顺序与device_ids一致"""
+        if len(device_ids) <= 1:
+            return [probe(device_id) for device_id in device_ids]
+        with ThreadPoolExecutor(max_workers=min(len(device_ids), self.max_workers)) as pool:
+            return list(pool.map(probe, device_ids))
+
+    def probe_android_devices(self, device_ids: List[str]) -> List[Dict[str, Any]]:
+        """并发读取指定Android设备的详细信息（设备跟踪器探测新接入的设备时调用）"""
+        return self._probe_all(device_ids, self._get_android_device_info)
 
     def detect_android_devices(self) -> List[Dict[str, Any]]:
         """检测Android设备"""
         devices = []
         try:
             # 使用adb devices命令检测Android设备，修复编码问题
-            result = subprocess.run(['adb', 'devices'],
+            result = subprocess.run([tool_path('adb'), 'devices'],
                                   capture_output=True, text=True, timeout=10,
                                   encoding='utf-8', errors='ignore')
 
             if result.returncode == 0:
+                device_ids = []
                 lines = result.stdout.strip().split('\n')[1:]  # 跳过第一行标题
                 for line in lines:
                     if line.strip() and '\t' in line:
                         device_id, status = line.strip().split('\t')
                         if status == 'device':
-                            device_info = self._get_android_device_info(device_id)
-                            devices.append(device_info)
+                            device_ids.append(device_id)
+                devices = self.probe_android_devices(device_ids)
+        except ToolNotFoundError:
+            # 工具链解析时已记录警告，本机未安装adb时不再逐次告警
+            pass
         except (subprocess.TimeoutExpired, FileNotFoundError, Exception) as e:
             logger.warning(f"Android设备检测失败: {e}")
 
         return devices
 
+    def _read_android_props(self, device_id: str) -> Dict[str, str]:
+        """一次adb调用读取设备全部系统属性"""
+        result = subprocess.run(
+            [tool_path('adb'), '-s', device_id, 'shell', 'getprop'],
+            capture_output=True, text=True, timeout=10,
+            encoding='utf-8', errors='ignore'
+        )
+        if result.returncode != 0:
+            return {}
+        return parse_getprop_output(result.stdout)
+
     def _get_android_device_info(self, device_id: str) -> Dict[str, Any]:
         """获取Android设备详细信息"""
+        if self.batch_probe:
+            return self._get_android_device_info_batch(device_id)
+
         try:
             # 获取设备型号
             model_result = subprocess.run(
-                ['adb', '-s', device_id, 'shell', 'getprop', 'ro.product.model'],
+                [tool_path('adb'), '-s', device_id, 'shell', 'getprop', 'ro.product.model'],
                 capture_output=True, text=True, timeout=5,
                 encoding='utf-8', errors='ignore'
             )
@@ -53,7 +107,7 @@ class DeviceDetector:
 
             # 获取Android版本
             version_result = subprocess.run(
-                ['adb', '-s', device_id, 'shell', 'getprop', 'ro.build.version.release'],
+                [tool_path('adb'), '-s', device_id, 'shell', 'getprop', 'ro.build.version.release'],
                 capture_output=True, text=True, timeout=5,
                 encoding='utf-8', errors='ignore'
             )
@@ -61,7 +115,7 @@ class DeviceDetector:
 
             # 获取设备制造商
             manufacturer_result = subprocess.run(
-                ['adb', '-s', device_id, 'shell', 'getprop', 'ro.product.manufacturer'],
+                [tool_path('adb'), '-s', device_id, 'shell', 'getprop', 'ro.product.manufacturer'],
                 capture_output=True, text=True, timeout=5,
                 encoding='utf-8', errors='ignore'
             )
@@ -92,32 +146,73 @@ class DeviceDetector:
                 "type": "android"
             }
 
+    def _get_android_device_info_batch(self, device_id: str) -> Dict[str, Any]:
+        """获取Android设备详细信息（单次getprop调用）"""
+        try:
+            props = self._read_android_props(device_id)
+            model = props.get(ANDROID_PROP_KEYS['model']) or "Unknown"
+            version = props.get(ANDROID_PROP_KEYS['version']) or "Unknown"
+            manufacturer = props.get(ANDROID_PROP_KEYS['manufacturer']) or "Unknown"
+
+            return {
+                "name": f"{manufacturer} {model}",
+                "device_id": device_id,
+                "os": f"Android {version}",
+                "status": "在线",
+                "conn": "WiFi" if ':' in device_id else "USB",
+                "type": "android"
+            }
+        except Exception as e:
+            logger.warning(f"获取Android设备信息失败 {device_id}: {e}")
+            return {
+                "name": f"Android Device ({device_id[:8]}...)",
+                "device_id": device_id,
+                "os": "Android",
+                "status": "在线",
+                "conn": "USB",
+                "type": "android"
+            }
+
     def detect_ios_devices(self) -> List[Dict[str, Any]]:
         """检测iOS设备"""
         devices = []
         try:
             # 使用idevice_id命令检测iOS设备，修复编码问题
-            result = subprocess.run(['idevice_id', '-l'],
+            result = subprocess.run([tool_path('idevice_id'), '-l'],
                                   capture_output=True, text=True, timeout=10,
                                   encoding='utf-8', errors='ignore')
 
             if result.returncode == 0:
-                device_ids = result.stdout.strip().split('\n')
-                for device_id in device_ids:
-                    if device_id.strip():
-                        device_info = self._get_ios_device_info(device_id.strip())
-                        devices.append(device_info)
+                device_ids = [d.strip() for d in result.stdout.strip().split('\n') if d.strip()]
+                devices = self._probe_all(device_ids, self._get_ios_device_info)
+        except ToolNotFoundError:
+            # 本机未安装libimobiledevice时不检测iOS设备
+            pass
         except (subprocess.TimeoutExpired, FileNotFoundError, Exception) as e:
             logger.warning(f"iOS设备检测失败: {e}")
 
         return devices
 
+    def _read_ios_info(self, device_id: str) -> Dict[str, str]:
+        """一次ideviceinfo调用读取设备全部信息"""
+        result = subprocess.run(
+            [tool_path('ideviceinfo'), '-u', device_id],
+            capture_output=True, text=True, timeout=10,
+            encoding='utf-8', errors='ignore'
+        )
+        if result.returncode != 0:
+            return {}
+        return parse_ideviceinfo_output(result.stdout)
+
     def _get_ios_device_info(self, device_id: str) -> Dict[str, Any]:
         """获取iOS设备详细信息"""
+        if self.batch_probe:
+            return self._get_ios_device_info_batch(device_id)
+
         try:
             # 获取设备名称
             name_result = subprocess.run(
-                ['ideviceinfo', '-u', device_id, '-k', 'DeviceName'],
+                [tool_path('ideviceinfo'), '-u', device_id, '-k', 'DeviceName'],
                 capture_output=True, text=True, timeout=5,
                 encoding='utf-8', errors='ignore'
             )
@@ -125,7 +220,7 @@ class DeviceDetector:
 
             # 获取iOS版本
             version_result = subprocess.run(
-                ['ideviceinfo', '-u', device_id, '-k', 'ProductVersion'],
+                [tool_path('ideviceinfo'), '-u', device_id, '-k', 'ProductVersion'],
                 capture_output=True, text=True, timeout=5,
                 encoding='utf-8', errors='ignore'
             )
@@ -133,7 +228,7 @@ class DeviceDetector:
 
             # 获取设备型号
             model_result = subprocess.run(
-                ['ideviceinfo', '-u', device_id, '-k', 'ProductType'],
+                [tool_path('ideviceinfo'), '-u', device_id, '-k', 'ProductType'],
                 capture_output=True, text=True, timeout=5,
                 encoding='utf-8', errors='ignore'
             )
@@ -158,17 +253,43 @@ class DeviceDetector:
                 "type": "ios"
             }
 
+    def _get_ios_device_info_batch(self, device_id: str) -> Dict[str, Any]:
+        """获取iOS设备详细信息（单次ideviceinfo调用）"""
+        try:
+            info = self._read_ios_info(device_id)
+            name = info.get(IOS_INFO_KEYS['name']) or "Unknown"
+            version = info.get(IOS_INFO_KEYS['version']) or "Unknown"
+            model = info.get(IOS_INFO_KEYS['model']) or "Unknown"
+
+            return {
+                "name": name if name != "Unknown" else f"iOS Device ({model})",
+                "device_id": device_id,
+                "os": f"iOS {version}",
+                "status": "在线",
+                "conn": "USB",
+                "type": "ios"
+            }
+        except Exception as e:
+            logger.warning(f"获取iOS设备信息失败 {device_id}: {e}")
+            return {
+                "name": f"iOS Device ({device_id[:8]}...)",
+                "device_id": device_id,
+                "os": "iOS",
+                "status": "在线",
+                "conn": "USB",
+                "type": "ios"
+            }
+
     def detect_all_devices(self) -> List[Dict[str, Any]]:
         """检测所有连接的设备"""
         devices = []
 
-        # 检测Android设备
-        android_devices = self.detect_android_devices()
-        devices.extend(android_devices)
-
-        # 检测iOS设备
-        ios_devices = self.detect_ios_devices()
-        devices.extend(ios_devices)
+        # Android和iOS设备同时检测
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            android_future = pool.submit(self.detect_android_devices)
+            ios_future = pool.submit(self.detect_ios_devices)
+            devices.extend(android_future.result())
+            devices.extend(ios_future.result())
 
         self.connected_devices = devices
         return devices
@@ -185,6 +306,27 @@ class DeviceDetector:
         return stats
 
 
+def parse_getprop_output(output: str) -> Dict[str, str]:
+    """解析 adb shell getprop 的完整输出"""
+    props = {}
+    for line in output.splitlines():
+        match = GETPROP_LINE_RE.match(line.strip())
+        if match:
+            props[match.group('key')] = match.group('value').strip()
+    return props
+
+
+def parse_ideviceinfo_output(output: str) -> Dict[str, str]:
+    """解析 ideviceinfo 的完整输出（顶层 Key: Value 行）"""
+    info = {}
+    for line in output.splitlines():
+        if not line or line[0].isspace() or ': ' not in line:
+            continue
+        key, value = line.split(': ', 1)
+        info[key.strip()] = value.strip()
+    return info
+
+
 def get_connected_devices() -> List[Dict[str, Any]]:
     """获取已连接的设备列表（便捷函数）"""
     detector = DeviceDetector()
@@ -0,0 +1,232 @@
+"""
+设备注册表模块
+在后台按TTL刷新设备列表，并维护内存快照和数据库快照，
+页面和任务提交直接读取快照，不再在请求中调用adb/idevice命令；
+设备跟踪器连接正常时Android设备由其增量更新，TTL刷新只检测iOS设备，跟踪器断开时才全量刷新Android设备
+"""
+
+import threading
+import time
+import logging
+from typing import List, Dict, Any, Optional
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from Automation_Platform.events import broker
+from .device_detector import DeviceDetector
+from .models import Device
+
+logger = logging.getLogger(__name__)
+
+# 设备快照变化时发布事件的主题
+DEVICES_TOPIC = 'devices'
+
+
+class DeviceRegistry:
+    """设备注册表类"""
+
+    def __init__(self, ttl: float, refresh_enabled: bool = True):
+        """refresh_enabled为False时不检测设备，只读取其他进程写入的数据库快照"""
+        self.ttl = ttl
+        self.refresh_enabled = refresh_enabled
+        self._devices: Optional[List[Dict[str, Any]]] = None
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+        # 设备跟踪器（未启用时为None）
+        self.tracker = None
+
+    def start(self):
+        """启动后台刷新线程（重复调用无副作用）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._refresh_loop, name='device-registry', daemon=True)
+            self._thread.start()
+
+    def get_devices(self, online_only: bool = False) -> List[Dict[str, Any]]:
+        """获取设备快照"""
+        if not self.refresh_enabled:
+            devices = self._load_snapshot()
+            if online_only:
+                devices = [d for d in devices if d["status"] == "在线"]
+            return devices
+
+        with self._lock:
+            devices = self._devices
+
+        if devices is None:
+            # 进程刚启动时先使用数据库快照，数据库中也没有时才同步检测一次
+            devices = self._load_snapshot()
+            if not devices:
+                devices = self.refresh()
+            else:
+                with self._lock:
+                    if self._devices is None:
+                        self._devices = devices
+
+        if online_only:
+            devices = [d for d in devices if d["status"] == "在线"]
+        return [dict(d) for d in devices]
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取设备统计信息"""
+        return DeviceDetector().get_device_stats(self.get_devices())
+
+    def refresh(self, platforms: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """立即检测设备并更新内存快照和数据库快照，platforms为None时检测所有平台"""
+        with self._refresh_lock:
+            detector = DeviceDetector(max_workers=getattr(settings, 'DEVICE_PROBE_MAX_WORKERS', 16))
+            if platforms is None:
+                detected = detector.detect_all_devices()
+            else:
+                detected = []
+                if 'android' in platforms:
+                    detected.extend(detector.detect_android_devices())
+                if 'ios' in platforms:
+                    detected.extend(detector.detect_ios_devices())
+            save_host_devices(detected, host='', platforms=platforms)
+            devices = self._load_snapshot()
+            self._set_snapshot(devices)
+            return devices
+
+    def apply_changes(self, online: List[Dict[str, Any]], offline_ids: List[str]) -> List[Dict[str, Any]]:
+        """增量更新快照（由设备跟踪器在设备插拔时调用）"""
+        with self._refresh_lock:
+            with transaction.atomic():
+                self._upsert(online, timezone.now())
+                if offline_ids:
+                    Device.objects.filter(device_id__in=offline_ids, host='').update(status="离线")
+            devices = self._load_snapshot()
+            self._set_snapshot(devices)
+            return devices
+
+    def _set_snapshot(self, devices: List[Dict[str, Any]]):
+        """更新内存快照，内容有变化时发布设备事件"""
+        with self._lock:
+            changed = devices != self._devices
+            self._devices = devices
+            self._refreshed_at = time.monotonic()
+
+        if changed:
+            broker.publish(DEVICES_TOPIC, self.build_event(devices))
+
+    def build_event(self, devices: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """构建推送给浏览器的设备事件"""
+        if devices is None:
+            devices = self.get_devices()
+        return {
+            "type": "devices",
+            "devices": devices,
+            "stats": DeviceDetector().get_device_stats(devices),
+        }
+
+    @property
+    def age(self) -> float:
+        """快照已存在的时间（秒）"""
+        return time.monotonic() - self._refreshed_at
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                if self.tracker is not None and self.tracker.is_tracking:
+                    # adb track-devices 连接正常，Android设备已实时更新
+                    self.refresh(platforms=['ios'])
+                else:
+                    self.refresh()
+            except Exception as e:
+                logger.warning(f"设备注册表刷新失败: {e}")
+            finally:
+                connections.close_all()
+            time.sleep(self.ttl)
+
+    def _load_snapshot(self) -> List[Dict[str, Any]]:
+        return [device.to_dict() for device in Device.objects.all()]
+
+    @staticmethod
+    def _upsert(devices: List[Dict[str, Any]], now, host: str = ''):
+        if not host:
+            # 同时连接在本机和设备代理主机上的设备归设备代理所有，本机刷新不改写其所在主机
+            owned = set(Device.objects.filter(device_id__in=[d["device_id"] for d in devices])
+                        .exclude(host='').values_list('device_id', flat=True))
+            devices = [d for d in devices if d["device_id"] not in owned]
+        for d in devices:
+            Device.objects.update_or_create(
+                device_id=d["device_id"],
+                defaults={
+                    "name": d["name"],
+                    "os": d["os"],
+                    "platform": d["type"],
+                    "conn": d["conn"],
+                    "status": d["status"],
+                    "last_seen": now,
+                    "host": host,
+                }
+            )
+
+
+def save_host_devices(detected: List[Dict[str, Any]], host: str = '',
+                      platforms: Optional[List[str]] = None) -> int:
+    """
+    保存某台主机检测到的设备（本机为空字符串，远程主机由设备代理上报），
+    该主机本次未检测到的设备标记为离线（platforms不为None时只处理这些平台），返回检测到的设备数
+    """
+    now = timezone.now()
+    detected_ids = [d["device_id"] for d in detected]
+
+    missing = Device.objects.filter(host=host).exclude(device_id__in=detected_ids)
+    if platforms is not None:
+        missing = missing.filter(platform__in=platforms)
+    with transaction.atomic():
+        DeviceRegistry._upsert(detected, now, host)
+        missing.update(status="离线")
+    return len(detected_ids)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+# 当前进程的角色：web（默认）或 worker，由run_worker/run_agent命令启动时设置
+_process_role = 'web'
+
+
+def set_process_role(role: str):
+    """设置当前进程的角色，角色为DEVICE_REGISTRY_REFRESH_ROLE时立即启动设备注册表的后台刷新"""
+    global _process_role
+    _process_role = role
+    if is_refresh_owner():
+        get_registry()
+
+
+def is_refresh_owner() -> bool:
+    """当前进程是否负责检测本机设备（每台主机只应有一类进程检测，避免重复执行adb命令）"""
+    return _process_role == getattr(settings, 'DEVICE_REGISTRY_REFRESH_ROLE', 'web')
+
+
+def get_registry() -> DeviceRegistry:
+    """获取进程内共享的设备注册表，负责检测设备的进程首次调用时启动后台刷新"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            refresh_enabled = is_refresh_owner()
+            _registry = DeviceRegistry(getattr(settings, 'DEVICE_REGISTRY_TTL', 15), refresh_enabled)
+            if not refresh_enabled:
+                return _registry
+            _registry.start()
+            if getattr(settings, 'DEVICE_TRACKER_ENABLED', True):
+                from .device_tracker import start_tracker
+                _registry.tracker = start_tracker(_registry)
+        return _registry
+
+
+def get_cached_devices(online_only: bool = False) -> List[Dict[str, Any]]:
+    """获取设备快照（便捷函数）"""
+    return get_registry().get_devices(online_only=online_only)
+
+
+def get_cached_device_stats() -> Dict[str, int]:
+    """获取设备快照统计信息（便捷函数）"""
+    return get_registry().get_stats()
@@ -0,0 +1,136 @@
+"""
+设备跟踪模块
+保持一个 adb track-devices 长连接，设备插拔时立即增量更新设备注册表，
+注册表再通过事件代理推送到浏览器
+"""
+
+import subprocess
+import threading
+import time
+import logging
+from typing import Dict, IO, Optional
+
+from django.db import connections
+
+from Automation_Platform.toolchain import tool_path
+from .device_detector import DeviceDetector
+
+logger = logging.getLogger(__name__)
+
+
+def parse_track_devices_payload(payload: str) -> Dict[str, str]:
+    """解析一次 track-devices 推送的内容，返回 {设备ID: 状态}"""
+    devices = {}
+    for line in payload.splitlines():
+        if '\t' in line:
+            device_id, state = line.strip().split('\t', 1)
+            devices[device_id] = state
+    return devices
+
+
+def read_track_devices_message(stream: IO[bytes]) -> Optional[str]:
+    """
+    读取一条 track-devices 消息
+
+    每条消息以4位十六进制长度开头，后跟"设备ID\\t状态\\n"列表；
+    连接断开时返回None
+    """
+    header = stream.read(4)
+    if len(header) < 4:
+        return None
+    length = int(header.decode('ascii'), 16)
+    payload = stream.read(length) if length else b''
+    if len(payload) < length:
+        return None
+    return payload.decode('utf-8', errors='ignore')
+
+
+class DeviceTracker:
+    """Android设备跟踪器类"""
+
+    def __init__(self, registry, retry_interval: float = 5):
+        self.registry = registry
+        self.retry_interval = retry_interval
+        self.detector = DeviceDetector()
+        self.online_ids = set()
+        self._process = None
+        self._stopped = threading.Event()
+        # 已连接adb server并处理过第一条推送，此期间Android设备无需按TTL全量刷新
+        self._tracking = threading.Event()
+        self._thread = None
+
+    @property
+    def is_tracking(self) -> bool:
+        return self._tracking.is_set()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='device-tracker', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._process is not None:
+            self._process.kill()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._track()
+            except FileNotFoundError:
+                logger.warning("未找到adb命令，设备跟踪器停止，设备列表按TTL全量刷新")
+                return
+            except Exception as e:
+                logger.warning(f"设备跟踪连接异常: {e}")
+            finally:
+                connections.close_all()
+
+            # adb server 重启或连接断开后稍后重连
+            self._stopped.wait(self.retry_interval)
+
+    def _track(self):
+        self._process = subprocess.Popen([tool_path('adb'), 'track-devices'],
+                                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            while not self._stopped.is_set():
+                payload = read_track_devices_message(self._process.stdout)
+                if payload is None:
+                    break
+                self.handle_snapshot(parse_track_devices_payload(payload))
+                self._tracking.set()
+        finally:
+            self._tracking.clear()
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+    def handle_snapshot(self, states: Dict[str, str]):
+        """对比上一次的在线设备，只探测新接入的设备"""
+        online_ids = {device_id for device_id, state in states.items() if state == 'device'}
+        added = online_ids - self.online_ids
+        removed = self.online_ids - online_ids
+        self.online_ids = online_ids
+
+        if not added and not removed:
+            return
+
+        start = time.monotonic()
+        online = self.detector.probe_android_devices(sorted(added))
+        self.registry.apply_changes(online, sorted(removed))
+        logger.info(f"设备变化: 接入{sorted(added)} 断开{sorted(removed)}，"
+                    f"耗时{time.monotonic() - start:.2f}秒")
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def start_tracker(registry) -> DeviceTracker:
+    """启动进程内共享的设备跟踪器（便捷函数）"""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = DeviceTracker(registry)
+            _tracker.start()
+        return _tracker
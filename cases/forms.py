@@ -1,4 +1,5 @@
 from django import forms
+from tasks.apk_cache import get_build
 from .models import TestCase
 
 class TestCaseUploadForm(forms.ModelForm):
@@ -150,24 +151,41 @@ class RunTestCaseForm(forms.Form):
 
     app_file = forms.FileField(
         label="选择应用文件",
+        required=False,
         widget=forms.FileInput(attrs={
             'class': 'form-control',
             'accept': '.apk,.ipa',
-            'required': True
         }),
         help_text="支持 APK 文件 (.apk) 或 IPA 文件 (.ipa)"
     )
 
+    apk_hash = forms.CharField(
+        label="已缓存的安装包",
+        required=False,
+        max_length=64,
+        help_text="填写已缓存安装包的SHA256，可代替重新上传"
+    )
+
     devices = forms.MultipleChoiceField(
         label="选择测试设备",
         widget=forms.CheckboxSelectMultiple(attrs={
             'class': 'form-check-input',
-            'required': True
         }),
-        required=True,
-        error_messages={
-            'required': '请至少选择一个测试设备'
-        }
+        required=False
+    )
+
+    device_count = forms.IntegerField(
+        label="自动分配设备数",
+        required=False,
+        min_value=1,
+        help_text="不选择设备时，由调度器从空闲的在线设备中自动分配"
+    )
+
+    device_os = forms.CharField(
+        label="系统版本",
+        required=False,
+        max_length=100,
+        help_text="自动分配时只使用该系统版本的设备，如 Android 12"
     )
 
     def __init__(self, *args, **kwargs):
@@ -180,7 +198,7 @@ class RunTestCaseForm(forms.Form):
         file = self.cleaned_data.get('app_file')
 
         if not file:
-            raise forms.ValidationError("请选择应用文件")
+            return file
 
         # 检查文件类型
         allowed_extensions = ['.apk', '.ipa']
@@ -196,5 +214,22 @@ class RunTestCaseForm(forms.Form):
 
         return file
 
+    def clean_apk_hash(self):
+        """验证已缓存安装包的哈希"""
+        apk_hash = (self.cleaned_data.get('apk_hash') or '').strip().lower()
+        if apk_hash and not get_build(apk_hash):
+            raise forms.ValidationError("所选安装包不存在或已被清理，请重新上传")
+        return apk_hash
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('app_file') and not cleaned_data.get('apk_hash') \
+                and 'app_file' not in self.errors and 'apk_hash' not in self.errors:
+            raise forms.ValidationError("请选择应用文件")
+        if not cleaned_data.get('devices') and not cleaned_data.get('device_count') \
+                and 'device_count' not in self.errors:
+            raise forms.ValidationError("请至少选择一个测试设备或填写自动分配的设备数")
+        return cleaned_data
+
 
 import os
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Device',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=100, unique=True, verbose_name='设备ID')),
+                ('name', models.CharField(max_length=255, verbose_name='设备名称')),
+                ('os', models.CharField(max_length=100, verbose_name='系统版本')),
+                ('platform', models.CharField(choices=[('android', 'Android'), ('ios', 'iOS')], max_length=10, verbose_name='平台')),
+                ('conn', models.CharField(max_length=20, verbose_name='连接方式')),
+                ('status', models.CharField(default='在线', max_length=20, verbose_name='状态')),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now, verbose_name='最后在线时间')),
+            ],
+            options={
+                'verbose_name': '设备',
+                'verbose_name_plural': '设备',
+                'ordering': ['platform', 'device_id'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0002_device'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testcase',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='内容哈希'),
+        ),
+        migrations.AddField(
+            model_name='testcase',
+            name='entry_script',
+            field=models.CharField(blank=True, default='', max_length=500, verbose_name='入口脚本'),
+        ),
+    ]
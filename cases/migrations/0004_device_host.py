@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0003_script_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='host',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255, verbose_name='所在主机'),
+        ),
+    ]
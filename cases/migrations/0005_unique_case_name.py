@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:31
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rename_duplicate_names(apps, schema_editor):
+    """添加唯一约束前为重名的测试用例加上ID后缀（保留最早上传的名称不变）"""
+    TestCase = apps.get_model('cases', 'TestCase')
+    test_cases = TestCase.objects.using(schema_editor.connection.alias)
+    duplicates = (test_cases.values('name').annotate(n=Count('id')).filter(n__gt=1)
+                  .values_list('name', flat=True))
+    for name in list(duplicates):
+        for test_case in test_cases.filter(name=name).order_by('upload_time', 'id')[1:]:
+            suffix = f" ({test_case.id})"
+            test_case.name = test_case.name[:255 - len(suffix)] + suffix
+            test_case.save(using=schema_editor.connection.alias, update_fields=['name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0004_device_host'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_names, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='testcase',
+            name='name',
+            field=models.CharField(max_length=255, unique=True, verbose_name='脚本名称'),
+        ),
+        migrations.AlterField(
+            model_name='testcase',
+            name='upload_time',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='上传时间'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:33
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0005_unique_case_name'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='testcase',
+            name='upload_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='上传时间'),
+        ),
+        migrations.AddIndex(
+            model_name='testcase',
+            index=models.Index(fields=['upload_time', 'id'], name='case_upload_id_idx'),
+        ),
+    ]
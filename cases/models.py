@@ -15,17 +15,23 @@ class TestCase(models.Model):
         ('processing', '处理中'),
     ]
 
-    name = models.CharField(max_length=255, verbose_name="脚本名称")
+    name = models.CharField(max_length=255, unique=True, verbose_name="脚本名称")
     file_path = models.CharField(max_length=500, verbose_name="文件路径")
     file_type = models.CharField(max_length=10, choices=FILE_TYPE_CHOICES, verbose_name="文件类型")
     file_size = models.IntegerField(verbose_name="文件大小(字节)")
     upload_time = models.DateTimeField(default=timezone.now, verbose_name="上传时间")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing', verbose_name="状态")
+    content_hash = models.CharField(max_length=64, blank=True, default='', verbose_name="内容哈希")
+    entry_script = models.CharField(max_length=500, blank=True, default='', verbose_name="入口脚本")
 
     class Meta:
         verbose_name = "测试用例"
         verbose_name_plural = "测试用例"
         ordering = ['-upload_time']
+        indexes = [
+            # 用例列表按(上传时间, id)游标分页
+            models.Index(fields=['upload_time', 'id'], name='case_upload_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -42,3 +48,41 @@ class TestCase(models.Model):
             return f"{self.file_size / 1024:.1f} KB"
         else:
             return f"{self.file_size / (1024 * 1024):.1f} MB"
+
+
+class Device(models.Model):
+    """设备快照模型（由设备注册表在后台刷新）"""
+
+    PLATFORM_CHOICES = [
+        ('android', 'Android'),
+        ('ios', 'iOS'),
+    ]
+
+    device_id = models.CharField(max_length=100, unique=True, verbose_name="设备ID")
+    name = models.CharField(max_length=255, verbose_name="设备名称")
+    os = models.CharField(max_length=100, verbose_name="系统版本")
+    platform = models.CharField(max_length=10, choices=PLATFORM_CHOICES, verbose_name="平台")
+    conn = models.CharField(max_length=20, verbose_name="连接方式")
+    status = models.CharField(max_length=20, default='在线', verbose_name="状态")
+    last_seen = models.DateTimeField(default=timezone.now, verbose_name="最后在线时间")
+    host = models.CharField(max_length=255, blank=True, default='', db_index=True, verbose_name="所在主机")
+
+    class Meta:
+        verbose_name = "设备"
+        verbose_name_plural = "设备"
+        ordering = ['platform', 'device_id']
+
+    def __str__(self):
+        return f"{self.name} ({self.device_id})"
+
+    def to_dict(self):
+        """转换为设备检测器使用的字典格式"""
+        return {
+            "name": self.name,
+            "device_id": self.device_id,
+            "os": self.os,
+            "status": self.status,
+            "conn": self.conn,
+            "type": self.platform,
+            "host": self.host,
+        }
@@ -0,0 +1,181 @@
+"""
+脚本缓存模块
+ZIP格式的测试项目按内容哈希只解压一次，所有设备共享只读的解压目录；
+入口脚本在解压时确定并保存到TestCase，缓存超出磁盘配额时按最近使用时间淘汰
+"""
+
+import hashlib
+import os
+import shutil
+import stat
+import sys
+import zipfile
+import logging
+from typing import Optional
+
+from django.conf import settings
+
+from tasks.models import Task
+from .models import TestCase
+
+logger = logging.getLogger(__name__)
+
+# 解压目录中记录内容大小的文件，淘汰时无需遍历目录
+SIZE_MARKER = '.cache_size'
+
+
+def get_cache_dir() -> str:
+    cache_dir = getattr(settings, 'SCRIPT_CACHE_DIR', os.path.join('uploads', 'script_cache'))
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def hash_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_entry_script(project_dir: str) -> Optional[str]:
+    """
+    查找项目的入口脚本，返回相对路径
+
+    优先选择Airtest项目约定的 xxx.air/xxx.py，其次是层级最浅的.py文件
+    """
+    candidates = []
+    for root, dirs, files in os.walk(project_dir):
+        dirs[:] = [d for d in dirs if d != '__MACOSX']
+        for file in files:
+            if not file.endswith('.py'):
+                continue
+            rel_path = os.path.relpath(os.path.join(root, file), project_dir)
+            folder = os.path.basename(root)
+            is_air_entry = folder.endswith('.air') and folder[:-4] == file[:-3]
+            candidates.append((not is_air_entry, rel_path.count(os.sep), rel_path))
+
+    if not candidates:
+        return None
+    return sorted(candidates)[0][2]
+
+
+def prepare_test_case(test_case: TestCase) -> str:
+    """
+    确保ZIP测试项目已解压到缓存，返回入口脚本的绝对路径
+
+    首次使用时计算内容哈希并解压，入口脚本保存到TestCase；
+    之后直接返回缓存中的路径
+    """
+    if not test_case.content_hash:
+        test_case.content_hash = hash_file(test_case.file_path)
+
+    project_dir = os.path.join(get_cache_dir(), test_case.content_hash)
+    if not os.path.isdir(project_dir):
+        _extract(test_case.file_path, project_dir)
+
+    if not test_case.entry_script or not os.path.exists(os.path.join(project_dir, test_case.entry_script)):
+        test_case.entry_script = find_entry_script(project_dir) or ''
+
+    TestCase.objects.filter(id=test_case.id).update(content_hash=test_case.content_hash,
+                                                    entry_script=test_case.entry_script)
+
+    if not test_case.entry_script:
+        raise FileNotFoundError('ZIP文件中未找到Python脚本')
+
+    # 更新目录修改时间作为最近使用时间
+    os.utime(project_dir)
+    evict(keep=test_case.content_hash)
+    return os.path.abspath(os.path.join(project_dir, test_case.entry_script))
+
+
+def _extract(zip_path: str, project_dir: str):
+    """解压到临时目录后原子重命名，多个进程同时解压时只保留一份"""
+    temp_dir = f"{project_dir}.tmp-{os.getpid()}"
+    if os.path.exists(temp_dir):
+        _remove_tree(temp_dir)
+
+    size = 0
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        zip_ref.extractall(temp_dir)
+        size = sum(info.file_size for info in zip_ref.infolist())
+
+    with open(os.path.join(temp_dir, SIZE_MARKER), 'w') as f:
+        f.write(str(size))
+
+    # 所有设备共享同一份文件，设为只读防止脚本运行时修改
+    for root, dirs, files in os.walk(temp_dir):
+        for file in files:
+            os.chmod(os.path.join(root, file), stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+
+    try:
+        os.rename(temp_dir, project_dir)
+    except OSError:
+        # 其他进程已完成解压
+        _remove_tree(temp_dir)
+
+
+def _remove_tree(path: str):
+    """删除目录（其中的文件是只读的，Windows上需先去掉只读属性）"""
+    def make_writable(func, target, exc):
+        os.chmod(target, stat.S_IWRITE | stat.S_IREAD)
+        func(target)
+
+    # onerror从Python 3.12起弃用，改用onexc
+    if sys.version_info >= (3, 12):
+        shutil.rmtree(path, onexc=make_writable)
+    else:
+        shutil.rmtree(path, onerror=make_writable)
+
+
+def _cached_size(project_dir: str) -> int:
+    try:
+        with open(os.path.join(project_dir, SIZE_MARKER)) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def evict(max_bytes: Optional[int] = None, keep: Optional[str] = None) -> int:
+    """
+    按最近使用时间淘汰解压目录，直到总大小不超过配额
+
+    等待中和运行中的任务使用的项目不会被淘汰，返回淘汰的目录数
+    """
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'SCRIPT_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024)
+
+    cache_dir = get_cache_dir()
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if os.path.isdir(path) and '.tmp-' not in name:
+            entries.append((os.path.getmtime(path), name, _cached_size(path)))
+
+    total = sum(size for _, _, size in entries)
+    if total <= max_bytes:
+        return 0
+
+    in_use = set(Task.objects.filter(status__in=['pending', 'running'])
+                 .exclude(test_case__content_hash='')
+                 .values_list('test_case__content_hash', flat=True))
+    if keep:
+        in_use.add(keep)
+
+    evicted = 0
+    for _, name, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name in in_use:
+            continue
+        try:
+            _remove_tree(os.path.join(cache_dir, name))
+        except OSError as e:
+            logger.warning(f"删除脚本缓存失败 {name}: {e}")
+            continue
+        total -= size
+        evicted += 1
+
+    if evicted:
+        logger.info(f"脚本缓存淘汰 {evicted} 个项目，当前占用 {total} 字节")
+    return evicted
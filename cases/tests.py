@@ -1,3 +1,212 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+import warnings
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from Automation_Platform.events import broker
+from tasks.models import Task
+from tasks.tests import create_script, create_task
+from .device_detector import DeviceDetector
+from .device_registry import DEVICES_TOPIC, DeviceRegistry, save_host_devices
+from .device_tracker import DeviceTracker, parse_track_devices_payload, read_track_devices_message
+from .script_cache import SIZE_MARKER, _remove_tree, evict
+from .models import Device
+
+
+def detected_device(device_id, platform='android'):
+    return {"name": device_id, "device_id": device_id, "os": "Android 14", "status": "在线",
+            "conn": "USB", "type": platform}
+
+
+class DeviceRegistryTests(TestCase):
+    """本机刷新与设备代理上报的设备归属"""
+
+    def test_local_refresh_keeps_agent_host(self):
+        save_host_devices([detected_device('AAA')], host='lab-01')
+        save_host_devices([detected_device('AAA'), detected_device('BBB')], host='')
+
+        self.assertEqual(Device.objects.get(device_id='AAA').host, 'lab-01')
+        self.assertEqual(Device.objects.get(device_id='BBB').host, '')
+
+        # 本机不再检测到设备时只把本机的设备标记为离线
+        save_host_devices([], host='')
+        self.assertEqual(Device.objects.get(device_id='AAA').status, '在线')
+        self.assertEqual(Device.objects.get(device_id='BBB').status, '离线')
+
+    def test_partial_refresh_by_platform(self):
+        save_host_devices([detected_device('AAA'), detected_device('IOS1', 'ios')], host='')
+        save_host_devices([], host='', platforms=['ios'])
+
+        self.assertEqual(Device.objects.get(device_id='AAA').status, '在线')
+        self.assertEqual(Device.objects.get(device_id='IOS1').status, '离线')
+
+
+class DeviceDetectorTests(SimpleTestCase):
+    """每台设备只读取一次全部属性，多台设备并发探测"""
+
+    def setUp(self):
+        self.calls = []
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def fake_run(self, cmd, **kwargs):
+        if cmd[1:] == ['devices']:
+            return subprocess.CompletedProcess(cmd, 0, 'List of devices attached\n'
+                                                        'AAA\tdevice\nBBB\tdevice\n'
+                                                        '10.0.0.2:5555\tdevice\nCCC\toffline\n')
+        with self.lock:
+            self.calls.append(cmd)
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        device_id = cmd[2]
+        output = (f'[ro.product.model]: [Model {device_id}]\n'
+                  '[ro.build.version.release]: [14]\n'
+                  '[ro.product.manufacturer]: [Acme]\n'
+                  '[persist.sys.multiline]: [a\n')
+        return subprocess.CompletedProcess(cmd, 0, output)
+
+    @mock.patch('cases.device_detector.tool_path', side_effect=lambda name: name)
+    def test_batched_concurrent_probe(self, _):
+        with mock.patch('cases.device_detector.subprocess.run', side_effect=self.fake_run):
+            devices = DeviceDetector().detect_android_devices()
+
+        self.assertEqual([device['device_id'] for device in devices], ['AAA', 'BBB', '10.0.0.2:5555'])
+        self.assertEqual(devices[0]['name'], 'Acme Model AAA')
+        self.assertEqual(devices[0]['os'], 'Android 14')
+        self.assertEqual(devices[2]['conn'], 'WiFi')
+        # 每台在线设备一次getprop调用，且同时进行
+        self.assertEqual(sorted(cmd[2] for cmd in self.calls), ['10.0.0.2:5555', 'AAA', 'BBB'])
+        self.assertTrue(all(cmd[3:] == ['shell', 'getprop'] for cmd in self.calls))
+        self.assertGreater(self.peak, 1)
+
+
+class DeviceTrackerTests(TestCase):
+    """track-devices推送只探测新接入的设备，并增量更新注册表"""
+
+    def test_read_messages(self):
+        payload = b'AAA\tdevice\nBBB\toffline\n'
+        stream = io.BytesIO(b'%04x' % len(payload) + payload + b'0000' + b'0010AAA')
+
+        self.assertEqual(parse_track_devices_payload(read_track_devices_message(stream)),
+                         {'AAA': 'device', 'BBB': 'offline'})
+        self.assertEqual(read_track_devices_message(stream), '')
+        # 连接断开时消息不完整
+        self.assertIsNone(read_track_devices_message(stream))
+
+    def test_snapshot_changes(self):
+        tracker = DeviceTracker(DeviceRegistry(ttl=60, refresh_enabled=False))
+        subscription = broker.subscribe(DEVICES_TOPIC)
+        self.addCleanup(subscription.close)
+
+        with mock.patch.object(tracker.detector, 'probe_android_devices',
+                               side_effect=lambda ids: [detected_device(device_id) for device_id in ids]) as probe:
+            tracker.handle_snapshot({'AAA': 'device', 'BBB': 'unauthorized'})
+            tracker.handle_snapshot({'AAA': 'device', 'BBB': 'device'})
+            tracker.handle_snapshot({'AAA': 'device', 'BBB': 'device'})
+            tracker.handle_snapshot({'BBB': 'device'})
+
+        self.assertEqual([c.args[0] for c in probe.call_args_list], [['AAA'], ['BBB'], []])
+        self.assertEqual(Device.objects.get(device_id='AAA').status, '离线')
+        self.assertEqual(Device.objects.get(device_id='BBB').status, '在线')
+        events = [subscription.get(timeout=1) for _ in range(3)]
+        self.assertEqual(events[-1]['stats']['online'], 1)
+        self.assertIsNone(subscription.get(timeout=0))
+
+
+class RunTestCaseTests(TestCase):
+    """提交任务时所选安装包已被缓存淘汰"""
+
+    @mock.patch('cases.views.get_cached_devices', return_value=[])
+    @mock.patch('cases.forms.get_build', return_value=object())
+    @mock.patch('cases.views.get_build', return_value=None)
+    def test_evicted_apk(self, *mocks):
+        script = create_script()
+        response = self.client.post(reverse('cases:run_test_case', args=[script.id]),
+                                    {'apk_hash': 'a' * 64, 'device_count': 1},
+                                    headers={'X-Requested-With': 'XMLHttpRequest'})
+
+        data = response.json()
+        self.assertFalse(data['success'])
+        self.assertIn('请重新上传', data['message'])
+        self.assertFalse(Task.objects.exists())
+
+
+    @mock.patch('cases.views.get_cached_devices', return_value=[detected_device('AAA'), detected_device('BBB')])
+    @mock.patch('cases.forms.get_build', return_value=object())
+    @mock.patch('cases.views.get_build', return_value=mock.Mock(sha256='a' * 64, file_path='a.apk'))
+    def test_task_created_with_device_results(self, *mocks):
+        script = create_script()
+        data = {'apk_hash': 'a' * 64, 'devices': ['AAA', 'BBB'], 'device_count': 1}
+        headers = {'X-Requested-With': 'XMLHttpRequest'}
+
+        # 设备执行记录创建失败时任务也不会留在队列中
+        with mock.patch('cases.views.TaskDeviceResult.objects.bulk_create', side_effect=RuntimeError('boom')):
+            response = self.client.post(reverse('cases:run_test_case', args=[script.id]), data, headers=headers)
+        self.assertFalse(response.json()['success'])
+        self.assertFalse(Task.objects.exists())
+
+        response = self.client.post(reverse('cases:run_test_case', args=[script.id]), data, headers=headers)
+        task = Task.objects.get(id=response.json()['task_id'])
+        self.assertEqual(sorted(task.device_results.values_list('device_id', 'device_name')),
+                         [('AAA', 'AAA'), ('BBB', 'BBB')])
+
+
+class ScriptCacheTests(TestCase):
+    """脚本缓存淘汰不删除等待中和运行中任务使用的项目"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        overrides = override_settings(SCRIPT_CACHE_DIR=self.cache_dir)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def create_entry(self, content_hash, mtime, status):
+        project_dir = os.path.join(self.cache_dir, content_hash)
+        os.makedirs(project_dir)
+        with open(os.path.join(project_dir, SIZE_MARKER), 'w') as f:
+            f.write('100')
+        os.utime(project_dir, (mtime, mtime))
+        script = create_script(name=content_hash, file_path=f'{content_hash}.zip', file_type='zip', file_size=100,
+                               content_hash=content_hash)
+        create_task(script=script, name=content_hash, status=status)
+        return project_dir
+
+    def test_evict_skips_in_use(self):
+        running = self.create_entry('running', 1000, 'running')
+        pending = self.create_entry('pending', 2000, 'pending')
+        finished = self.create_entry('finished', 3000, 'success')
+        current = self.create_entry('current', 4000, 'success')
+
+        self.assertEqual(evict(max_bytes=100, keep='current'), 1)
+        self.assertTrue(os.path.isdir(running))
+        self.assertTrue(os.path.isdir(pending))
+        self.assertFalse(os.path.isdir(finished))
+        self.assertTrue(os.path.isdir(current))
+
+    def test_remove_read_only_tree(self):
+        project_dir = os.path.join(self.cache_dir, 'project')
+        os.makedirs(os.path.join(project_dir, 'images'))
+        for name in ('main.py', os.path.join('images', 'button.png')):
+            path = os.path.join(project_dir, name)
+            with open(path, 'w') as f:
+                f.write('x')
+            os.chmod(path, stat.S_IREAD)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            _remove_tree(project_dir)
+        self.assertFalse(os.path.exists(project_dir))
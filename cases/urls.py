@@ -10,4 +10,5 @@ urlpatterns = [
     path('run/<int:case_id>/', views.run_test_case, name='run_test_case'),  # 运行测试用例
     path('api/testcase/<int:case_id>/', views.get_test_case_api, name='get_test_case_api'),  # 获取测试用例API
     path('devices/', views.device_status, name='device_status'),  # 设备管理
+    path('devices/stream/', views.device_stream, name='device_stream'),  # 设备变化推送
 ]
\ No newline at end of file
@@ -1,18 +1,25 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.conf import settings
+from django.db import transaction
 import os
 import zipfile
 import tempfile
+import logging
 from datetime import datetime
 from .models import TestCase
 from .forms import TestCaseUploadForm, TestCaseEditForm, RunTestCaseForm
-from .device_detector import get_connected_devices
+from .device_registry import get_registry, get_cached_devices, get_cached_device_stats, DEVICES_TOPIC
+from Automation_Platform.events import broker, sse_response
+from Automation_Platform.pagination import CursorPaginator, InvalidCursor
 from tasks.models import Task, TaskDeviceResult
+from tasks.apk_cache import store_apk, get_build
+from .script_cache import prepare_test_case
+
+logger = logging.getLogger(__name__)
 
 def case_list(request):
     """用例管理首页"""
@@ -51,6 +58,13 @@ def case_list(request):
                 # 使用表单中用户选择的状态，而不是硬编码
                 test_case.save()
 
+                # ZIP项目上传后即解压到脚本缓存并确定入口脚本，执行时无需再解压
+                if file_extension == '.zip':
+                    try:
+                        prepare_test_case(test_case)
+                    except Exception as e:
+                        logger.warning(f"预解压测试用例失败 {test_case.name}: {e}")
+
                 messages.success(request, f"测试用例 '{test_case.name}' 上传成功！")
 
                 # 如果是AJAX请求，返回JSON响应
@@ -96,19 +110,12 @@ def case_list(request):
     # 处理GET请求
     form = TestCaseUploadForm()
 
-    # 获取所有测试用例
-    all_cases = TestCase.objects.all()
-
-    # 分页处理
-    paginator = Paginator(all_cases, 10)  # 每页显示10条
-    page = request.GET.get('page', 1)
-
+    # 按(上传时间, id)游标分页，深层页面与首页开销相同
+    paginator = CursorPaginator(TestCase.objects.all(), 'upload_time', 10)  # 每页显示10条
     try:
-        cases = paginator.page(page)
-    except PageNotAnInteger:
-        cases = paginator.page(1)
-    except EmptyPage:
-        cases = paginator.page(paginator.num_pages)
+        cases = paginator.page(after=request.GET.get('after'), before=request.GET.get('before'), with_count=True)
+    except InvalidCursor:
+        cases = paginator.page(with_count=True)
 
     # 准备设备状态弹窗所需的数据
     all_devices = []
@@ -216,8 +223,8 @@ def run_test_case(request, case_id):
     test_case = get_object_or_404(TestCase, id=case_id)
 
     if request.method == 'POST':
-        # 获取可用设备列表来初始化表单
-        connected_devices = get_connected_devices()
+        # 从设备注册表快照获取在线设备列表来初始化表单
+        connected_devices = get_cached_devices(online_only=True)
         device_choices = [(d['device_id'], f"{d['name']} ({d['device_id']})") for d in connected_devices]
 
         form = RunTestCaseForm(request.POST, request.FILES, device_choices=device_choices)
@@ -226,53 +233,73 @@ def run_test_case(request, case_id):
             try:
                 # 获取选中的设备
                 selected_devices = form.cleaned_data['devices']
+                device_count = form.cleaned_data['device_count'] or 0
+                device_os = form.cleaned_data['device_os'].strip()
                 app_file = form.cleaned_data['app_file']
-
-                # 确定平台类型
-                file_extension = os.path.splitext(app_file.name)[1].lower()
-                platform = 'android' if file_extension == '.apk' else 'ios'
-
-                # 保存应用文件到临时目录
-                upload_dir = os.path.join('uploads', 'apps')
-                os.makedirs(upload_dir, exist_ok=True)
-
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                app_filename = f"{timestamp}_{app_file.name}"
-                app_file_path = os.path.join(upload_dir, app_filename)
-
-                with open(app_file_path, 'wb+') as destination:
-                    for chunk in app_file.chunks():
-                        destination.write(chunk)
-
-                # 创建任务
-                task = Task.objects.create(
-                    name=test_case.name,  # 只使用用例标题
-                    test_case=test_case,
-                    devices=selected_devices,
-                    app_file=app_file_path,
-                    platform=platform,
-                    status='pending'
-                )
-
-                # 为每个设备创建任务结果记录
+                apk_hash = form.cleaned_data['apk_hash']
+
+                if app_file:
+                    # 确定平台类型
+                    file_extension = os.path.splitext(app_file.name)[1].lower()
+                    platform = 'android' if file_extension == '.apk' else 'ios'
+                else:
+                    platform = 'android'
+
+                if app_file and platform == 'ios':
+                    # 保存应用文件到临时目录
+                    upload_dir = os.path.join('uploads', 'apps')
+                    os.makedirs(upload_dir, exist_ok=True)
+
+                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                    app_filename = f"{timestamp}_{app_file.name}"
+                    app_file_path = os.path.join(upload_dir, app_filename)
+
+                    with open(app_file_path, 'wb+') as destination:
+                        for chunk in app_file.chunks():
+                            destination.write(chunk)
+                else:
+                    # APK按内容哈希缓存，相同构建不重复保存
+                    build = store_apk(app_file) if app_file else get_build(apk_hash)
+                    if build is None:
+                        # 表单验证之后安装包可能已被缓存淘汰
+                        raise ValueError("所选安装包已被清理，请重新上传")
+                    apk_hash = build.sha256
+                    app_file_path = build.file_path
+
+                # 未选择设备时由调度器在领取任务时按平台和系统版本自动分配
+                device_filter = {}
+                if not selected_devices:
+                    device_filter = {'platform': platform}
+                    if device_os:
+                        device_filter['os'] = device_os
+
+                # 任务和设备执行记录在同一事务中创建，worker不会领取到只有部分设备记录的任务
                 device_map = {d['device_id']: d for d in connected_devices}
-
-                for device_id in selected_devices:
-                    device_info = device_map.get(device_id)
-
-                    # 确保device_info有name字段，如果没有则使用默认值
-                    device_name = device_info.get('name', f"Device ({device_id[:8]}...)") if device_info else f"Device ({device_id[:8]}...)"
-
-                    TaskDeviceResult.objects.create(
-                        task=task,
-                        device_id=device_id,
-                        device_name=device_name,
+                with transaction.atomic():
+                    task = Task.objects.create(
+                        name=test_case.name,  # 只使用用例标题
+                        test_case=test_case,
+                        devices=selected_devices,
+                        requested_devices=0 if selected_devices else device_count,
+                        device_filter=device_filter,
+                        app_file=app_file_path,
+                        apk_sha256=apk_hash or '',
+                        platform=platform,
                         status='pending'
                     )
 
-                # 启动异步任务执行
-                from tasks.views import execute_task_async
-                execute_task_async(task.id)
+                    # 为每个设备创建任务结果记录（没有设备名称时使用默认值）
+                    TaskDeviceResult.objects.bulk_create([
+                        TaskDeviceResult(
+                            task=task,
+                            device_id=device_id,
+                            device_name=(device_map.get(device_id) or {}).get('name', f"Device ({device_id[:8]}...)"),
+                            status='pending'
+                        )
+                        for device_id in selected_devices
+                    ])
+
+                # 任务以pending状态进入队列，由worker进程（manage.py run_worker）在所需设备空闲时领取执行
 
                 if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                     return JsonResponse({
@@ -333,11 +360,9 @@ def get_test_case_api(request, case_id):
 
 def device_status(request):
     """设备管理子页面"""
-    from .device_detector import get_connected_devices, get_device_stats
-
-    # 自动检测已连接的设备
-    all_devices = get_connected_devices()
-    stats = get_device_stats()
+    # 读取设备注册表快照（由后台线程定期检测更新）
+    all_devices = get_cached_devices()
+    stats = get_cached_device_stats()
 
     # 如果是AJAX请求，返回JSON格式的设备数据
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -347,4 +372,10 @@ def device_status(request):
             'stats': stats
         })
 
-    return render(request, 'cases/device_status.html', {"stats": stats, "devices": all_devices, "nav": "cases"})
\ No newline at end of file
+    return render(request, 'cases/device_status.html', {"stats": stats, "devices": all_devices, "nav": "cases"})
+
+def device_stream(request):
+    """设备变化推送（SSE），连接建立时先发送当前快照"""
+    registry = get_registry()
+    subscription = broker.subscribe(DEVICES_TOPIC)
+    return sse_response(request, subscription, initial=registry.build_event())
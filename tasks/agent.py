@@ -0,0 +1,101 @@
+"""
+设备代理模块
+设备代理（manage.py run_agent）运行在连接测试设备的主机上：定期检测本机设备并上报到中心数据库
+（Device.host为代理名称），领取位于本机的设备作业执行；任务所需的安装包和测试脚本不在本机时
+从中心服务器下载到相同的相对路径（请求带AGENT_TOKEN，中心服务器只向持有该令牌的代理提供文件）
+"""
+
+import hmac
+import os
+import tempfile
+import threading
+import logging
+import urllib.request
+from typing import List
+
+from django.conf import settings
+from django.db import connections
+
+from cases.device_detector import DeviceDetector
+from cases.device_registry import save_host_devices
+
+logger = logging.getLogger(__name__)
+
+# 下载任务文件时每次读取的字节数
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 代理下载任务文件时携带令牌的请求头
+AGENT_TOKEN_HEADER = 'X-Agent-Token'
+
+
+def is_agent_request(request) -> bool:
+    """请求是否来自持有AGENT_TOKEN的设备代理；未配置令牌时拒绝所有请求"""
+    token = getattr(settings, 'AGENT_TOKEN', '')
+    provided = request.headers.get(AGENT_TOKEN_HEADER, '')
+    return bool(token) and hmac.compare_digest(provided.encode(), token.encode())
+
+
+class DeviceReporter:
+    """设备上报器：定期检测本机设备并上报，代理停止上报后中心调度不再向其分配设备"""
+
+    def __init__(self, host: str, interval: float):
+        self.host = host
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='device-reporter', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def report(self) -> int:
+        """检测本机设备并上报，返回检测到的设备数"""
+        detector = DeviceDetector(max_workers=getattr(settings, 'DEVICE_PROBE_MAX_WORKERS', 16))
+        return save_host_devices(detector.detect_all_devices(), host=self.host)
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.report()
+            except Exception as e:
+                logger.warning(f"设备上报失败: {e}")
+            finally:
+                connections.close_all()
+
+
+def fetch_task_artifacts(task, server_url: str, token: str = '') -> List[str]:
+    """下载本机缺少的任务文件（应用文件、测试脚本），返回下载的文件路径"""
+    downloaded = []
+    for kind, file_path in (('app', task.app_file), ('script', task.test_case.file_path)):
+        if not file_path or os.path.exists(file_path):
+            continue
+        url = f"{server_url.rstrip('/')}/tasks/api/artifacts/{task.id}/{kind}/"
+        download_file(url, file_path, token)
+        downloaded.append(file_path)
+        logger.info(f"已下载任务 {task.id} 的文件: {file_path}")
+    return downloaded
+
+
+def download_file(url: str, file_path: str, token: str = ''):
+    """下载到临时文件后原子重命名，多个代理进程同时下载时不会读到不完整的文件"""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        timeout = getattr(settings, 'AGENT_DOWNLOAD_TIMEOUT', 300)
+        request = urllib.request.Request(url, headers={AGENT_TOKEN_HEADER: token} if token else {})
+        with os.fdopen(fd, 'wb') as f, urllib.request.urlopen(request, timeout=timeout) as response:
+            while True:
+                chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, file_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,371 @@
+"""
+Airtest日志模块
+每次执行（任务+设备）使用独立的日志目录，避免并发设备互相覆盖log.txt；
+执行结束后流式解析log.txt，生成精简的日志索引（步骤数、耗时、失败步骤、截图）
+和执行摘要（各函数耗时、图像匹配结果、失败信息）保存到数据库
+"""
+
+import json
+import os
+import re
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LOG_FILE_NAME = 'log.txt'
+
+# 索引中保留的步骤和截图数量上限，保证单条记录体积可控
+MAX_INDEX_STEPS = 200
+MAX_INDEX_SCREENSHOTS = 100
+
+# 摘要中保留的匹配记录和失败记录数量上限
+MAX_SUMMARY_MATCHES = 200
+MAX_SUMMARY_FAILURES = 50
+
+# 每次从文件读取的字符数；超长的行分段处理，不会整行读入内存
+READ_CHUNK_SIZE = 64 * 1024
+
+# call_args超过该长度时丢弃（_cv_match等函数的参数中包含整张截图的数组）
+MAX_CALL_ARGS_CHARS = 4 * 1024
+
+# 去掉call_args后单条日志仍超过该长度时跳过该条日志
+MAX_ENTRY_CHARS = 256 * 1024
+
+CALL_ARGS_KEY = '"call_args":'
+# 展开写法避免正则引擎为每个字符保存回溯状态
+STRING_BODY = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.S)
+SIGNIFICANT_CHAR = re.compile(r'["{}\[\],]')
+
+# 图像匹配相关的函数
+MATCH_FUNCTION = 'loop_find'
+MATCH_ATTEMPT_FUNCTION = '_cv_match'
+SCREENSHOT_FUNCTION = 'try_log_screen'
+
+
+def get_log_root() -> str:
+    return os.path.abspath(getattr(settings, 'AIRTEST_LOG_ROOT', os.path.join('logs', 'airtest')))
+
+
+def get_run_log_dir(task_id: Optional[int], device_id: str) -> str:
+    """获取（并创建）某次执行的日志目录：<日志根目录>/task_<任务ID>/<设备ID>"""
+    # 网络设备的ID形如 192.168.1.2:5555，替换掉不能用作目录名的字符
+    safe_device_id = re.sub(r'[^\w.-]', '_', device_id)
+    task_dir = f"task_{task_id}" if task_id is not None else 'adhoc'
+    log_dir = os.path.join(get_log_root(), task_dir, safe_device_id)
+    os.makedirs(log_dir, exist_ok=True)
+    return log_dir
+
+
+class _EntryReducer:
+    """
+    逐段接收一行日志，保留除过大的call_args以外的内容
+
+    call_args的值在扫描时只记录嵌套层级和字符串状态，超过长度上限后不再保存，
+    最终替换为null，因此内存占用与截图数组的大小无关
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+        self.oversized = False
+        self.tail = ''
+        self.key_found = False
+        self.in_value = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.captured = []
+        self.captured_size = 0
+        self.value_overflow = False
+
+    def feed(self, piece: str):
+        pos = 0
+        while pos < len(piece):
+            if self.in_value:
+                pos = self._scan_value(piece, pos)
+                continue
+
+            if self.key_found:
+                self._append(piece[pos:])
+                return
+
+            # 键名可能被分段截断，拼上上一段末尾的几个字符一起查找
+            text = self.tail + piece[pos:]
+            index = text.find(CALL_ARGS_KEY)
+            if index == -1:
+                self._append(piece[pos:])
+                self.tail = text[-(len(CALL_ARGS_KEY) - 1):]
+                return
+
+            end = pos + index + len(CALL_ARGS_KEY) - len(self.tail)
+            self._append(piece[pos:end])
+            self.tail = ''
+            self.key_found = True
+            self.in_value = True
+            pos = end
+
+    def result(self) -> Optional[str]:
+        if self.oversized or self.in_value:
+            return None
+        return ''.join(self.parts)
+
+    def _append(self, text: str):
+        if self.oversized:
+            return
+        self.size += len(text)
+        if self.size > MAX_ENTRY_CHARS:
+            self.oversized = True
+            self.parts = []
+            return
+        self.parts.append(text)
+
+    def _capture(self, text: str):
+        if self.value_overflow:
+            return
+        self.captured_size += len(text)
+        if self.captured_size > MAX_CALL_ARGS_CHARS:
+            self.value_overflow = True
+            self.captured = []
+            return
+        self.captured.append(text)
+
+    def _finish_value(self, piece: str, start: int, end: int) -> int:
+        self._capture(piece[start:end])
+        self._append('null' if self.value_overflow else ''.join(self.captured))
+        self.in_value = False
+        self.captured = []
+        return end
+
+    def _scan_value(self, piece: str, pos: int) -> int:
+        """扫描call_args的值，返回值结束的位置（未结束时返回分段末尾）"""
+        start = pos
+        length = len(piece)
+        while pos < length:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                    pos += 1
+                    continue
+                pos = STRING_BODY.match(piece, pos).end()
+                if pos >= length:
+                    break
+                if piece[pos] == '\\':
+                    # 转义符恰好位于分段末尾
+                    self.escape = True
+                    pos += 1
+                    continue
+                pos += 1
+                self.in_string = False
+                if self.depth == 0:
+                    return self._finish_value(piece, start, pos)
+                continue
+
+            match = SIGNIFICANT_CHAR.search(piece, pos)
+            if match is None:
+                pos = length
+                break
+            char, position = match.group(), match.start()
+            if char == '"':
+                self.in_string = True
+                pos = position + 1
+            elif char in '{[':
+                self.depth += 1
+                pos = position + 1
+            elif self.depth == 0:
+                # null、数字等标量值在遇到逗号或外层右括号时结束
+                return self._finish_value(piece, start, position)
+            elif char in '}]':
+                self.depth -= 1
+                pos = position + 1
+                if self.depth == 0:
+                    return self._finish_value(piece, start, pos)
+            else:
+                pos = position + 1
+
+        self._capture(piece[start:pos])
+        return pos
+
+
+def _load_entry(reducer: _EntryReducer) -> Optional[Dict[str, Any]]:
+    text = reducer.result()
+    if not text or not text.strip():
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def iter_log_entries(log_path: str) -> Iterator[Dict[str, Any]]:
+    """流式读取log.txt中的日志条目，过大的call_args替换为None，无法解析的行直接跳过"""
+    with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
+        reducer = _EntryReducer()
+        while True:
+            piece = f.readline(READ_CHUNK_SIZE)
+            if not piece:
+                break
+            reducer.feed(piece)
+            if not piece.endswith('\n'):
+                continue
+
+            entry = _load_entry(reducer)
+            reducer = _EntryReducer()
+            if entry is not None:
+                yield entry
+
+        # 最后一行没有换行符
+        entry = _load_entry(reducer)
+        if entry is not None:
+            yield entry
+
+
+class LogFollower:
+    """跟随读取执行中的log.txt，每次poll返回上次之后新写入的完整日志条目"""
+
+    def __init__(self, log_dir: str):
+        self.log_path = os.path.join(log_dir, LOG_FILE_NAME)
+        self._file = None
+        self._reducer = _EntryReducer()
+
+    def poll(self) -> List[Dict[str, Any]]:
+        if self._file is None:
+            if not os.path.exists(self.log_path):
+                return []
+            self._file = open(self.log_path, 'r', encoding='utf-8', errors='ignore')
+
+        entries = []
+        while True:
+            piece = self._file.readline(READ_CHUNK_SIZE)
+            if not piece:
+                break
+            self._reducer.feed(piece)
+            if not piece.endswith('\n'):
+                # 行还没写完，下次继续读取
+                continue
+            entry = _load_entry(self._reducer)
+            self._reducer = _EntryReducer()
+            if entry is not None:
+                entries.append(entry)
+        return entries
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def analyze_log(log_dir: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    单次遍历执行目录中的log.txt，返回(日志索引, 执行摘要)
+
+    日志索引的steps只统计顶层（depth为1）的函数调用，即脚本中直接调用的touch、wait等操作；
+    screenshots为相对于日志目录的截图文件名。
+    执行摘要的functions按函数名汇总调用次数和耗时，matches为每次loop_find的匹配结果，
+    attempts是其中_cv_match的尝试次数
+    """
+    index = {
+        'log_file': LOG_FILE_NAME,
+        'step_count': 0,
+        'steps': [],
+        'duration': None,
+        'failed_step': None,
+        'screenshots': [],
+        'error': '',
+    }
+    summary = {
+        'functions': {},
+        'matches': [],
+        'match_count': 0,
+        'matched': 0,
+        'failures': [],
+    }
+
+    log_path = os.path.join(log_dir, LOG_FILE_NAME)
+    if not os.path.exists(log_path):
+        return index, summary
+
+    first_start = None
+    last_end = None
+    attempts = 0
+    for entry in iter_log_entries(log_path):
+        data = entry.get('data') or {}
+        name = data.get('name', '')
+        traceback = data.get('traceback')
+
+        if entry.get('tag') == 'info':
+            if traceback:
+                index['error'] = _last_line(traceback)
+            continue
+
+        start_time = data.get('start_time')
+        end_time = data.get('end_time')
+        duration = round(end_time - start_time, 3) if start_time and end_time else None
+        if start_time is not None and (first_start is None or start_time < first_start):
+            first_start = start_time
+        if end_time is not None and (last_end is None or end_time > last_end):
+            last_end = end_time
+
+        if duration is not None:
+            stats = summary['functions'].setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['total'] = round(stats['total'] + duration, 3)
+            stats['max'] = max(stats['max'], duration)
+
+        ret = data.get('ret')
+        if name == SCREENSHOT_FUNCTION and isinstance(ret, dict) and ret.get('screen'):
+            if len(index['screenshots']) < MAX_INDEX_SCREENSHOTS:
+                index['screenshots'].append(ret['screen'])
+        elif name == MATCH_ATTEMPT_FUNCTION:
+            attempts += 1
+        elif name == MATCH_FUNCTION:
+            # 日志在函数返回时写入，loop_find之前的_cv_match都属于这次查找
+            summary['match_count'] += 1
+            if not traceback:
+                summary['matched'] += 1
+            if len(summary['matches']) < MAX_SUMMARY_MATCHES:
+                summary['matches'].append({
+                    'template': _template_name(data.get('call_args')),
+                    'pos': ret,
+                    'attempts': attempts,
+                    'duration': duration,
+                    'success': not traceback,
+                })
+            attempts = 0
+
+        if traceback and len(summary['failures']) < MAX_SUMMARY_FAILURES:
+            summary['failures'].append({
+                'name': name,
+                'depth': entry.get('depth'),
+                'error': _last_line(traceback),
+            })
+
+        if entry.get('depth') != 1:
+            continue
+
+        index['step_count'] += 1
+        if len(index['steps']) < MAX_INDEX_STEPS:
+            index['steps'].append({'name': name, 'duration': duration, 'success': not traceback})
+        if traceback and index['failed_step'] is None:
+            index['failed_step'] = {
+                'index': index['step_count'],
+                'name': name,
+                'error': _last_line(traceback),
+            }
+
+    if first_start is not None and last_end is not None:
+        index['duration'] = round(last_end - first_start, 3)
+    return index, summary
+
+
+def _template_name(call_args: Any) -> str:
+    if isinstance(call_args, dict) and isinstance(call_args.get('query'), dict):
+        return call_args['query'].get('filename', '')
+    return ''
+
+
+def _last_line(text: str) -> str:
+    lines = [line for line in str(text).strip().splitlines() if line.strip()]
+    return lines[-1].strip() if lines else ''
@@ -0,0 +1,235 @@
+"""
+安装包缓存模块
+按内容SHA256存储上传的APK，同一构建只保存一份，超出磁盘配额时按最近使用时间淘汰；
+同时解析APK中的包名和版本号，用于安装前判断设备是否已安装相同构建
+"""
+
+import hashlib
+import os
+import struct
+import tempfile
+import zipfile
+import logging
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ApkBuild, Task
+
+logger = logging.getLogger(__name__)
+
+# AndroidManifest.xml 二进制格式（AXML）中用到的块类型
+RES_STRING_POOL_TYPE = 0x0001
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+RES_XML_START_ELEMENT_TYPE = 0x0102
+UTF8_FLAG = 0x100
+
+# 属性值类型
+TYPE_STRING = 0x03
+TYPE_INT_DEC = 0x10
+TYPE_INT_HEX = 0x11
+
+# 属性名字符串为空时通过资源ID识别
+ATTR_RESOURCE_IDS = {
+    0x0101021b: 'versionCode',
+    0x0101021c: 'versionName',
+}
+
+
+def get_cache_dir() -> str:
+    cache_dir = getattr(settings, 'APK_CACHE_DIR', os.path.join('uploads', 'apk_cache'))
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def store_apk(uploaded_file) -> ApkBuild:
+    """保存上传的APK，内容相同的构建直接复用已缓存的文件"""
+    cache_dir = get_cache_dir()
+    digest = hashlib.sha256()
+
+    # 边写临时文件边计算哈希，避免整个文件读入内存
+    fd, temp_path = tempfile.mkstemp(suffix='.apk.part', dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as destination:
+            for chunk in uploaded_file.chunks():
+                digest.update(chunk)
+                destination.write(chunk)
+
+        sha256 = digest.hexdigest()
+        build = ApkBuild.objects.filter(sha256=sha256).first()
+        if build is not None and os.path.exists(build.file_path):
+            touch(build)
+            return build
+
+        file_path = os.path.join(cache_dir, f"{sha256}.apk")
+        os.replace(temp_path, file_path)
+        temp_path = None
+
+        manifest = read_apk_manifest(file_path)
+        build, _ = ApkBuild.objects.update_or_create(
+            sha256=sha256,
+            defaults={
+                'file_path': file_path,
+                'file_size': os.path.getsize(file_path),
+                'original_name': uploaded_file.name,
+                'package_name': manifest.get('package', ''),
+                'version_code': manifest.get('versionCode'),
+                'version_name': manifest.get('versionName', ''),
+                'last_used_time': timezone.now(),
+            }
+        )
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    evict(keep=build.sha256)
+    return build
+
+
+def get_build(sha256: str) -> Optional[ApkBuild]:
+    """根据哈希获取缓存的构建，文件已丢失时返回None"""
+    build = ApkBuild.objects.filter(sha256=sha256).first()
+    if build is None or not os.path.exists(build.file_path):
+        return None
+    return build
+
+
+def touch(build: ApkBuild):
+    """更新最近使用时间"""
+    build.last_used_time = timezone.now()
+    ApkBuild.objects.filter(id=build.id).update(last_used_time=build.last_used_time)
+
+
+def evict(max_bytes: Optional[int] = None, keep: Optional[str] = None) -> int:
+    """
+    按最近使用时间淘汰构建，直到总大小不超过配额
+
+    等待中和运行中的任务引用的构建不会被淘汰，返回淘汰的构建数
+    """
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'APK_CACHE_MAX_BYTES', 5 * 1024 * 1024 * 1024)
+
+    total = ApkBuild.objects.aggregate(total=Sum('file_size'))['total'] or 0
+    if total <= max_bytes:
+        return 0
+
+    in_use = set(Task.objects.filter(status__in=['pending', 'running'])
+                 .exclude(apk_sha256='')
+                 .values_list('apk_sha256', flat=True))
+    if keep:
+        in_use.add(keep)
+
+    evicted = 0
+    for build in ApkBuild.objects.order_by('last_used_time'):
+        if total <= max_bytes:
+            break
+        if build.sha256 in in_use:
+            continue
+        try:
+            if os.path.exists(build.file_path):
+                os.remove(build.file_path)
+        except OSError as e:
+            logger.warning(f"删除缓存安装包失败 {build.file_path}: {e}")
+            continue
+        total -= build.file_size
+        build.delete()
+        evicted += 1
+
+    if evicted:
+        logger.info(f"安装包缓存淘汰 {evicted} 个构建，当前占用 {total} 字节")
+    return evicted
+
+
+def read_apk_manifest(apk_path: str) -> Dict[str, Any]:
+    """读取APK的包名、versionCode和versionName，解析失败时返回空字典"""
+    try:
+        with zipfile.ZipFile(apk_path) as apk:
+            data = apk.read('AndroidManifest.xml')
+        return parse_binary_manifest(data)
+    except Exception as e:
+        logger.warning(f"解析APK清单失败 {apk_path}: {e}")
+        return {}
+
+
+def parse_binary_manifest(data: bytes) -> Dict[str, Any]:
+    """解析二进制AndroidManifest.xml中manifest根元素的属性"""
+    strings = []
+    resource_ids = []
+    offset = 8  # 跳过文件头
+
+    while offset + 8 <= len(data):
+        chunk_type, header_size, chunk_size = struct.unpack_from('<HHI', data, offset)
+        if chunk_size <= 0:
+            break
+
+        if chunk_type == RES_STRING_POOL_TYPE:
+            strings = _parse_string_pool(data, offset)
+        elif chunk_type == RES_XML_RESOURCE_MAP_TYPE:
+            count = (chunk_size - header_size) // 4
+            resource_ids = list(struct.unpack_from(f'<{count}I', data, offset + header_size))
+        elif chunk_type == RES_XML_START_ELEMENT_TYPE:
+            ext = offset + header_size
+            name_index = struct.unpack_from('<I', data, ext + 4)[0]
+            if strings[name_index] != 'manifest':
+                break
+            attr_start, attr_size, attr_count = struct.unpack_from('<HHH', data, ext + 8)
+            return _parse_manifest_attributes(data, ext + attr_start, attr_size, attr_count,
+                                              strings, resource_ids)
+
+        offset += chunk_size
+
+    return {}
+
+
+def _parse_manifest_attributes(data, offset, attr_size, attr_count, strings, resource_ids):
+    result = {}
+    for i in range(attr_count):
+        base = offset + i * attr_size
+        _, name_index, raw_value, _, _, data_type, value = struct.unpack_from('<IIIHBBI', data, base)
+
+        name = strings[name_index] if name_index < len(strings) else ''
+        if not name and name_index < len(resource_ids):
+            name = ATTR_RESOURCE_IDS.get(resource_ids[name_index], '')
+
+        if name in ('package', 'versionName'):
+            # 原始字符串优先，其次是字符串类型的值；资源引用等其他类型无法直接解析
+            if raw_value != 0xFFFFFFFF:
+                result[name] = strings[raw_value]
+            elif data_type == TYPE_STRING:
+                result[name] = strings[value]
+        elif name == 'versionCode' and data_type in (TYPE_INT_DEC, TYPE_INT_HEX):
+            result[name] = value
+    return result
+
+
+def _parse_string_pool(data: bytes, offset: int):
+    header_size = struct.unpack_from('<H', data, offset + 2)[0]
+    string_count, _, flags, strings_start, _ = struct.unpack_from('<IIIII', data, offset + 8)
+    is_utf8 = bool(flags & UTF8_FLAG)
+    offsets = struct.unpack_from(f'<{string_count}I', data, offset + header_size)
+    base = offset + strings_start
+
+    strings = []
+    for string_offset in offsets:
+        pos = base + string_offset
+        if is_utf8:
+            # UTF-8字符串：字符数、字节数各占1~2字节
+            pos += 2 if data[pos] & 0x80 else 1
+            length = data[pos]
+            if length & 0x80:
+                length = ((length & 0x7F) << 8) | data[pos + 1]
+                pos += 2
+            else:
+                pos += 1
+            strings.append(data[pos:pos + length].decode('utf-8', errors='ignore'))
+        else:
+            length = struct.unpack_from('<H', data, pos)[0]
+            if length & 0x8000:
+                length = ((length & 0x7FFF) << 16) | struct.unpack_from('<H', data, pos + 2)[0]
+                pos += 4
+            else:
+                pos += 2
+            strings.append(data[pos:pos + length * 2].decode('utf-16-le', errors='ignore'))
+    return strings
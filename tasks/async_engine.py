@@ -0,0 +1,314 @@
+"""
+异步执行引擎模块
+所有设备的安装、执行流程作为协程运行在同一个事件循环中，子进程通过
+asyncio.create_subprocess_exec启动，单个worker进程可同时管理大量设备而无需为每台设备占用线程；
+每个阶段有独立的超时，任务被取消时结束其所有子进程
+"""
+
+import asyncio
+import functools
+import os
+import subprocess
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connections
+
+from .airtest_log import LogFollower
+from .live_output import OUTPUT_FILE_NAME, RESULT_TAIL_LINES, RotatingOutputFile, kill_process_tree
+from .cancellation import CANCEL_MESSAGE, device_run, is_cancelled, register_process, unregister_process
+from .scheduler import release_devices
+from .runners import get_stage_timeout
+from Automation_Platform.db_writer import run_write
+from .installer import SLOT_STEP, InstallPlan, adb_command
+from .executor import start_script_run, collect_device_result, save_device_result, fail_device_result
+
+logger = logging.getLogger(__name__)
+
+# 子进程单行输出的长度上限，超过的行被丢弃
+STREAM_LINE_LIMIT = 1024 * 1024
+
+
+@asynccontextmanager
+async def _start_process(cmd: List[str], cwd: Optional[str] = None):
+    """启动子进程并登记到当前设备（可被取消），退出时结束仍在运行的进程"""
+    # 子进程在独立的进程组中运行，超时或取消时连同其启动的子进程一起结束
+    process = await asyncio.create_subprocess_exec(
+        *cmd, cwd=cwd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        limit=STREAM_LINE_LIMIT, start_new_session=(os.name != 'nt'))
+    key = register_process(process)
+    try:
+        yield process
+    finally:
+        if process.returncode is None:
+            kill_process_tree(process)
+            await process.wait()
+        unregister_process(key, process)
+
+
+async def run_command(cmd: List[str], timeout: float) -> subprocess.CompletedProcess:
+    """执行命令并等待结束（与cancellation.run_tracked相同的返回格式），超时时结束进程并抛出TimeoutExpired"""
+    async with _start_process(cmd) as process:
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            raise subprocess.TimeoutExpired(cmd, timeout)
+    return subprocess.CompletedProcess(cmd, process.returncode,
+                                       stdout=stdout.decode('utf-8', errors='ignore'),
+                                       stderr=stderr.decode('utf-8', errors='ignore'))
+
+
+async def run_streaming_command(cmd: List[str], log_dir: str, timeout: float, cwd: Optional[str] = None,
+                                on_step: Optional[Callable[[int, str], Awaitable[None]]] = None
+                                ) -> subprocess.CompletedProcess:
+    """
+    执行命令并实时读取输出（与live_output.run_streaming_process相同的输出文件和返回格式）
+
+    on_step(step, name)为协程函数，在Airtest每完成一个顶层步骤时调用
+    """
+    output = RotatingOutputFile(
+        os.path.join(log_dir, OUTPUT_FILE_NAME),
+        max_bytes=getattr(settings, 'SCRIPT_OUTPUT_MAX_BYTES', 5 * 1024 * 1024),
+        backup_count=getattr(settings, 'SCRIPT_OUTPUT_BACKUP_COUNT', 2),
+    )
+    tails = {'stdout': deque(maxlen=RESULT_TAIL_LINES), 'stderr': deque(maxlen=RESULT_TAIL_LINES)}
+    follower = LogFollower(log_dir) if on_step else None
+    steps = {'count': 0}
+
+    async def pump(name, stream):
+        prefix = '[stderr] ' if name == 'stderr' else ''
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                # 单行超过长度上限
+                continue
+            if not line:
+                break
+            text = line.decode('utf-8', errors='ignore')
+            tails[name].append(text.rstrip('\n'))
+            output.write_line(prefix + text)
+
+    async def report_steps():
+        for entry in follower.poll():
+            if entry.get('depth') == 1:
+                steps['count'] += 1
+                await on_step(steps['count'], (entry.get('data') or {}).get('name', ''))
+
+    async def follow_steps():
+        interval = getattr(settings, 'SCRIPT_STEP_POLL_INTERVAL', 1.0)
+        while True:
+            await asyncio.sleep(interval)
+            await report_steps()
+
+    completed = False
+    try:
+        async with _start_process(cmd, cwd) as process:
+            follow_task = asyncio.ensure_future(follow_steps()) if follower else None
+            try:
+                await asyncio.wait_for(asyncio.gather(pump('stdout', process.stdout),
+                                                      pump('stderr', process.stderr),
+                                                      process.wait()), timeout)
+                completed = True
+            except asyncio.TimeoutError:
+                raise subprocess.TimeoutExpired(cmd, timeout, output='\n'.join(tails['stdout']),
+                                                stderr='\n'.join(tails['stderr']))
+            finally:
+                if follow_task is not None:
+                    follow_task.cancel()
+                    try:
+                        await follow_task
+                    except asyncio.CancelledError:
+                        pass
+    finally:
+        output.close()
+        if follower is not None:
+            if completed:
+                # 脚本结束前最后写入的步骤
+                await report_steps()
+            follower.close()
+
+    return subprocess.CompletedProcess(cmd, process.returncode,
+                                       stdout='\n'.join(tails['stdout']),
+                                       stderr='\n'.join(tails['stderr']))
+
+
+class AsyncEngine:
+    """异步执行引擎（事件循环运行在后台线程中，worker线程提交任务后阻塞等待结果）"""
+
+    def __init__(self, max_sessions: int):
+        self.max_sessions = max_sessions
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._sessions = None
+        self._install_slots = None
+        # 数据库操作在专用线程中执行，连接在该线程中复用
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='async-engine-db')
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,),
+                                            name='async-engine', daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def stop(self):
+        """停止事件循环，关闭数据库线程的连接（进程退出或测试结束时调用）"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._thread = None
+        self._db_executor.submit(connections.close_all).result()
+
+    def _run_loop(self, ready: threading.Event):
+        asyncio.set_event_loop(self._loop)
+        # 信号量需在事件循环所在线程中创建
+        self._sessions = asyncio.Semaphore(self.max_sessions)
+        self._install_slots = asyncio.Semaphore(getattr(settings, 'APK_INSTALL_FANOUT', 4))
+        ready.set()
+        self._loop.run_forever()
+
+    async def run_db(self, func: Callable, *args, **kwargs):
+        """在数据库线程中执行数据库操作，避免阻塞事件循环"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._db_executor, functools.partial(func, *args, **kwargs))
+
+    def run_task(self, task, prepared, device_results: Dict[str, Any], app_file, build,
+                 reporter, per_task_limit: int) -> Dict[str, Any]:
+        """在事件循环中执行任务的所有设备，阻塞直到全部完成，返回 {设备ID: 异常或None}"""
+        self.start()
+        coroutine = self._run_task(task, prepared, device_results, app_file, build, reporter, per_task_limit)
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        return future.result()
+
+    async def _run_task(self, task, prepared, device_results, app_file, build, reporter, per_task_limit):
+        task_slots = asyncio.Semaphore(per_task_limit)
+
+        async def run_limited(device_result):
+            async with task_slots, self._sessions:
+                await self.run_device(task, prepared, device_result, app_file, build, reporter)
+
+        try:
+            items = list(device_results.items())
+            results = await asyncio.gather(*(run_limited(r) for _, r in items), return_exceptions=True)
+            for (device_id, _), result in zip(items, results):
+                if isinstance(result, Exception):
+                    logger.warning(f"设备作业执行异常 {device_id}: {result}")
+            return {device_id: result for (device_id, _), result in zip(items, results)}
+        finally:
+            # 数据库连接在作业结束时关闭一次，而不是每次操作后关闭
+            await self.run_db(connections.close_all)
+
+    async def run_device(self, task, prepared, device_result, app_file, build, reporter):
+        """单台设备的执行流程：准备 -> 安装 -> 执行脚本 -> 收集结果"""
+        device_id = device_result.device_id
+        try:
+            with device_run(task.id, device_id):
+                await self._run_device(task, prepared, device_result, app_file, build, reporter)
+        finally:
+            await self.run_db(run_write, release_devices, task.id, [device_id])
+
+    async def _run_device(self, task, prepared, device_result, app_file, build, reporter):
+        device_id = device_result.device_id
+        await self.run_db(reporter.device_started, device_id)
+        install_result = None
+        timer = prepared.start_timer()
+        try:
+            # 1. 准备（任务级，已在分发前完成）
+            if prepared.error:
+                raise Exception(prepared.error)
+            if is_cancelled(task.id, device_id):
+                raise Exception(CANCEL_MESSAGE)
+
+            # 2. 安装APK
+            with timer.stage('install'):
+                install_result = await self.install_apk(device_id, app_file, task.platform, build)
+            await self.run_db(reporter.install_done, device_id, install_result)
+            if not install_result['success']:
+                raise Exception(f"APK安装失败: {install_result['error']}")
+
+            # 3. 执行测试脚本
+            if is_cancelled(task.id, device_id):
+                raise Exception(CANCEL_MESSAGE)
+            with timer.stage('run'):
+                log_dir = await self.run_db(start_script_run, task, device_result)
+                execute_result = await self.execute_test_script(device_id, prepared, log_dir, reporter)
+
+            # 4. 收集执行日志并更新设备结果（解析日志在线程中进行，不占用数据库线程）
+            fields = await asyncio.to_thread(collect_device_result, device_result, install_result,
+                                             execute_result, timer)
+            await self.run_db(save_device_result, device_result, fields)
+        except Exception as e:
+            await self.run_db(fail_device_result, device_result, install_result, e, timer)
+
+        await self.run_db(reporter.device_finished, device_id, device_result.status)
+
+    async def install_apk(self, device_id, app_file, platform, build=None) -> Dict[str, Any]:
+        """执行与线程引擎相同的安装流程，adb命令作为异步子进程运行（取消设备时同样会被结束）"""
+        if platform != 'android':
+            return {'success': False, 'error': 'iOS设备暂不支持'}
+
+        plan = InstallPlan(app_file, build)
+        steps = plan.steps()
+        holding = False
+        try:
+            step = next(steps)
+            while True:
+                if step[0] == SLOT_STEP:
+                    try:
+                        await asyncio.wait_for(self._install_slots.acquire(), step[1])
+                    except asyncio.TimeoutError:
+                        raise subprocess.TimeoutExpired(plan.deadline.cmd, plan.deadline.timeout)
+                    holding = True
+                    step = steps.send(None)
+                else:
+                    step = steps.send(await run_command(adb_command(device_id, step[1]), step[2]))
+        except StopIteration as stop:
+            return stop.value
+        except Exception as e:
+            return plan.failed(e)
+        finally:
+            steps.close()
+            if holding:
+                self._install_slots.release()
+
+    async def execute_test_script(self, device_id, prepared, log_dir, reporter):
+        """执行测试脚本（与executor.execute_test_script使用相同的运行器），整个阶段受run超时限制"""
+        async def on_step(step, name):
+            await self.run_db(reporter.script_step, device_id, step, name=name)
+
+        try:
+            cmd = prepared.build_command(device_id, log_dir)
+            result = await run_streaming_command(cmd, log_dir, get_stage_timeout('run'), cwd=prepared.cwd,
+                                                 on_step=on_step)
+            return prepared.check_result(result, log_dir)
+        except subprocess.TimeoutExpired:
+            return {'success': False, 'error': '执行超时'}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_async_engine() -> AsyncEngine:
+    """获取本进程共享的异步执行引擎（便捷函数）"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncEngine(max_sessions=getattr(settings, 'TASK_ASYNC_MAX_SESSIONS', 256))
+        return _engine
@@ -0,0 +1,172 @@
+"""
+任务取消模块
+Web进程通过cancel_task将任务或单台设备的执行记录标记为cancelled；
+worker进程轮询到取消标记后结束对应设备正在运行的子进程（整个进程组），
+设备立即空闲，执行器保存结果时保留cancelled状态
+"""
+
+import contextvars
+import subprocess
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Task, TaskDeviceResult
+from .progress import record_event
+
+logger = logging.getLogger(__name__)
+
+CANCEL_MESSAGE = '已取消'
+
+# 当前线程（或协程）正在执行的 (任务ID, 设备ID)，启动子进程时据此登记
+_current_run = contextvars.ContextVar('current_run', default=None)
+
+_lock = threading.Lock()
+_processes = {}
+_cancelled = set()
+
+
+@contextmanager
+def device_run(task_id: int, device_id: str):
+    """标记当前线程（或协程）正在执行的设备，期间启动的子进程可被取消"""
+    token = _current_run.set((task_id, device_id))
+    try:
+        yield
+    finally:
+        _current_run.reset(token)
+
+
+def register_process(process) -> Optional[Tuple[int, str]]:
+    """登记当前设备启动的子进程，返回登记使用的键；设备已被取消时立即结束该进程"""
+    key = _current_run.get()
+    if key is None:
+        return None
+    with _lock:
+        _processes.setdefault(key, set()).add(process)
+        cancelled = _is_cancelled(*key)
+    if cancelled:
+        _kill(process)
+    return key
+
+
+def unregister_process(key: Optional[Tuple[int, str]], process):
+    if key is None:
+        return
+    with _lock:
+        processes = _processes.get(key)
+        if processes is not None:
+            processes.discard(process)
+            if not processes:
+                _processes.pop(key, None)
+
+
+def run_tracked(cmd: List[str], timeout: float) -> subprocess.CompletedProcess:
+    """与subprocess.run相同的执行方式，取消设备时可结束该进程"""
+    from .live_output import popen_in_new_group
+
+    process = popen_in_new_group(cmd)
+    key = register_process(process)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill(process)
+        process.communicate()
+        raise
+    finally:
+        unregister_process(key, process)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout=stdout, stderr=stderr)
+
+
+def is_cancelled(task_id: int, device_id: Optional[str] = None) -> bool:
+    with _lock:
+        return _is_cancelled(task_id, device_id)
+
+
+def _is_cancelled(task_id, device_id=None):
+    return (task_id, None) in _cancelled or (device_id is not None and (task_id, device_id) in _cancelled)
+
+
+def cancel_local(task_id: int, device_id: Optional[str] = None) -> int:
+    """在本进程内取消任务（device_id为空）或单台设备，返回结束的子进程数"""
+    with _lock:
+        _cancelled.add((task_id, device_id))
+        processes = [process for (key_task, key_device), running in _processes.items()
+                     if key_task == task_id and (device_id is None or key_device == device_id)
+                     for process in running]
+    for process in processes:
+        _kill(process)
+    if processes:
+        logger.info(f"任务 {task_id} {device_id or ''} 已取消，结束 {len(processes)} 个子进程")
+    return len(processes)
+
+
+def clear(task_id: int):
+    """任务执行结束后清除本进程内的取消标记"""
+    with _lock:
+        for key in [key for key in _cancelled if key[0] == task_id]:
+            _cancelled.discard(key)
+
+
+def _kill(process):
+    from .live_output import kill_process_tree
+    kill_process_tree(process)
+
+
+def cancel_task(task_id: int, device_id: Optional[str] = None) -> int:
+    """
+    取消任务或任务中的单台设备（Web进程调用）
+
+    等待中和运行中的设备执行记录标记为cancelled；取消整个任务时任务也标记为cancelled，
+    尚未被worker领取的任务不会再被执行；取消单台设备后任务已没有未完成的设备时结束任务。
+    返回被取消的设备记录数
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        results = TaskDeviceResult.objects.filter(task_id=task_id, status__in=['pending', 'running'])
+        if device_id is not None:
+            results = results.filter(device_id=device_id)
+        device_ids = list(results.values_list('device_id', flat=True).distinct())
+        cancelled = results.update(status='cancelled', end_time=now,
+                                   error_message=CANCEL_MESSAGE, updated_time=now)
+        if device_id is None:
+            Task.objects.filter(id=task_id, status__in=['pending', 'running']).update(
+                status='cancelled', end_time=now, error_message=CANCEL_MESSAGE, updated_time=now)
+
+    task = Task.objects.get(id=task_id)
+    for cancelled_device in device_ids:
+        record_event(task, 'device_finished', cancelled_device, device_status='cancelled')
+    if device_id is None:
+        record_event(task, 'task_finished')
+    elif not TaskDeviceResult.objects.filter(task_id=task_id, status__in=['pending', 'running']).exists():
+        # 取消的是最后一台未完成的设备：其他设备的worker结束时该设备尚未完成，没有结束任务
+        from .executor import finish_task
+        finish_task(task)
+    return cancelled
+
+
+def poll_cancellations(task_ids: Iterable[int]) -> int:
+    """
+    检查本进程正在执行的任务是否被取消（worker进程定期调用），
+    对新取消的任务或设备结束其子进程，返回新取消的数量
+    """
+    task_ids = list(task_ids)
+    if not task_ids:
+        return 0
+
+    requests = [(task_id, None) for task_id in
+                Task.objects.filter(id__in=task_ids, status='cancelled').values_list('id', flat=True)]
+    requests += list(TaskDeviceResult.objects.filter(task_id__in=task_ids, status='cancelled')
+                     .values_list('task_id', 'device_id').distinct())
+
+    count = 0
+    for task_id, device_id in requests:
+        with _lock:
+            known = (task_id, device_id) in _cancelled
+        if not known:
+            cancel_local(task_id, device_id)
+            count += 1
+    return count
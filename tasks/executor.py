@@ -0,0 +1,382 @@
+"""
+任务执行器模块
+负责在设备上安装应用、执行测试脚本，并限制本机及单个任务的并发设备数
+"""
+
+import os
+import subprocess
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .models import Task, TaskDeviceResult
+from .progress import ProgressReporter, record_event
+from .apk_cache import get_build, touch
+from .airtest_log import get_run_log_dir, analyze_log
+from .live_output import run_streaming_process
+from .cancellation import CANCEL_MESSAGE, device_run, is_cancelled, clear as clear_cancellation
+from .scheduler import release_devices
+from .runners import StageTimer, get_stage_timeout, prepare_script
+from .installer import install_apk
+from Automation_Platform.db_writer import run_write
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceExecutor:
+    """设备并行执行器（每台主机共享一个有界工作线程池）"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='device-worker')
+
+    def run_all(self, items: Iterable[Any], func: Callable[[Any], Any],
+                per_task_limit: Optional[int] = None) -> Dict[Any, Any]:
+        """
+        对每个元素执行func，阻塞直到全部完成
+
+        同一调用内最多同时运行per_task_limit个，其余排队等待；
+        所有调用共享线程池，因此本机并发总数不超过max_workers。
+        返回 {元素: 返回值或异常}
+        """
+        pending = list(items)
+        limit = per_task_limit or self.max_workers
+        results = {}
+        running = {}
+
+        while pending or running:
+            # 在单任务上限内提交新的设备作业
+            while pending and len(running) < limit:
+                item = pending.pop(0)
+                running[self._pool.submit(self._run_job, func, item)] = item
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = running.pop(future)
+                try:
+                    results[item] = future.result()
+                except Exception as e:
+                    logger.warning(f"设备作业执行异常 {item}: {e}")
+                    results[item] = e
+
+        return results
+
+    @staticmethod
+    def _run_job(func, item):
+        try:
+            return func(item)
+        finally:
+            # 线程池中的线程会被复用，作业结束时关闭该线程的数据库连接
+            connections.close_all()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> DeviceExecutor:
+    """获取本机共享的设备执行器（便捷函数）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = DeviceExecutor(getattr(settings, 'TASK_MAX_CONCURRENT_DEVICES', 8))
+        return _executor
+
+
+def get_per_task_limit(device_count: int) -> int:
+    """获取单个任务的并发设备数"""
+    limit = getattr(settings, 'TASK_MAX_DEVICES_PER_TASK', 4)
+    return max(1, min(device_count, limit))
+
+
+def get_engine_name() -> str:
+    """设备执行引擎：thread（每台设备一个工作线程）或 asyncio（所有设备共用一个事件循环）"""
+    return getattr(settings, 'TASK_EXECUTION_ENGINE', 'thread')
+
+
+def start_script_run(task, device_result) -> str:
+    """创建本次执行的日志目录并立即保存，执行中即可通过接口查看实时输出"""
+    device_result.log_dir = get_run_log_dir(task.id, device_result.device_id)
+    run_write(TaskDeviceResult.objects.filter(id=device_result.id).update,
+              log_dir=device_result.log_dir, updated_time=timezone.now())
+    return device_result.log_dir
+
+
+def device_cancelled(device_result) -> bool:
+    """设备是否已被取消（本进程已收到取消通知，或数据库中已标记为cancelled）"""
+    return (is_cancelled(device_result.task_id, device_result.device_id)
+            or TaskDeviceResult.objects.filter(id=device_result.id, status='cancelled').exists())
+
+
+def finish_device_result(device_result, install_result, execute_result, timer=None):
+    """解析执行日志并保存设备结果（收集阶段）"""
+    save_device_result(device_result, collect_device_result(device_result, install_result, execute_result, timer))
+
+
+def collect_device_result(device_result, install_result, execute_result, timer=None):
+    """解析执行日志并填写设备结果（不写数据库），返回需要保存的字段"""
+    timer = timer or StageTimer()
+    with timer.stage('collect'):
+        device_result.log_index, log_summary = analyze_log(device_result.log_dir)
+    device_result.status = 'success' if execute_result['success'] else 'failed'
+    device_result.end_time = timezone.now()
+    device_result.result_data = {
+        'install_result': install_result,
+        'install_timing': install_result.get('timing', {}),
+        'execute_result': execute_result,
+        'log_summary': log_summary,
+        'stage_timing': timer.timing,
+        'message': '测试执行成功' if execute_result['success'] else '测试执行失败'
+    }
+    fields = ['status', 'end_time', 'result_data', 'log_index']
+    if not execute_result['success']:
+        device_result.error_message = execute_result.get('error', '未知错误')
+        fields.append('error_message')
+    return fields
+
+
+def fail_device_result(device_result, install_result, error, timer=None):
+    """保存执行失败的设备结果"""
+    device_result.status = 'failed'
+    device_result.end_time = timezone.now()
+    device_result.error_message = str(error)
+    result_data = {}
+    if install_result is not None:
+        result_data['install_result'] = install_result
+        result_data['install_timing'] = install_result.get('timing', {})
+    if timer is not None:
+        result_data['stage_timing'] = timer.timing
+    fields = ['status', 'end_time', 'error_message']
+    if result_data:
+        device_result.result_data = result_data
+        fields.append('result_data')
+    save_device_result(device_result, fields)
+
+
+def save_device_result(device_result, fields):
+    """只写入结束时变化的字段；设备已被取消时保存为取消状态"""
+    if device_cancelled(device_result):
+        device_result.status = 'cancelled'
+        device_result.error_message = CANCEL_MESSAGE
+        if 'error_message' not in fields:
+            fields = fields + ['error_message']
+    run_write(device_result.save, update_fields=fields + ['updated_time'])
+
+
+def execute_task(task_id, device_ids=None):
+    """
+    执行任务中的设备作业（阻塞直到这些设备执行完毕）
+
+    device_ids为本worker领取的设备，为空时执行任务的全部设备；任务的设备分布在
+    多台主机时，最后一个执行完毕的worker汇总所有设备结果并结束任务
+    """
+    try:
+        task = Task.objects.get(id=task_id)
+    except Task.DoesNotExist:
+        return
+
+    # 添加调试信息
+    print(f"[DEBUG] 开始执行任务 {task_id}: {task.name}")
+
+    # 更新任务状态为运行中（由worker领取的任务在领取时已更新）
+    if task.status == 'pending':
+        task.status = 'running'
+        task.start_time = task.start_time or timezone.now()
+        Task.objects.filter(id=task.id, status='pending').update(
+            status='running', start_time=task.start_time, updated_time=timezone.now())
+
+    # 获取任务详情
+    test_case = task.test_case
+    devices = task.devices if device_ids is None else list(device_ids)
+    app_file = task.app_file
+    platform = task.platform
+
+    # 引用缓存构建的任务，安装前可比对设备上已安装的版本
+    build = get_build(task.apk_sha256) if task.apk_sha256 else None
+    if build is not None:
+        touch(build)
+        app_file = build.file_path
+
+    # 准备阶段：确定脚本运行器并准备脚本，ZIP项目在分发到各设备前解压一次
+    prepared = prepare_script(test_case, platform)
+    if prepared.error:
+        print(f"[DEBUG] 准备测试脚本失败: {prepared.error}")
+
+    print(f"[DEBUG] 任务详情: 设备={devices}, 平台={platform}, 脚本={test_case.file_path}")
+    print(f"[DEBUG] APK文件路径: {app_file}")
+    print(f"[DEBUG] APK文件是否存在: {os.path.exists(app_file) if app_file else 'None'}")
+
+    # 使用提交任务（或自动分配设备）时创建的设备执行记录，缺少时补建
+    existing = {}
+    for device_result in TaskDeviceResult.objects.filter(task=task, device_id__in=devices).order_by('id'):
+        existing.setdefault(device_result.device_id, device_result)
+    created = TaskDeviceResult.objects.bulk_create([
+        TaskDeviceResult(task=task, device_id=device_id, device_name=f"Device ({device_id[:8]}...)",
+                         status='pending')
+        for device_id in dict.fromkeys(devices) if device_id not in existing
+    ])
+    existing.update({device_result.device_id: device_result for device_result in created})
+    device_results = {device_id: existing[device_id] for device_id in dict.fromkeys(devices)}
+
+    # 进度和事件按间隔批量写入，设备或任务结束时立即写入
+    reporter = ProgressReporter(task, task.devices or devices)
+    reporter.start()
+
+    try:
+        reporter.task_started()
+
+        now = timezone.now()
+        TaskDeviceResult.objects.filter(id__in=[r.id for r in device_results.values()], status='pending').update(
+            status='running', start_time=now, updated_time=now)
+        for device_result in device_results.values():
+            device_result.status = 'running'
+            device_result.start_time = now
+
+        # 为每个设备执行任务
+        def run_device(item):
+            device_id, device_result = item
+            try:
+                with device_run(task.id, device_id):
+                    run_device_pipeline(device_id, device_result)
+            finally:
+                # 设备执行完毕立即释放，其他任务无需等待本任务的其余设备
+                run_write(release_devices, task.id, [device_id])
+
+        def run_device_pipeline(device_id, device_result):
+            reporter.device_started(device_id)
+            install_result = None
+            timer = prepared.start_timer()
+            try:
+                # 1. 准备（任务级，已在分发前完成）
+                if prepared.error:
+                    raise Exception(prepared.error)
+                if is_cancelled(task.id, device_id):
+                    raise Exception(CANCEL_MESSAGE)
+
+                # 2. 安装APK
+                with timer.stage('install'):
+                    install_result = install_apk(device_id, app_file, platform, build=build)
+                reporter.install_done(device_id, install_result)
+                if not install_result['success']:
+                    raise Exception(f"APK安装失败: {install_result['error']}")
+
+                # 3. 执行测试脚本（每台设备使用独立的日志目录，执行中即可查看实时输出）
+                if is_cancelled(task.id, device_id):
+                    raise Exception(CANCEL_MESSAGE)
+                with timer.stage('run'):
+                    log_dir = start_script_run(task, device_result)
+                    execute_result = execute_test_script(
+                        device_id, prepared, log_dir,
+                        on_step=lambda step, name: reporter.script_step(device_id, step, name=name))
+
+                # 4. 收集执行日志并更新设备结果
+                finish_device_result(device_result, install_result, execute_result, timer)
+
+            except Exception as e:
+                fail_device_result(device_result, install_result, e, timer)
+
+            reporter.device_finished(device_id, device_result.status)
+
+        # 多台设备并行执行，任务耗时取决于最慢的设备
+        per_task_limit = get_per_task_limit(len(device_results))
+        if get_engine_name() == 'asyncio':
+            from .async_engine import get_async_engine
+            get_async_engine().run_task(task, prepared, device_results, app_file, build,
+                                        reporter, per_task_limit)
+        else:
+            get_executor().run_all(device_results.items(), run_device, per_task_limit=per_task_limit)
+
+        # 检查所有设备的执行结果，决定任务最终状态
+        finished = finish_task(task, reporter)
+
+        # 删除APK文件（缓存中的构建由安装包缓存按配额淘汰）
+        if finished and not task.apk_sha256:
+            try:
+                if os.path.exists(app_file):
+                    os.remove(app_file)
+            except:
+                pass
+
+    except Exception as e:
+        # 更新任务状态为失败
+        task.status = 'failed'
+        task.end_time = timezone.now()
+        task.error_message = str(e)
+        Task.objects.filter(id=task.id).update(status=task.status, end_time=task.end_time,
+                                               error_message=task.error_message, updated_time=task.end_time)
+        reporter.task_finished()
+    finally:
+        reporter.close()
+        clear_cancellation(task.id)
+        release_devices(task.id, devices)
+
+
+def finish_task(task, reporter=None) -> bool:
+    """
+    汇总任务所有设备的执行结果，决定任务最终状态
+
+    其他主机仍有设备未执行完毕时不结束任务，返回False；
+    多个worker同时执行完毕（或取消最后一台未完成的设备）时只有一个能结束任务；
+    reporter为空时直接写入任务结束事件
+    """
+    results = TaskDeviceResult.objects.filter(task_id=task.id)
+    if results.filter(status__in=['pending', 'running']).exists():
+        return False
+    failed_count = results.filter(status='failed').count()
+
+    # 任务被取消时保留取消状态；如果有设备失败，任务状态为失败；否则为成功
+    if is_cancelled(task.id) or Task.objects.filter(id=task.id, status='cancelled').exists():
+        task.status = 'cancelled'
+        task.error_message = CANCEL_MESSAGE
+    elif failed_count > 0:
+        task.status = 'failed'
+        task.error_message = f"有 {failed_count} 个设备执行失败"
+    else:
+        task.status = 'success'
+
+    task.end_time = timezone.now()
+    task.progress = 100
+    tasks = Task.objects.filter(id=task.id)
+    if task.status != 'cancelled':
+        tasks = tasks.filter(status__in=['pending', 'running'])
+    if not tasks.update(status=task.status, error_message=task.error_message, end_time=task.end_time,
+                        progress=task.progress, updated_time=task.end_time):
+        return False
+    if reporter is not None:
+        reporter.task_finished()
+    else:
+        record_event(task, 'task_finished')
+    return True
+
+
+def execute_test_script(device_id, prepared, log_dir=None, on_step=None):
+    """
+    执行测试脚本
+
+    prepared为prepare_script准备好的脚本；log_dir为本次执行的日志目录，未指定时单独创建一个；
+    on_step(step, name)在脚本每完成一个步骤时调用
+    """
+    if log_dir is None:
+        log_dir = get_run_log_dir(None, f"{device_id}_{int(time.time())}")
+    try:
+        cmd = prepared.build_command(device_id, log_dir)
+        print(f"[DEBUG] {prepared.runner.name} 命令: {' '.join(cmd)}")
+
+        result = run_streaming_process(cmd, log_dir, timeout=get_stage_timeout('run'), cwd=prepared.cwd,
+                                       on_step=on_step)
+        print(f"[DEBUG] 脚本执行结果: {result.returncode}")
+        if result.stderr:
+            print(f"[DEBUG] 脚本错误输出: {result.stderr}")
+        return prepared.check_result(result, log_dir)
+
+    except subprocess.TimeoutExpired:
+        return {'success': False, 'error': '执行超时'}
+    except Exception as e:
+        print(f"[DEBUG] 执行脚本异常: {str(e)}")
+        return {'success': False, 'error': str(e)}
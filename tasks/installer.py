@@ -0,0 +1,197 @@
+"""
+安装阶段模块
+线程引擎和asyncio引擎共用的APK安装流程：设备已安装相同包名和versionCode的构建时跳过，
+否则按APK_INSTALL_MODE安装；本机同时安装的设备数受APK_INSTALL_FANOUT限制，
+整个阶段（检查版本、等待安装名额、安装）受TASK_STAGE_TIMEOUTS['install']限制。
+安装流程（InstallPlan）只描述要执行的adb命令，线程引擎用阻塞的子进程执行，
+asyncio引擎在事件循环中用异步子进程执行
+"""
+
+import os
+import re
+import subprocess
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+from .cancellation import run_tracked
+from .runners import get_stage_timeout
+from Automation_Platform.toolchain import tool_path
+
+logger = logging.getLogger(__name__)
+
+# 设备上复用已推送安装包的目录
+REMOTE_APK_DIR = '/data/local/tmp'
+
+_install_slots = None
+_install_slots_lock = threading.Lock()
+
+
+def get_install_slots() -> threading.BoundedSemaphore:
+    """本机同时安装的设备数上限（受USB Hub带宽限制）"""
+    global _install_slots
+    with _install_slots_lock:
+        if _install_slots is None:
+            _install_slots = threading.BoundedSemaphore(getattr(settings, 'APK_INSTALL_FANOUT', 4))
+        return _install_slots
+
+
+class StageDeadline:
+    """阶段截止时间，阶段内每条命令的超时不超过剩余时间"""
+
+    def __init__(self, timeout: float):
+        self.cmd = ['install']
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+
+    def remaining(self, limit: Optional[float] = None) -> float:
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired(self.cmd, self.timeout)
+        return remaining if limit is None else min(limit, remaining)
+
+
+def adb_command(device_id: str, args: List[str]) -> List[str]:
+    return [tool_path('adb'), '-s', device_id] + args
+
+
+def run_adb(device_id: str, args: List[str], timeout: float) -> subprocess.CompletedProcess:
+    """执行adb命令（取消设备时会被结束）"""
+    return run_tracked(adb_command(device_id, args), timeout)
+
+
+def parse_version_code(dumpsys_output: str) -> Optional[int]:
+    match = re.search(r'versionCode=(\d+)', dumpsys_output)
+    return int(match.group(1)) if match else None
+
+
+# 安装流程产生的步骤：执行adb命令，或等待本机的安装名额
+ADB_STEP = 'adb'
+SLOT_STEP = 'slot'
+
+
+class InstallPlan:
+    """
+    单台设备的安装流程，与命令的执行方式无关
+
+    steps()是生成器：产生 (ADB_STEP, adb参数, 超时) 时由调用方执行命令并把结果send回来，
+    产生 (SLOT_STEP, 超时) 时由调用方获取安装名额（安装结束或失败后释放），最终返回安装结果；
+    线程引擎（install_apk）和asyncio引擎分别驱动同一个流程
+    """
+
+    def __init__(self, apk_file_path: str, build=None):
+        self.apk_file_path = apk_file_path
+        self.build = build
+        self.mode = getattr(settings, 'APK_INSTALL_MODE', 'streamed')
+        self.timeout = getattr(settings, 'APK_INSTALL_TIMEOUT', 60)
+        self.deadline = StageDeadline(get_stage_timeout('install'))
+        self.timing = {}
+        self.started = time.monotonic()
+
+    def steps(self):
+        build = self.build
+        timing = self.timing
+        if build is not None and build.package_name and build.version_code is not None:
+            check = yield ADB_STEP, ['shell', 'dumpsys', 'package', build.package_name], self.deadline.remaining(10)
+            installed = parse_version_code(check.stdout) if check.returncode == 0 else None
+            timing['check'] = round(time.monotonic() - self.started, 3)
+            if installed == build.version_code:
+                timing['total'] = timing['check']
+                return {
+                    'success': True,
+                    'skipped': True,
+                    'output': f"设备已安装 {build.package_name} ({build.version_code})，跳过安装",
+                    'timing': timing
+                }
+
+        wait_started = time.monotonic()
+        yield SLOT_STEP, self.deadline.remaining()
+        timing['wait'] = round(time.monotonic() - wait_started, 3)
+        if self.mode == 'push':
+            result = yield from self._push_and_install()
+        else:
+            install_started = time.monotonic()
+            args = ['install', '-r']
+            if self.mode == 'streamed':
+                args.append('--streaming')
+            result = yield ADB_STEP, args + [self.apk_file_path], self.deadline.remaining(self.timeout)
+            if result.returncode != 0 and self.mode == 'streamed':
+                # 旧版本系统不支持流式安装
+                result = yield (ADB_STEP, ['install', '-r', self.apk_file_path],
+                                self.deadline.remaining(self.timeout))
+            timing['install'] = round(time.monotonic() - install_started, 3)
+
+        timing['total'] = round(time.monotonic() - self.started, 3)
+        if result.returncode == 0 and 'Failure' not in result.stdout:
+            return {'success': True, 'output': result.stdout, 'mode': self.mode, 'timing': timing}
+        return {'success': False, 'error': result.stderr or result.stdout, 'mode': self.mode, 'timing': timing}
+
+    def _push_and_install(self):
+        """推送安装包到设备后用pm install安装，设备上已有相同文件时跳过推送"""
+        build = self.build
+        remote_name = f"{build.sha256}.apk" if build is not None else os.path.basename(self.apk_file_path)
+        remote_path = f"{REMOTE_APK_DIR}/{remote_name}"
+
+        push_started = time.monotonic()
+        stat = yield ADB_STEP, ['shell', 'stat', '-c', '%s', remote_path], self.deadline.remaining(10)
+        if stat.returncode == 0 and stat.stdout.strip() == str(os.path.getsize(self.apk_file_path)):
+            self.timing['push_reused'] = True
+        else:
+            push = yield ADB_STEP, ['push', self.apk_file_path, remote_path], self.deadline.remaining(self.timeout)
+            if push.returncode != 0:
+                self.timing['push'] = round(time.monotonic() - push_started, 3)
+                return push
+        self.timing['push'] = round(time.monotonic() - push_started, 3)
+
+        install_started = time.monotonic()
+        result = yield (ADB_STEP, ['shell', 'pm', 'install', '-r', remote_path],
+                        self.deadline.remaining(self.timeout))
+        self.timing['install'] = round(time.monotonic() - install_started, 3)
+        return result
+
+    def failed(self, error: Exception) -> Dict[str, Any]:
+        """安装过程中出现异常（包括超过阶段超时）时的安装结果"""
+        self.timing['total'] = round(time.monotonic() - self.started, 3)
+        message = '安装超时' if isinstance(error, subprocess.TimeoutExpired) else str(error)
+        return {'success': False, 'error': message, 'timing': self.timing}
+
+
+def install_apk(device_id, apk_file_path, platform, build=None) -> Dict[str, Any]:
+    """
+    安装APK到设备（设备已安装相同包名和versionCode的构建时跳过）
+
+    安装方式由APK_INSTALL_MODE决定：
+        install   adb install
+        streamed  adb install --streaming，边传输边安装，失败时退回adb install
+        push      先推送到设备（已推送过相同文件时复用），再用pm install安装
+    返回结果中的timing记录各阶段耗时（秒）
+    """
+    if platform != 'android':
+        # iOS设备暂不支持
+        return {'success': False, 'error': 'iOS设备暂不支持'}
+
+    plan = InstallPlan(apk_file_path, build)
+    steps = plan.steps()
+    slots = get_install_slots()
+    holding = False
+    try:
+        step = next(steps)
+        while True:
+            if step[0] == SLOT_STEP:
+                if not slots.acquire(timeout=step[1]):
+                    raise subprocess.TimeoutExpired(plan.deadline.cmd, plan.deadline.timeout)
+                holding = True
+                step = steps.send(None)
+            else:
+                step = steps.send(run_adb(device_id, step[1], step[2]))
+    except StopIteration as stop:
+        return stop.value
+    except Exception as e:
+        return plan.failed(e)
+    finally:
+        steps.close()
+        if holding:
+            slots.release()
@@ -0,0 +1,182 @@
+"""
+脚本实时输出模块
+逐行读取airtest run的stdout/stderr，写入每次执行独立的滚动日志文件，
+执行结果中只保留有限长度的尾部输出；Web进程通过读取日志文件末尾提供实时输出接口
+"""
+
+import os
+import signal
+import subprocess
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+
+from .airtest_log import LogFollower
+from .cancellation import register_process, unregister_process
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FILE_NAME = 'output.log'
+
+# 执行结果中保留的stdout/stderr尾部行数
+RESULT_TAIL_LINES = 100
+
+# 实时输出接口一次最多返回的行数
+MAX_TAIL_LINES = 500
+
+# 读取尾部输出时从文件末尾读取的最大字节数
+TAIL_READ_BYTES = 256 * 1024
+
+
+class RotatingOutputFile:
+    """按大小滚动的输出文件（output.log 写满后依次改名为 output.log.1、output.log.2 ...）"""
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._size = self._file.tell()
+
+    def write_line(self, line: str):
+        data = line if line.endswith('\n') else line + '\n'
+        with self._lock:
+            if self.max_bytes and self._size >= self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            # 逐行刷新，其他进程读取尾部时能立即看到
+            self._file.flush()
+            self._size = self._file.tell()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._size = 0
+
+
+def popen_in_new_group(cmd: List[str], cwd: Optional[str] = None, **kwargs) -> subprocess.Popen:
+    """启动子进程并读取文本输出；子进程在独立的进程组中运行，超时或取消时连同其启动的子进程一起结束"""
+    return subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, encoding='utf-8', errors='ignore',
+                            start_new_session=(os.name != 'nt'), **kwargs)
+
+
+def run_streaming_process(cmd: List[str], log_dir: str, timeout: float, cwd: Optional[str] = None,
+                          on_step: Optional[Callable[[int, str], None]] = None) -> subprocess.CompletedProcess:
+    """
+    执行命令并实时读取输出
+
+    stdout/stderr逐行写入log_dir下的output.log（stderr行带[stderr]前缀），
+    返回的CompletedProcess中stdout/stderr只包含最后RESULT_TAIL_LINES行；
+    on_step(step, name)在Airtest每完成一个顶层步骤时调用；超时抛出subprocess.TimeoutExpired
+    """
+    output = RotatingOutputFile(
+        os.path.join(log_dir, OUTPUT_FILE_NAME),
+        max_bytes=getattr(settings, 'SCRIPT_OUTPUT_MAX_BYTES', 5 * 1024 * 1024),
+        backup_count=getattr(settings, 'SCRIPT_OUTPUT_BACKUP_COUNT', 2),
+    )
+    tails = {'stdout': deque(maxlen=RESULT_TAIL_LINES), 'stderr': deque(maxlen=RESULT_TAIL_LINES)}
+
+    process = popen_in_new_group(cmd, cwd=cwd, bufsize=1)
+    key = register_process(process)
+
+    def read_stream(name, stream):
+        prefix = '[stderr] ' if name == 'stderr' else ''
+        for line in stream:
+            tails[name].append(line.rstrip('\n'))
+            output.write_line(prefix + line)
+        stream.close()
+
+    readers = [threading.Thread(target=read_stream, args=(name, getattr(process, name)), daemon=True)
+               for name in ('stdout', 'stderr')]
+    for reader in readers:
+        reader.start()
+
+    follower = LogFollower(log_dir) if on_step else None
+    step = 0
+    deadline = time.monotonic() + timeout
+    interval = getattr(settings, 'SCRIPT_STEP_POLL_INTERVAL', 1.0)
+    try:
+        while True:
+            try:
+                process.wait(timeout=min(interval, max(deadline - time.monotonic(), 0)))
+                break
+            except subprocess.TimeoutExpired:
+                if time.monotonic() >= deadline:
+                    kill_process_tree(process)
+                    process.wait()
+                    raise subprocess.TimeoutExpired(cmd, timeout, output='\n'.join(tails['stdout']),
+                                                    stderr='\n'.join(tails['stderr']))
+            finally:
+                if follower is not None:
+                    for entry in follower.poll():
+                        if entry.get('depth') == 1:
+                            step += 1
+                            on_step(step, (entry.get('data') or {}).get('name', ''))
+    finally:
+        unregister_process(key, process)
+        for reader in readers:
+            reader.join(timeout=5)
+        output.close()
+        if follower is not None:
+            follower.close()
+
+    return subprocess.CompletedProcess(cmd, process.returncode,
+                                       stdout='\n'.join(tails['stdout']),
+                                       stderr='\n'.join(tails['stderr']))
+
+
+def kill_process_tree(process):
+    """结束进程及其子进程（支持subprocess.Popen和asyncio的Process）"""
+    if process.returncode is not None:
+        return
+    try:
+        if os.name == 'nt':
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)], capture_output=True)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+
+def read_output_tail(log_dir: str, lines: int = 100) -> Dict[str, Any]:
+    """读取执行输出的最后若干行（只读取文件末尾，与输出总量无关）"""
+    lines = max(1, min(lines, MAX_TAIL_LINES))
+    path = os.path.join(log_dir, OUTPUT_FILE_NAME)
+    if not log_dir or not os.path.exists(path):
+        return {'lines': [], 'size': 0, 'last_output_time': None}
+
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.seek(max(size - TAIL_READ_BYTES, 0))
+        data = f.read()
+    text = data.decode('utf-8', errors='ignore').splitlines()
+    if size > TAIL_READ_BYTES and text:
+        # 第一行可能只读到一半
+        text = text[1:]
+
+    return {
+        'lines': text[-lines:],
+        'size': size,
+        'last_output_time': os.path.getmtime(path),
+    }
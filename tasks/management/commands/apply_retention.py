@@ -0,0 +1,59 @@
+"""
+数据保留命令
+归档过期的已结束任务，清理过期的任务事件、截图和执行日志，建议每天定时执行一次
+
+    python manage.py apply_retention --dry-run
+    0 3 * * * cd /path/to/Automation_Platform && python manage.py apply_retention --vacuum
+
+各项保留期限默认读取settings（TASK_RETENTION_DAYS等），可用参数覆盖
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from tasks.retention import RetentionEngine
+
+
+class Command(BaseCommand):
+    help = '归档过期任务，清理过期的任务事件、截图和执行日志'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='归档结束超过指定天数的任务')
+        parser.add_argument('--event-hours', type=int, help='删除已结束任务超过指定小时数的进度事件')
+        parser.add_argument('--screenshot-days', type=int, help='删除超过指定天数的截图')
+        parser.add_argument('--log-days', type=int, help='删除超过指定天数的执行日志目录')
+        parser.add_argument('--log-quota-mb', type=int, help='执行日志目录的总大小配额（MB）')
+        parser.add_argument('--batch-size', type=int, default=500, help='每个归档文件包含的任务数')
+        parser.add_argument('--dry-run', action='store_true', help='只统计将要清理的数据，不做修改')
+        parser.add_argument('--vacuum', action='store_true', help='清理后回收数据库空间（SQLite VACUUM）')
+
+    def handle(self, *args, **options):
+        engine = RetentionEngine(
+            task_days=options['days'],
+            event_hours=options['event_hours'],
+            screenshot_days=options['screenshot_days'],
+            log_days=options['log_days'],
+            log_max_bytes=options['log_quota_mb'] * 1024 * 1024 if options['log_quota_mb'] is not None else None,
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        stats = engine.run()
+
+        prefix = '[dry-run] 将' if options['dry_run'] else ''
+        self.stdout.write(f"{prefix}归档任务: {stats['archived_tasks']}")
+        self.stdout.write(f"{prefix}删除任务事件: {stats['deleted_events']}")
+        self.stdout.write(f"{prefix}删除截图: {stats['deleted_screenshots']}")
+        self.stdout.write(f"{prefix}删除执行日志目录: {stats['deleted_log_dirs']}")
+        self.stdout.write(f"{prefix}释放磁盘空间: {stats['freed_bytes'] / 1024 / 1024:.1f} MB")
+
+        if options['vacuum'] and not options['dry_run']:
+            self.vacuum()
+
+    def vacuum(self):
+        """SQLite删除数据后不会缩小数据库文件，需要VACUUM；PostgreSQL由autovacuum回收，这里只更新统计信息"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('VACUUM')
+            elif connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE')
+        self.stdout.write(f"数据库维护完成（{connection.vendor}）")
@@ -0,0 +1,71 @@
+"""
+设备代理命令
+在连接测试设备的主机上运行：定期上报本机设备，领取位于本机的设备作业并执行，
+执行所需的安装包和测试脚本不在本机时从中心服务器下载。代理与Web服务使用同一个数据库
+
+    AGENT_TOKEN=<令牌> python manage.py run_agent --name lab-01 --server http://192.168.1.10:8000
+
+同一台机器可以启动多个代理模拟多台主机，各代理使用不同的名称和adb server端口：
+
+    python manage.py run_agent --name stand-in-1 --adb-port 5038
+"""
+
+import os
+import socket
+
+from django.conf import settings
+from django.db import connections
+
+from tasks.agent import DeviceReporter, fetch_task_artifacts
+from tasks.models import Task
+from .run_worker import Command as WorkerCommand
+
+
+class Command(WorkerCommand):
+    help = '启动设备代理，上报本机设备并执行分配到本机设备的任务'
+
+    # 代理由DeviceReporter上报本机设备，不运行设备注册表的后台刷新
+    role = 'agent'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--name', default=socket.gethostname(),
+                            help='代理名称（主机标识），默认为主机名')
+        parser.add_argument('--server', default=getattr(settings, 'AGENT_SERVER_URL', ''),
+                            help='中心服务器地址，本机缺少任务文件时从该地址下载')
+        parser.add_argument('--token', default=getattr(settings, 'AGENT_TOKEN', ''),
+                            help='下载任务文件使用的代理令牌，需与中心服务器的AGENT_TOKEN一致')
+        parser.add_argument('--adb-port', type=int,
+                            help='本代理使用的adb server端口（同一台机器运行多个代理时使用）')
+        parser.add_argument('--report-interval', type=float,
+                            default=getattr(settings, 'DEVICE_REGISTRY_TTL', 15),
+                            help='设备上报间隔（秒）')
+
+    def handle(self, *args, **options):
+        self.host = options['name']
+        self.server = options['server']
+        self.token = options['token']
+        if options['adb_port']:
+            os.environ['ANDROID_ADB_SERVER_PORT'] = str(options['adb_port'])
+
+        # 先上报一次设备，之后由后台线程定期上报
+        reporter = DeviceReporter(self.host, options['report_interval'])
+        count = reporter.report()
+        connections.close_all()
+        self.stdout.write(f"代理 {self.host} 上报 {count} 台设备")
+        reporter.start()
+
+        try:
+            super().handle(*args, **options)
+        finally:
+            reporter.stop()
+
+    def run_job(self, task_id, device_ids):
+        if self.server:
+            try:
+                task = Task.objects.select_related('test_case').get(id=task_id)
+                fetch_task_artifacts(task, self.server, self.token)
+            except Exception as e:
+                # 仍然执行，设备因缺少文件失败并记录原因，任务可正常结束
+                self.stderr.write(f"下载任务 {task_id} 的文件失败: {e}")
+        super().run_job(task_id, device_ids)
@@ -0,0 +1,153 @@
+"""
+任务worker命令
+从数据库队列中领取等待中的任务并执行，可在一台或多台主机上同时启动多个进程
+
+    python manage.py run_worker --concurrency 2
+"""
+
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from tasks.executor import execute_task
+from tasks.cancellation import poll_cancellations
+from Automation_Platform.toolchain import probe_toolchain, get_required_tools
+from cases.device_registry import set_process_role
+from tasks.queue import get_worker_id, claim_next_job, heartbeat, requeue_stale_tasks
+
+
+class Command(BaseCommand):
+    help = '启动任务worker，从队列中领取并执行等待中的任务'
+
+    # worker所在主机，只领取位于该主机的设备（空字符串为本机，即Web服务所在主机）
+    host = ''
+
+    # 进程角色，决定是否由本进程检测本机设备（见DEVICE_REGISTRY_REFRESH_ROLE）
+    role = 'worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2,
+                            help='同时执行的任务数（设备并发仍受TASK_MAX_CONCURRENT_DEVICES限制）')
+        parser.add_argument('--poll-interval', type=float,
+                            default=getattr(settings, 'TASK_WORKER_POLL_INTERVAL', 2),
+                            help='队列为空时的轮询间隔（秒）')
+        parser.add_argument('--burst', action='store_true',
+                            help='队列清空且任务执行完毕后退出')
+
+    def handle(self, *args, **options):
+        self.worker_id = get_worker_id(self.host)
+        self.concurrency = max(1, options['concurrency'])
+        self.poll_interval = options['poll_interval']
+        self.stopping = threading.Event()
+        self.active = {}
+        self.active_lock = threading.Lock()
+
+        # 启动时解析一次工具链，执行设备时直接使用缓存的路径
+        self._check_toolchain()
+        set_process_role(self.role)
+
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGTERM, self._request_stop)
+
+        self.stdout.write(f"worker {self.worker_id} 已启动，并发任务数: {self.concurrency}")
+
+        heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        heartbeat_thread.start()
+
+        # 失效任务的检查间隔比轮询间隔长，空闲的worker不会在每次轮询时查询失效任务
+        sweep_interval = getattr(settings, 'TASK_STALE_SWEEP_INTERVAL', 30)
+        next_sweep = 0.0
+        while not self.stopping.is_set():
+            if time.monotonic() >= next_sweep:
+                requeue_stale_tasks()
+                next_sweep = time.monotonic() + sweep_interval
+
+            job = None
+            if self._active_count() < self.concurrency:
+                with self.active_lock:
+                    running = list(self.active)
+                job = claim_next_job(self.worker_id, self.host, exclude=running)
+
+            if job is not None:
+                self._start(*job)
+                continue
+
+            if options['burst'] and self._active_count() == 0:
+                break
+            self.stopping.wait(self.poll_interval)
+
+        # 等待正在执行的任务结束后退出
+        with self.active_lock:
+            threads = list(self.active.values())
+        for thread in threads:
+            thread.join()
+
+        self.stdout.write(f"worker {self.worker_id} 已退出")
+
+    def _check_toolchain(self):
+        tools = probe_toolchain(force=True)
+        self.stdout.write("工具链:")
+        for name, info in tools.items():
+            if info['available']:
+                self.stdout.write(f"  {name}: {info['path']} {info['version']}")
+            else:
+                self.stdout.write(f"  {name}: 不可用（{info['error']}）")
+        missing = [name for name in get_required_tools() if not tools.get(name, {}).get('available')]
+        if missing:
+            raise CommandError(f"以下工具不可用，无法执行任务: {', '.join(missing)}。"
+                               f"请安装或在TOOLCHAIN_PATHS中配置路径")
+
+    def _start(self, task, device_ids):
+        self.stdout.write(f"开始执行任务 {task.id}: {task.name} 设备: {', '.join(device_ids)}")
+        thread = threading.Thread(target=self._run, args=(task.id, device_ids), name=f"task-{task.id}")
+        with self.active_lock:
+            self.active[task.id] = thread
+        thread.start()
+
+    def _run(self, task_id, device_ids):
+        try:
+            self.run_job(task_id, device_ids)
+        except Exception as e:
+            self.stderr.write(f"任务 {task_id} 执行异常: {e}")
+        finally:
+            with self.active_lock:
+                self.active.pop(task_id, None)
+            connections.close_all()
+            self.stdout.write(f"任务 {task_id} 执行结束")
+
+    def run_job(self, task_id, device_ids):
+        execute_task(task_id, device_ids)
+
+    def _active_count(self):
+        with self.active_lock:
+            return len(self.active)
+
+    def _heartbeat_loop(self):
+        """定期更新心跳，并检查正在执行的任务是否被取消"""
+        interval = getattr(settings, 'TASK_WORKER_HEARTBEAT_INTERVAL', 10)
+        cancel_interval = getattr(settings, 'TASK_CANCEL_POLL_INTERVAL', 1)
+        last_heartbeat = time.monotonic()
+        while True:
+            time.sleep(cancel_interval)
+            with self.active_lock:
+                task_ids = list(self.active)
+            try:
+                cancelled = poll_cancellations(task_ids)
+                if cancelled:
+                    self.stdout.write(f"收到 {cancelled} 个取消请求")
+                if time.monotonic() - last_heartbeat >= interval:
+                    last_heartbeat = time.monotonic()
+                    heartbeat(self.worker_id, task_ids)
+            except Exception as e:
+                self.stderr.write(f"心跳更新失败: {e}")
+            finally:
+                connections.close_all()
+
+    def _request_stop(self, signum, frame):
+        if not self.stopping.is_set():
+            self.stdout.write('收到退出信号，等待当前任务执行完毕...')
+        self.stopping.set()
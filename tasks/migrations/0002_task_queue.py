@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='claimed_time',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='领取时间'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='heartbeat_time',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='心跳时间'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='worker',
+            field=models.CharField(blank=True, max_length=255, verbose_name='执行节点'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0003_updated_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(blank=True, max_length=100, verbose_name='设备ID')),
+                ('event_type', models.CharField(choices=[('task_started', '任务开始'), ('device_started', '设备开始'), ('install_done', '安装完成'), ('script_step', '脚本步骤'), ('device_finished', '设备完成'), ('task_finished', '任务完成')], max_length=20, verbose_name='事件类型')),
+                ('data', models.JSONField(blank=True, default=dict, verbose_name='事件数据')),
+                ('created_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='tasks.task', verbose_name='任务')),
+            ],
+            options={
+                'verbose_name': '任务事件',
+                'verbose_name_plural': '任务事件',
+                'ordering': ['id'],
+            },
+        ),
+    ]
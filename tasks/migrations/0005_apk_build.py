@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0004_task_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApkBuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA256')),
+                ('file_path', models.CharField(max_length=500, verbose_name='文件路径')),
+                ('file_size', models.BigIntegerField(verbose_name='文件大小(字节)')),
+                ('original_name', models.CharField(max_length=255, verbose_name='原始文件名')),
+                ('package_name', models.CharField(blank=True, max_length=255, verbose_name='包名')),
+                ('version_code', models.BigIntegerField(blank=True, null=True, verbose_name='版本号')),
+                ('version_name', models.CharField(blank=True, max_length=100, verbose_name='版本名称')),
+                ('created_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('last_used_time', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='最后使用时间')),
+            ],
+            options={
+                'verbose_name': '安装包缓存',
+                'verbose_name_plural': '安装包缓存',
+                'ordering': ['-last_used_time'],
+            },
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='apk_sha256',
+            field=models.CharField(blank=True, max_length=64, verbose_name='安装包SHA256'),
+        ),
+    ]
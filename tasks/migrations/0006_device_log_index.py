@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0005_apk_build'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskdeviceresult',
+            name='log_dir',
+            field=models.CharField(blank=True, default='', max_length=500, verbose_name='日志目录'),
+        ),
+        migrations.AddField(
+            model_name='taskdeviceresult',
+            name='log_index',
+            field=models.JSONField(blank=True, default=dict, verbose_name='日志索引'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:13
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0006_device_log_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='device_filter',
+            field=models.JSONField(blank=True, default=dict, verbose_name='设备筛选条件'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='requested_devices',
+            field=models.PositiveIntegerField(default=0, verbose_name='自动分配设备数'),
+        ),
+        migrations.CreateModel(
+            name='DeviceLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=100, unique=True, verbose_name='设备ID')),
+                ('worker', models.CharField(blank=True, max_length=255, verbose_name='执行节点')),
+                ('acquired_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='获取时间')),
+                ('heartbeat_time', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='心跳时间')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='device_leases', to='tasks.task', verbose_name='任务')),
+            ],
+            options={
+                'verbose_name': '设备租约',
+                'verbose_name_plural': '设备租约',
+                'ordering': ['device_id'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0007_device_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskdeviceresult',
+            name='worker',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='执行节点'),
+        ),
+    ]
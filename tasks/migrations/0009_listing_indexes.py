@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0008_device_job_worker'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'created_time'], name='task_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskdeviceresult',
+            index=models.Index(fields=['task', 'status'], name='result_task_status_idx'),
+        ),
+    ]
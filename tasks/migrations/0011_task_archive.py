@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0010_cursor_pagination_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.IntegerField(unique=True, verbose_name='任务ID')),
+                ('name', models.CharField(max_length=255, verbose_name='任务名称')),
+                ('test_case_name', models.CharField(max_length=255, verbose_name='测试用例')),
+                ('platform', models.CharField(max_length=10, verbose_name='平台')),
+                ('status', models.CharField(max_length=20, verbose_name='状态')),
+                ('device_count', models.IntegerField(default=0, verbose_name='设备数')),
+                ('success_count', models.IntegerField(default=0, verbose_name='成功设备数')),
+                ('failed_count', models.IntegerField(default=0, verbose_name='失败设备数')),
+                ('error_message', models.TextField(blank=True, verbose_name='错误信息')),
+                ('created_time', models.DateTimeField(verbose_name='创建时间')),
+                ('start_time', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('end_time', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+                ('archive_file', models.CharField(max_length=500, verbose_name='归档文件')),
+                ('archived_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='归档时间')),
+            ],
+            options={
+                'verbose_name': '任务归档',
+                'verbose_name_plural': '任务归档',
+                'ordering': ['-created_time'],
+                'indexes': [models.Index(fields=['created_time', 'id'], name='archive_created_id_idx')],
+            },
+        ),
+    ]
@@ -31,11 +31,24 @@ class Task(models.Model):
     end_time = models.DateTimeField(null=True, blank=True, verbose_name="结束时间")
     error_message = models.TextField(blank=True, verbose_name="错误信息")
     result_data = models.JSONField(default=dict, blank=True, verbose_name="结果数据")
+    worker = models.CharField(max_length=255, blank=True, verbose_name="执行节点")
+    claimed_time = models.DateTimeField(null=True, blank=True, verbose_name="领取时间")
+    heartbeat_time = models.DateTimeField(null=True, blank=True, verbose_name="心跳时间")
+    apk_sha256 = models.CharField(max_length=64, blank=True, verbose_name="安装包SHA256")
+    requested_devices = models.PositiveIntegerField(default=0, verbose_name="自动分配设备数")
+    device_filter = models.JSONField(default=dict, blank=True, verbose_name="设备筛选条件")
+    updated_time = models.DateTimeField(auto_now=True, db_index=True, verbose_name="更新时间")
 
     class Meta:
         verbose_name = "任务"
         verbose_name_plural = "任务"
         ordering = ['-created_time']
+        indexes = [
+            # 任务列表按状态筛选、按创建时间排序；队列按状态取最早创建的任务
+            models.Index(fields=['status', 'created_time'], name='task_status_created_idx'),
+            # 任务列表按(创建时间, id)游标分页
+            models.Index(fields=['created_time', 'id'], name='task_created_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -73,8 +86,10 @@ class Task(models.Model):
 
     @property
     def device_count(self):
-        """设备数量"""
-        return len(self.devices) if isinstance(self.devices, list) else 0
+        """设备数量（自动分配设备的任务在分配前为请求的设备数）"""
+        if isinstance(self.devices, list) and self.devices:
+            return len(self.devices)
+        return self.requested_devices
 
     def get_status_display(self):
         """获取状态显示"""
@@ -107,11 +122,138 @@ class TaskDeviceResult(models.Model):
     end_time = models.DateTimeField(null=True, blank=True, verbose_name="结束时间")
     error_message = models.TextField(blank=True, verbose_name="错误信息")
     result_data = models.JSONField(default=dict, blank=True, verbose_name="结果数据")
+    log_dir = models.CharField(max_length=500, blank=True, default='', verbose_name="日志目录")
+    log_index = models.JSONField(default=dict, blank=True, verbose_name="日志索引")
+    worker = models.CharField(max_length=255, blank=True, default='', verbose_name="执行节点")
+    updated_time = models.DateTimeField(auto_now=True, db_index=True, verbose_name="更新时间")
 
     class Meta:
         verbose_name = "任务设备结果"
         verbose_name_plural = "任务设备结果"
         ordering = ['device_id']
+        indexes = [
+            # 按任务统计各状态的设备数、查找任务中等待中的设备作业
+            models.Index(fields=['task', 'status'], name='result_task_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.task.name} - {self.device_name}"
+
+
+class DeviceLease(models.Model):
+    """设备租约模型（同一台设备同一时间只能被一个任务占用，device_id唯一保证互斥）"""
+
+    device_id = models.CharField(max_length=100, unique=True, verbose_name="设备ID")
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='device_leases', verbose_name="任务")
+    worker = models.CharField(max_length=255, blank=True, verbose_name="执行节点")
+    acquired_time = models.DateTimeField(default=timezone.now, verbose_name="获取时间")
+    heartbeat_time = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="心跳时间")
+
+    class Meta:
+        verbose_name = "设备租约"
+        verbose_name_plural = "设备租约"
+        ordering = ['device_id']
+
+    def __str__(self):
+        return f"{self.device_id} - {self.task_id}"
+
+
+class TaskEvent(models.Model):
+    """任务进度事件模型（执行器写入，Web进程读取后推送到浏览器）"""
+
+    EVENT_TYPE_CHOICES = [
+        ('task_started', '任务开始'),
+        ('device_started', '设备开始'),
+        ('install_done', '安装完成'),
+        ('script_step', '脚本步骤'),
+        ('device_finished', '设备完成'),
+        ('task_finished', '任务完成'),
+    ]
+
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='events', verbose_name="任务")
+    device_id = models.CharField(max_length=100, blank=True, verbose_name="设备ID")
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPE_CHOICES, verbose_name="事件类型")
+    data = models.JSONField(default=dict, blank=True, verbose_name="事件数据")
+    created_time = models.DateTimeField(default=timezone.now, verbose_name="创建时间")
+
+    class Meta:
+        verbose_name = "任务事件"
+        verbose_name_plural = "任务事件"
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.task_id} - {self.event_type}"
+
+    def to_dict(self):
+        """转换为推送给浏览器的事件格式"""
+        return {
+            "id": self.id,
+            "type": self.event_type,
+            "task_id": self.task_id,
+            "device_id": self.device_id,
+            "created_time": self.created_time.strftime('%Y/%m/%d %H:%M:%S'),
+            **self.data,
+        }
+
+
+class ApkBuild(models.Model):
+    """安装包缓存模型（按内容SHA256存储，同一构建只保存一份）"""
+
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name="SHA256")
+    file_path = models.CharField(max_length=500, verbose_name="文件路径")
+    file_size = models.BigIntegerField(verbose_name="文件大小(字节)")
+    original_name = models.CharField(max_length=255, verbose_name="原始文件名")
+    package_name = models.CharField(max_length=255, blank=True, verbose_name="包名")
+    version_code = models.BigIntegerField(null=True, blank=True, verbose_name="版本号")
+    version_name = models.CharField(max_length=100, blank=True, verbose_name="版本名称")
+    created_time = models.DateTimeField(default=timezone.now, verbose_name="创建时间")
+    last_used_time = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="最后使用时间")
+
+    class Meta:
+        verbose_name = "安装包缓存"
+        verbose_name_plural = "安装包缓存"
+        ordering = ['-last_used_time']
+
+    def __str__(self):
+        return f"{self.original_name} ({self.sha256[:12]})"
+
+    def to_dict(self):
+        return {
+            "sha256": self.sha256,
+            "original_name": self.original_name,
+            "package_name": self.package_name,
+            "version_code": self.version_code,
+            "version_name": self.version_name,
+            "file_size": self.file_size,
+            "last_used_time": self.last_used_time.strftime('%Y/%m/%d %H:%M:%S'),
+        }
+
+
+class TaskArchive(models.Model):
+    """已归档任务的摘要（任务及设备结果的完整数据压缩保存在归档文件中）"""
+
+    task_id = models.IntegerField(unique=True, verbose_name="任务ID")
+    name = models.CharField(max_length=255, verbose_name="任务名称")
+    test_case_name = models.CharField(max_length=255, verbose_name="测试用例")
+    platform = models.CharField(max_length=10, verbose_name="平台")
+    status = models.CharField(max_length=20, verbose_name="状态")
+    device_count = models.IntegerField(default=0, verbose_name="设备数")
+    success_count = models.IntegerField(default=0, verbose_name="成功设备数")
+    failed_count = models.IntegerField(default=0, verbose_name="失败设备数")
+    error_message = models.TextField(blank=True, verbose_name="错误信息")
+    created_time = models.DateTimeField(verbose_name="创建时间")
+    start_time = models.DateTimeField(null=True, blank=True, verbose_name="开始时间")
+    end_time = models.DateTimeField(null=True, blank=True, verbose_name="结束时间")
+    archive_file = models.CharField(max_length=500, verbose_name="归档文件")
+    archived_time = models.DateTimeField(default=timezone.now, verbose_name="归档时间")
+
+    class Meta:
+        verbose_name = "任务归档"
+        verbose_name_plural = "任务归档"
+        ordering = ['-created_time']
+        indexes = [
+            models.Index(fields=['created_time', 'id'], name='archive_created_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.task_id})"
@@ -0,0 +1,228 @@
+"""
+任务进度模块
+执行器通过ProgressReporter上报真实进度（设备开始、安装完成、脚本步骤、设备完成），
+事件写入TaskEvent表；Web进程中的TaskEventRelay读取新事件并发布到进程内事件代理，
+再由SSE接口推送到浏览器。执行器上报的进度和事件先写入缓冲区，按间隔批量写入数据库，
+避免大量设备并行时每个脚本步骤都单独写一次数据库
+"""
+
+import threading
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from Automation_Platform.events import broker
+from Automation_Platform.db_writer import run_write
+from .models import Task, TaskEvent
+
+logger = logging.getLogger(__name__)
+
+# 任务事件发布的主题
+TASK_EVENTS_TOPIC = 'tasks'
+
+# 各阶段对应的设备进度
+DEVICE_STAGE_PROGRESS = {
+    'started': 0.05,
+    'installed': 0.3,
+    'finished': 1.0,
+}
+
+# 立即写入数据库的事件（设备或任务结束），其余事件随缓冲区按间隔写入
+IMMEDIATE_EVENTS = ('device_finished', 'task_finished')
+
+
+class ProgressReporter:
+    """
+    任务进度上报器（同一任务的多个设备线程共享）
+
+    进度和事件先写入缓冲区，由后台线程每隔flush_interval秒批量写入（任务进度一次UPDATE，
+    事件一次bulk_create），设备或任务结束的事件立即写入；执行结束时调用close写入剩余内容
+    """
+
+    def __init__(self, task: Task, device_ids: Iterable[str], flush_interval: Optional[float] = None):
+        self.task = task
+        self.device_progress = {device_id: 0.0 for device_id in device_ids}
+        if flush_interval is None:
+            flush_interval = getattr(settings, 'TASK_PROGRESS_FLUSH_INTERVAL', 1.0)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._events: List[TaskEvent] = []
+        self._written_progress = task.progress
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动后台写入线程"""
+        if self.flush_interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'progress-{self.task.id}', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """停止后台写入线程并写入缓冲区中剩余的进度和事件"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def flush(self):
+        """将缓冲的任务进度和事件写入数据库"""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+                progress = self.task.progress
+            if progress > self._written_progress or events:
+                run_write(self._write, progress, events)
+
+    def _write(self, progress: int, events: List[TaskEvent]):
+        if progress > self._written_progress:
+            # 任务的设备分布在多台主机时各worker只知道本机设备的进度，进度只增不减
+            Task.objects.filter(id=self.task.id, progress__lt=progress).update(
+                progress=progress, updated_time=timezone.now())
+            self._written_progress = progress
+        if events:
+            TaskEvent.objects.bulk_create(events)
+
+    def task_started(self):
+        self._record('task_started')
+
+    def device_started(self, device_id: str):
+        self._update(device_id, DEVICE_STAGE_PROGRESS['started'])
+        self._record('device_started', device_id)
+
+    def install_done(self, device_id: str, install_result: Dict[str, Any]):
+        self._update(device_id, DEVICE_STAGE_PROGRESS['installed'])
+        self._record('install_done', device_id, success=install_result.get('success', False))
+
+    def script_step(self, device_id: str, step: int, total: Optional[int] = None, name: str = ''):
+        """脚本执行到第step步（total未知时进度按步数逐渐逼近）"""
+        installed = DEVICE_STAGE_PROGRESS['installed']
+        if total:
+            fraction = min(step / total, 1.0)
+        else:
+            fraction = step / (step + 10)
+        self._update(device_id, installed + (0.95 - installed) * fraction)
+        self._record('script_step', device_id, step=step, total=total, name=name)
+
+    def device_finished(self, device_id: str, status: str):
+        self._update(device_id, DEVICE_STAGE_PROGRESS['finished'])
+        self._record('device_finished', device_id, device_status=status)
+
+    def task_finished(self):
+        self._record('task_finished')
+
+    @property
+    def progress(self) -> int:
+        if not self.device_progress:
+            return self.task.progress
+        return int(100 * sum(self.device_progress.values()) / len(self.device_progress))
+
+    def _update(self, device_id: str, value: float):
+        """更新设备进度（写入缓冲区）"""
+        with self._lock:
+            self.device_progress[device_id] = max(self.device_progress.get(device_id, 0.0), value)
+            self.task.progress = max(self.task.progress, self.progress)
+
+    def _record(self, event_type: str, device_id: str = '', **data):
+        with self._lock:
+            self._events.append(build_event(self.task, event_type, device_id, **data))
+        if event_type in IMMEDIATE_EVENTS or self.flush_interval <= 0:
+            self.flush()
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"写入任务 {self.task.id} 的进度失败: {e}")
+            finally:
+                connections.close_all()
+
+
+def build_event(task: Task, event_type: str, device_id: str = '', **data) -> TaskEvent:
+    """构造任务事件（未保存），事件中附带任务当前状态的快照"""
+    data['task'] = {
+        'id': task.id,
+        'status': task.status,
+        'status_display': task.get_status_display(),
+        'progress': task.progress,
+        'runtime': task.runtime,
+    }
+    return TaskEvent(task_id=task.id, device_id=device_id, event_type=event_type, data=data)
+
+
+def record_event(task: Task, event_type: str, device_id: str = '', **data) -> TaskEvent:
+    """立即写入任务事件"""
+    event = build_event(task, event_type, device_id, **data)
+    event.save()
+    return event
+
+
+def get_events_after(last_id: int, task_id: Optional[int] = None, limit: int = 200) -> List[Dict[str, Any]]:
+    """获取指定事件ID之后的事件"""
+    events = TaskEvent.objects.filter(id__gt=last_id)
+    if task_id is not None:
+        events = events.filter(task_id=task_id)
+    return [event.to_dict() for event in events.order_by('id')[:limit]]
+
+
+def get_latest_event_id() -> int:
+    return TaskEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+class TaskEventRelay:
+    """任务事件转发器：有订阅者时轮询TaskEvent表并发布到进程内事件代理"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.last_id = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                self._wakeup.set()
+                return
+            self._thread = threading.Thread(target=self._run, name='task-event-relay', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                if broker.subscriber_count(TASK_EVENTS_TOPIC) == 0:
+                    # 没有浏览器订阅时不查询数据库，下次订阅时重新从最新事件开始
+                    self.last_id = None
+                    self._wakeup.wait()
+                    self._wakeup.clear()
+                    continue
+                if self.last_id is None:
+                    self.last_id = get_latest_event_id()
+                for event in get_events_after(self.last_id):
+                    self.last_id = event['id']
+                    broker.publish(TASK_EVENTS_TOPIC, event)
+            except Exception as e:
+                logger.warning(f"任务事件转发失败: {e}")
+            finally:
+                connections.close_all()
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+
+_relay = None
+_relay_lock = threading.Lock()
+
+
+def start_event_relay() -> TaskEventRelay:
+    """启动进程内共享的任务事件转发器（便捷函数）"""
+    global _relay
+    with _relay_lock:
+        if _relay is None:
+            _relay = TaskEventRelay(getattr(settings, 'TASK_EVENT_RELAY_INTERVAL', 0.5))
+        _relay.start()
+        return _relay
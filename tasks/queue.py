@@ -0,0 +1,173 @@
+"""
+任务队列模块
+以数据库中的等待中设备执行记录（设备作业）作为持久化队列，供多台主机上的worker进程并发领取：
+每个worker只领取位于本主机的设备，一个任务的设备分布在多台主机时由各主机分别执行；
+任务所需的设备由设备租约（scheduler模块）保证互斥
+"""
+
+import os
+import socket
+import logging
+from datetime import timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Task, TaskDeviceResult, DeviceLease
+from .scheduler import (acquire_devices, assign_devices, get_busy_devices, get_device_leases,
+                        get_lease_deadline, heartbeat_leases, host_devices_filter)
+
+logger = logging.getLogger(__name__)
+
+
+def get_worker_id(host: str = '') -> str:
+    """生成当前worker进程的唯一标识（主机名:进程号）"""
+    return f"{host or socket.gethostname()}:{os.getpid()}"
+
+
+def claim_next_job(worker_id: str, host: str = '',
+                   exclude: Iterable[int] = ()) -> Optional[Tuple[Task, List[str]]]:
+    """
+    原子地领取最早创建的任务中位于本主机、所需设备空闲的设备作业，返回(任务, 设备ID列表)
+
+    通过带worker条件的UPDATE实现比较并交换，多个进程（同机或跨机）同时领取时
+    只有一个能更新成功；领取和获取设备租约在同一事务中完成，设备被其他任务占用时回滚，
+    作业留在队列中，继续尝试后面的任务。exclude为本worker正在执行的任务
+    """
+    limit = getattr(settings, 'TASK_SCHEDULER_SCAN_LIMIT', 50)
+    pending_jobs = (TaskDeviceResult.objects.filter(status='pending', worker='')
+                    .filter(host_devices_filter(host)))
+    unassigned = Q(status='pending', requested_devices__gt=0) & ~Exists(
+        TaskDeviceResult.objects.filter(task_id=OuterRef('pk')))
+    task_ids = list(Task.objects.filter(status__in=['pending', 'running'])
+                    .exclude(id__in=list(exclude))
+                    .filter(unassigned | Q(id__in=pending_jobs.values('task_id')))
+                    .order_by('created_time', 'id')
+                    .values_list('id', flat=True)[:limit])
+    if not task_ids:
+        return None
+
+    leases = get_device_leases()
+    for task_id in task_ids:
+        job = _claim_job(task_id, worker_id, host, leases)
+        if job is not None:
+            logger.info(f"worker {worker_id} 领取任务 {task_id} 的设备: {job[1]}")
+            return job
+    return None
+
+
+def _claim_job(task_id: int, worker_id: str, host: str, leases) -> Optional[Tuple[Task, List[str]]]:
+    now = timezone.now()
+    with transaction.atomic():
+        # 先写入任务行，后续读取都在写锁内进行
+        if not Task.objects.filter(id=task_id, status__in=['pending', 'running']).update(updated_time=now):
+            # 已结束或已取消
+            return None
+        task = Task.objects.get(id=task_id)
+
+        if task.requested_devices and not task.devices:
+            if not assign_devices(task, worker_id, leases, host):
+                transaction.set_rollback(True)
+                return None
+
+        jobs = (TaskDeviceResult.objects.filter(task_id=task_id, status='pending', worker='')
+                .filter(host_devices_filter(host)))
+        device_ids = list(dict.fromkeys(jobs.values_list('device_id', flat=True)))
+        if not device_ids or get_busy_devices(device_ids, task_id, leases):
+            transaction.set_rollback(True)
+            return None
+
+        claimed = jobs.update(worker=worker_id, updated_time=now)
+        if not claimed or not acquire_devices(task_id, device_ids, worker_id):
+            transaction.set_rollback(True)
+            return None
+
+        if task.status == 'pending':
+            Task.objects.filter(id=task_id, status='pending').update(
+                status='running',
+                worker=worker_id,
+                claimed_time=now,
+                heartbeat_time=now,
+                start_time=now,
+                updated_time=now,
+            )
+            task.refresh_from_db()
+    return task, device_ids
+
+
+def heartbeat(worker_id: str, task_ids: Iterable[int]) -> int:
+    """更新worker正在执行的任务及其持有的设备租约的心跳时间"""
+    task_ids = list(task_ids)
+    if not task_ids:
+        return 0
+    heartbeat_leases(task_ids, worker_id)
+    return Task.objects.filter(id__in=task_ids, status='running').update(
+        heartbeat_time=timezone.now()
+    )
+
+
+def requeue_stale_tasks(timeout: Optional[int] = None) -> int:
+    """
+    将心跳超时的运行中任务放回队列
+
+    worker进程崩溃或被重启后，其领取的任务会因心跳停止而被重新执行（只重置未完成的设备作业，
+    已执行完毕的设备结果保留）；任务仍有其他主机在执行时，只将失效worker领取的设备作业（设备租约已过期）放回队列
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'TASK_WORKER_STALE_TIMEOUT', 60)
+    now = timezone.now()
+    deadline = now - timedelta(seconds=timeout)
+
+    stale_tasks = Task.objects.filter(status='running', heartbeat_time__lt=deadline)
+    live_lease = DeviceLease.objects.filter(task_id=OuterRef('task_id'), device_id=OuterRef('device_id'),
+                                            heartbeat_time__gte=get_lease_deadline())
+    orphaned_jobs = (TaskDeviceResult.objects.filter(task__status='running', status__in=['pending', 'running'])
+                     .exclude(worker='')
+                     .filter(~Exists(live_lease)))
+    # 先用只读查询检查，没有需要处理的记录时不开启写事务（IMMEDIATE模式下写事务会占用数据库写锁）
+    if not stale_tasks.exists() and not orphaned_jobs.exists():
+        return 0
+
+    with transaction.atomic():
+        stale_ids = list(stale_tasks.values_list('id', flat=True))
+        requeued = 0
+        if stale_ids:
+            requeued = Task.objects.filter(id__in=stale_ids, status='running',
+                                           heartbeat_time__lt=deadline).update(
+                status='pending',
+                worker='',
+                claimed_time=None,
+                heartbeat_time=None,
+                start_time=None,
+                progress=0,
+                updated_time=now,
+            )
+            TaskDeviceResult.objects.filter(task_id__in=stale_ids, status__in=['pending', 'running']).update(
+                status='pending',
+                worker='',
+                start_time=None,
+                updated_time=now,
+            )
+
+            # 释放失效worker持有的设备；自动分配设备的任务还没有设备执行完毕时重新入队后重新分配，
+            # 已有设备执行完毕（可能在其他主机上）时保留其结果，未完成的设备作业留在原设备上重新执行
+            DeviceLease.objects.filter(task_id__in=stale_ids).delete()
+            finished = TaskDeviceResult.objects.filter(task_id=OuterRef('pk')).exclude(
+                status__in=['pending', 'running'])
+            auto_ids = list(Task.objects.filter(id__in=stale_ids, requested_devices__gt=0)
+                            .filter(~Exists(finished))
+                            .values_list('id', flat=True))
+            if auto_ids:
+                TaskDeviceResult.objects.filter(task_id__in=auto_ids).delete()
+                Task.objects.filter(id__in=auto_ids).update(devices=[], updated_time=now)
+
+        orphaned = orphaned_jobs.update(status='pending', worker='', start_time=None, updated_time=now)
+
+    if requeued:
+        logger.warning(f"重新入队 {requeued} 个心跳超时的任务: {stale_ids}")
+    if orphaned:
+        logger.warning(f"重新入队 {orphaned} 个设备租约过期的设备作业")
+    return requeued + orphaned
@@ -0,0 +1,266 @@
+"""
+数据保留模块
+定期清理已结束的历史任务，使任务表和执行日志目录的大小保持稳定（manage.py apply_retention，可由cron定时执行）：
+    归档  结束超过TASK_RETENTION_DAYS天的任务连同设备结果写入压缩归档文件（gzip压缩的JSON Lines），
+          从任务表中删除（进度事件随之删除），TaskArchive中保留一行摘要
+    事件  已结束任务的进度事件只用于实时推送，超过TASK_EVENT_RETENTION_HOURS小时后删除
+    日志  执行日志中的截图保留AIRTEST_SCREENSHOT_RETENTION_DAYS天，执行日志目录保留AIRTEST_LOG_RETENTION_DAYS天，
+          总大小超过AIRTEST_LOG_MAX_BYTES时从最早的目录开始删除；等待中和运行中的任务不受影响
+"""
+
+import gzip
+import json
+import os
+import re
+import shutil
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Task, TaskArchive, TaskDeviceResult, TaskEvent
+from .airtest_log import get_log_root
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ('success', 'failed', 'cancelled')
+
+# 执行日志中的截图文件
+SCREENSHOT_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+TASK_DIR_PATTERN = re.compile(r'^task_(\d+)$')
+
+
+def get_archive_dir() -> str:
+    archive_dir = os.path.abspath(getattr(settings, 'TASK_ARCHIVE_DIR', os.path.join('archive', 'tasks')))
+    os.makedirs(archive_dir, exist_ok=True)
+    return archive_dir
+
+
+def serialize_archived_task(task: Task) -> Dict[str, Any]:
+    """任务及其设备结果的完整数据"""
+    data = {field.attname: getattr(task, field.attname) for field in Task._meta.concrete_fields}
+    data['test_case_name'] = task.test_case.name
+    data['device_results'] = [
+        {field.attname: getattr(result, field.attname) for field in TaskDeviceResult._meta.concrete_fields}
+        for result in task.device_results.all()
+    ]
+    return data
+
+
+def write_archive(file_path: str, records: List[Dict[str, Any]]):
+    """写入临时文件后原子重命名，中途失败不会留下不完整的归档文件"""
+    temp_path = f"{file_path}.tmp-{os.getpid()}"
+    try:
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False))
+                f.write('\n')
+        os.replace(temp_path, file_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class RetentionEngine:
+    """数据保留引擎，dry_run为True时只统计不删除"""
+
+    def __init__(self, task_days: Optional[int] = None, event_hours: Optional[int] = None,
+                 screenshot_days: Optional[int] = None, log_days: Optional[int] = None,
+                 log_max_bytes: Optional[int] = None, batch_size: int = 500, dry_run: bool = False):
+        self.task_days = task_days if task_days is not None else getattr(settings, 'TASK_RETENTION_DAYS', 30)
+        self.event_hours = (event_hours if event_hours is not None
+                            else getattr(settings, 'TASK_EVENT_RETENTION_HOURS', 24))
+        self.screenshot_days = (screenshot_days if screenshot_days is not None
+                                else getattr(settings, 'AIRTEST_SCREENSHOT_RETENTION_DAYS', 7))
+        self.log_days = log_days if log_days is not None else getattr(settings, 'AIRTEST_LOG_RETENTION_DAYS', 30)
+        self.log_max_bytes = (log_max_bytes if log_max_bytes is not None
+                              else getattr(settings, 'AIRTEST_LOG_MAX_BYTES', 10 * 1024 * 1024 * 1024))
+        self.batch_size = max(1, batch_size)
+        self.dry_run = dry_run
+
+    def run(self) -> Dict[str, int]:
+        """依次执行归档、事件清理和日志清理，返回统计结果"""
+        stats = {'archived_tasks': self.archive_tasks(), 'deleted_events': self.prune_events()}
+        stats.update(self.prune_logs())
+        return stats
+
+    def archive_tasks(self) -> int:
+        """归档过期的已结束任务，返回归档的任务数"""
+        cutoff = timezone.now() - timedelta(days=self.task_days)
+        expired = Task.objects.filter(status__in=FINISHED_STATUSES).filter(
+            Q(end_time__lt=cutoff) | Q(end_time__isnull=True, created_time__lt=cutoff))
+        if self.dry_run:
+            return expired.count()
+
+        archived = 0
+        while True:
+            task_ids = list(expired.order_by('id').values_list('id', flat=True)[:self.batch_size])
+            if not task_ids:
+                break
+            archived += self._archive_batch(task_ids)
+        if archived:
+            logger.info(f"归档 {archived} 个任务")
+        return archived
+
+    def _archive_batch(self, task_ids: List[int]) -> int:
+        tasks = list(Task.objects.filter(id__in=task_ids)
+                     .select_related('test_case').prefetch_related('device_results'))
+        file_name = f"tasks-{timezone.now():%Y%m%d-%H%M%S}-{task_ids[0]}.jsonl.gz"
+        file_path = os.path.join(get_archive_dir(), file_name)
+        write_archive(file_path, [serialize_archived_task(task) for task in tasks])
+
+        summaries = []
+        for task in tasks:
+            statuses = [result.status for result in task.device_results.all()]
+            summaries.append(TaskArchive(
+                task_id=task.id,
+                name=task.name,
+                test_case_name=task.test_case.name,
+                platform=task.platform,
+                status=task.status,
+                device_count=len(statuses),
+                success_count=statuses.count('success'),
+                failed_count=statuses.count('failed'),
+                error_message=task.error_message,
+                created_time=task.created_time,
+                start_time=task.start_time,
+                end_time=task.end_time,
+                archive_file=file_path,
+            ))
+
+        with transaction.atomic():
+            TaskArchive.objects.bulk_create(summaries, ignore_conflicts=True)
+            # 设备结果、进度事件随任务级联删除
+            Task.objects.filter(id__in=task_ids, status__in=FINISHED_STATUSES).delete()
+
+        log_root = get_log_root()
+        for task in tasks:
+            task_dir = os.path.join(log_root, f"task_{task.id}")
+            if os.path.isdir(task_dir):
+                shutil.rmtree(task_dir, ignore_errors=True)
+        return len(tasks)
+
+    def prune_events(self) -> int:
+        """删除已结束任务的过期进度事件，返回删除的数量"""
+        cutoff = timezone.now() - timedelta(hours=self.event_hours)
+        events = TaskEvent.objects.filter(created_time__lt=cutoff, task__status__in=FINISHED_STATUSES)
+        if self.dry_run:
+            return events.count()
+
+        deleted = 0
+        while True:
+            event_ids = list(events.values_list('id', flat=True)[:self.batch_size * 10])
+            if not event_ids:
+                break
+            count, _ = TaskEvent.objects.filter(id__in=event_ids).delete()
+            deleted += count
+        if deleted:
+            logger.info(f"删除 {deleted} 条过期的任务事件")
+        return deleted
+
+    def prune_logs(self) -> Dict[str, int]:
+        """按时间删除截图和执行日志目录，总大小超过配额时从最早的目录开始删除"""
+        stats = {'deleted_screenshots': 0, 'deleted_log_dirs': 0, 'freed_bytes': 0}
+        log_root = get_log_root()
+        if not os.path.isdir(log_root):
+            return stats
+
+        now = timezone.now().timestamp()
+        screenshot_cutoff = now - self.screenshot_days * 86400
+        log_cutoff = now - self.log_days * 86400
+        active = set(Task.objects.exclude(status__in=FINISHED_STATUSES).values_list('id', flat=True))
+
+        total = 0
+        runs = []
+        for task_entry in os.scandir(log_root):
+            if not task_entry.is_dir():
+                continue
+            match = TASK_DIR_PATTERN.match(task_entry.name)
+            is_active = match is not None and int(match.group(1)) in active
+            for run_entry in os.scandir(task_entry.path):
+                if not run_entry.is_dir():
+                    continue
+                size, mtime, screenshots = self._scan(run_entry.path)
+                if not is_active:
+                    for path, file_size, file_mtime in screenshots:
+                        if file_mtime < screenshot_cutoff and self._remove_file(path):
+                            stats['deleted_screenshots'] += 1
+                            stats['freed_bytes'] += file_size
+                            size -= file_size
+                    runs.append((mtime, run_entry.path, size))
+                total += size
+
+        deleted_dirs = []
+        for mtime, path, size in sorted(runs):
+            if mtime >= log_cutoff and total <= self.log_max_bytes:
+                break
+            if not self.dry_run:
+                shutil.rmtree(path, ignore_errors=True)
+            deleted_dirs.append(path)
+            total -= size
+            stats['freed_bytes'] += size
+
+        stats['deleted_log_dirs'] = len(deleted_dirs)
+        if not self.dry_run and deleted_dirs:
+            self._forget_log_dirs(deleted_dirs)
+            self._remove_empty_dirs(log_root)
+            logger.info(f"删除 {len(deleted_dirs)} 个执行日志目录，日志当前占用 {total} 字节")
+        return stats
+
+    @staticmethod
+    def _scan(run_dir: str):
+        """统计执行日志目录的大小、最后修改时间和其中的截图
+        （最后修改时间取最新的文件，删除截图会更新目录本身的修改时间）"""
+        size = 0
+        mtime = 0.0
+        screenshots = []
+        for dir_path, _, file_names in os.walk(run_dir):
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                size += stat.st_size
+                mtime = max(mtime, stat.st_mtime)
+                if file_name.lower().endswith(SCREENSHOT_EXTENSIONS):
+                    screenshots.append((path, stat.st_size, stat.st_mtime))
+        return size, mtime or os.path.getmtime(run_dir), screenshots
+
+    def _remove_file(self, path: str) -> bool:
+        if self.dry_run:
+            return True
+        try:
+            os.remove(path)
+            return True
+        except OSError as e:
+            logger.warning(f"删除截图失败 {path}: {e}")
+            return False
+
+    def _forget_log_dirs(self, log_dirs: List[str]):
+        """日志目录已删除的设备结果不再指向该目录"""
+        now = timezone.now()
+        for start in range(0, len(log_dirs), self.batch_size):
+            TaskDeviceResult.objects.filter(log_dir__in=log_dirs[start:start + self.batch_size]).update(
+                log_dir='', updated_time=now)
+
+    @staticmethod
+    def _remove_empty_dirs(log_root: str):
+        for entry in os.scandir(log_root):
+            if entry.is_dir() and not os.listdir(entry.path):
+                try:
+                    os.rmdir(entry.path)
+                except OSError:
+                    pass
+
+
+def apply_retention(**kwargs) -> Dict[str, int]:
+    """执行一次数据保留（便捷函数）"""
+    return RetentionEngine(**kwargs).run()
@@ -0,0 +1,192 @@
+"""
+脚本运行器模块
+每台设备的执行流程统一为 准备(prepare) -> 安装(install) -> 执行(run) -> 收集(collect) 四个阶段，
+各阶段耗时记录在设备结果的stage_timing中；不同类型的测试脚本由注册的运行器负责准备脚本、
+构建命令和判断执行结果，新增脚本类型只需实现并注册一个运行器
+"""
+
+import os
+import time
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .airtest_log import LOG_FILE_NAME
+from .live_output import OUTPUT_FILE_NAME
+from cases.script_cache import prepare_test_case
+from Automation_Platform.toolchain import tool_path
+
+logger = logging.getLogger(__name__)
+
+# Airtest有时会返回特殊错误码4294967295，但实际上脚本可能已执行
+AIRTEST_SUCCESS_CODES = (0, 4294967295)
+
+
+def get_stage_timeout(stage: str) -> float:
+    """获取阶段超时（秒）"""
+    timeouts = getattr(settings, 'TASK_STAGE_TIMEOUTS', {})
+    defaults = {'install': 180, 'run': 300}
+    return timeouts.get(stage, defaults[stage])
+
+
+def get_device_uri(device_id):
+    """
+    Airtest连接设备使用的URI
+
+    设备由执行本任务的主机上的adb server管理；同一台机器运行多个设备代理时，
+    各代理通过ANDROID_ADB_SERVER_PORT使用各自的adb server
+    """
+    host = getattr(settings, 'ADB_SERVER_HOST', '127.0.0.1')
+    port = os.environ.get('ANDROID_ADB_SERVER_PORT') or getattr(settings, 'ADB_SERVER_PORT', 5037)
+    return f"Android://{host}:{port}/{device_id}"
+
+
+class StageTimer:
+    """记录各阶段耗时（秒），阶段出错时同样记录已经过的时间"""
+
+    def __init__(self):
+        self.timing: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timing[name] = round(time.monotonic() - started, 3)
+
+
+class ScriptRunner:
+    """
+    脚本运行器基类
+
+    prepare在任务开始时调用一次，返回(脚本路径, 工作目录)；build_command和check_result
+    在每台设备上调用，同步执行引擎和异步执行引擎共用
+    """
+
+    name = ''
+    platforms = ('android',)
+
+    def matches(self, test_case) -> bool:
+        raise NotImplementedError
+
+    def prepare(self, test_case) -> Tuple[str, Optional[str]]:
+        raise NotImplementedError
+
+    def build_command(self, device_id: str, script_path: str, log_dir: str) -> List[str]:
+        raise NotImplementedError
+
+    def check_result(self, result, log_dir: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class AirtestRunner(ScriptRunner):
+    """单文件Airtest脚本（Python脚本实际上也是Airtest脚本），在服务器端通过airtest run执行"""
+
+    name = 'airtest'
+
+    def matches(self, test_case) -> bool:
+        return test_case.file_type in ('python', 'airtest')
+
+    def prepare(self, test_case) -> Tuple[str, Optional[str]]:
+        return os.path.abspath(test_case.file_path), None
+
+    def build_command(self, device_id: str, script_path: str, log_dir: str) -> List[str]:
+        return [tool_path('airtest'), 'run', script_path, '--device', get_device_uri(device_id), '--log', log_dir]
+
+    def check_result(self, result, log_dir: str) -> Dict[str, Any]:
+        """根据airtest run的退出码和错误输出判断执行结果"""
+        if result.returncode in AIRTEST_SUCCESS_CODES:
+            # 检查是否有明显的错误信息
+            if result.stderr and 'Error' in result.stderr and 'Traceback' in result.stderr:
+                return {'success': False, 'error': f'Airtest执行出错: {result.stderr}'}
+            return {'success': True, 'output': result.stdout,
+                    'log_file': os.path.join(log_dir, LOG_FILE_NAME),
+                    'output_file': os.path.join(log_dir, OUTPUT_FILE_NAME)}
+        error_msg = result.stderr if result.stderr else result.stdout
+        return {'success': False, 'error': f'Airtest执行失败: {error_msg}'}
+
+
+class AirtestProjectRunner(AirtestRunner):
+    """ZIP格式的Airtest项目：使用脚本缓存中的入口脚本，在其所在目录执行以便找到图片文件"""
+
+    name = 'airtest_project'
+
+    def matches(self, test_case) -> bool:
+        return test_case.file_type == 'airtest' and test_case.file_path.endswith('.zip')
+
+    def prepare(self, test_case) -> Tuple[str, Optional[str]]:
+        main_script = prepare_test_case(test_case)
+        return main_script, os.path.dirname(main_script)
+
+
+# 按注册顺序匹配，先注册的优先
+_runners: List[ScriptRunner] = []
+
+
+def register_runner(runner: ScriptRunner, first: bool = False):
+    """注册运行器，first为True时优先于已注册的运行器匹配"""
+    if first:
+        _runners.insert(0, runner)
+    else:
+        _runners.append(runner)
+
+
+def get_runner(test_case) -> Optional[ScriptRunner]:
+    """获取处理该测试用例的运行器，不支持的脚本类型返回None"""
+    for runner in _runners:
+        if runner.matches(test_case):
+            return runner
+    return None
+
+
+register_runner(AirtestProjectRunner())
+register_runner(AirtestRunner())
+
+
+class PreparedScript:
+    """
+    准备好的测试脚本，任务的所有设备共用
+
+    prepare_time为任务级准备阶段的耗时，计入每台设备的prepare阶段；
+    准备失败时各设备在准备阶段失败并记录原因
+    """
+
+    def __init__(self, runner: Optional[ScriptRunner], script_path: str = '',
+                 cwd: Optional[str] = None, error: str = '', prepare_time: float = 0):
+        self.runner = runner
+        self.script_path = script_path
+        self.cwd = cwd
+        self.error = error
+        self.prepare_time = prepare_time
+
+    def start_timer(self) -> StageTimer:
+        """创建设备的阶段计时器"""
+        timer = StageTimer()
+        timer.timing['prepare'] = self.prepare_time
+        return timer
+
+    def build_command(self, device_id: str, log_dir: str) -> List[str]:
+        return self.runner.build_command(device_id, self.script_path, log_dir)
+
+    def check_result(self, result, log_dir: str) -> Dict[str, Any]:
+        return self.runner.check_result(result, log_dir)
+
+
+def prepare_script(test_case, platform: str) -> PreparedScript:
+    """为任务准备测试脚本（ZIP项目在分发到各设备前解压一次），失败时不抛出异常"""
+    started = time.monotonic()
+    runner = get_runner(test_case)
+    if runner is None:
+        return PreparedScript(None, error='不支持的脚本类型')
+    if platform not in runner.platforms:
+        return PreparedScript(runner, error='iOS设备暂不支持')
+    try:
+        script_path, cwd = runner.prepare(test_case)
+    except Exception as e:
+        logger.warning(f"准备测试脚本失败 {test_case.file_path}: {e}")
+        return PreparedScript(runner, error=f'脚本准备失败: {e}',
+                              prepare_time=round(time.monotonic() - started, 3))
+    return PreparedScript(runner, script_path, cwd, prepare_time=round(time.monotonic() - started, 3))
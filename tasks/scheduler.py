@@ -0,0 +1,142 @@
+"""
+设备调度模块
+通过设备租约保证同一台设备同一时间只被一个任务使用：worker领取设备作业时一次性获取
+所需的全部设备租约，设备被占用的作业留在队列中等待；未指定设备的任务在首次领取时从所有主机
+空闲的在线设备中按平台、系统版本自动分配所需数量的设备（优先分配领取者所在主机的设备）。
+租约由worker心跳续期，worker失效后租约过期自动释放
+"""
+
+import logging
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from cases.models import Device
+from .models import DeviceLease, TaskDeviceResult
+
+logger = logging.getLogger(__name__)
+
+ONLINE_STATUS = '在线'
+
+
+def get_lease_deadline():
+    """心跳早于该时间的租约视为失效"""
+    timeout = getattr(settings, 'DEVICE_LEASE_TIMEOUT', 120)
+    return timezone.now() - timedelta(seconds=timeout)
+
+
+def get_device_leases() -> Dict[str, int]:
+    """获取当前有效的设备租约：{设备ID: 任务ID}"""
+    return dict(DeviceLease.objects.filter(heartbeat_time__gte=get_lease_deadline())
+                .values_list('device_id', 'task_id'))
+
+
+def get_busy_devices(device_ids: Iterable[str], task_id: int, leases: Dict[str, int]) -> List[str]:
+    """获取被其他任务占用的设备"""
+    return [device_id for device_id in device_ids if leases.get(device_id, task_id) != task_id]
+
+
+def acquire_devices(task_id: int, device_ids: Iterable[str], worker_id: str = '') -> bool:
+    """
+    为任务一次性获取多台设备的租约，全部获取成功返回True，任一设备被占用时不获取任何租约
+
+    device_id唯一约束保证多个worker并发获取同一台设备时只有一个成功
+    """
+    device_ids = list(dict.fromkeys(device_ids))
+    if not device_ids:
+        return True
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            # 清理已失效的租约和本任务之前遗留的租约
+            DeviceLease.objects.filter(device_id__in=device_ids).filter(
+                Q(heartbeat_time__lt=get_lease_deadline()) | Q(task_id=task_id)
+            ).delete()
+            DeviceLease.objects.bulk_create([
+                DeviceLease(device_id=device_id, task_id=task_id, worker=worker_id,
+                            acquired_time=now, heartbeat_time=now)
+                for device_id in device_ids
+            ])
+    except IntegrityError:
+        return False
+    return True
+
+
+def release_devices(task_id: int, device_ids: Optional[Iterable[str]] = None) -> int:
+    """释放任务持有的设备租约（device_ids为空时释放全部），返回释放的数量"""
+    leases = DeviceLease.objects.filter(task_id=task_id)
+    if device_ids is not None:
+        leases = leases.filter(device_id__in=list(device_ids))
+    released, _ = leases.delete()
+    return released
+
+
+def heartbeat_leases(task_ids: Iterable[int], worker_id: Optional[str] = None) -> int:
+    """续期任务持有的设备租约（指定worker_id时只续期该worker持有的租约）"""
+    task_ids = list(task_ids)
+    if not task_ids:
+        return 0
+    leases = DeviceLease.objects.filter(task_id__in=task_ids)
+    if worker_id is not None:
+        leases = leases.filter(worker=worker_id)
+    return leases.update(heartbeat_time=timezone.now())
+
+
+def select_free_devices(count: int, device_filter: Optional[Dict[str, Any]] = None,
+                        leases: Optional[Dict[str, int]] = None, prefer_host: str = '') -> List[Device]:
+    """
+    从在线且未被占用的设备中选出count台满足筛选条件的设备，数量不足时返回空列表
+
+    device_filter支持platform（android/ios）和os（系统版本前缀，如"Android 12"）；
+    远程主机的设备只选择代理最近上报过的，prefer_host所在主机的设备优先
+    """
+    device_filter = device_filter or {}
+    if leases is None:
+        leases = get_device_leases()
+
+    host_deadline = timezone.now() - timedelta(seconds=getattr(settings, 'DEVICE_HOST_TIMEOUT', 60))
+    devices = Device.objects.filter(status=ONLINE_STATUS).filter(Q(host='') | Q(last_seen__gte=host_deadline))
+    if device_filter.get('platform'):
+        devices = devices.filter(platform=device_filter['platform'])
+    if device_filter.get('os'):
+        devices = devices.filter(os__istartswith=device_filter['os'])
+
+    free = [device for device in devices.order_by('device_id') if device.device_id not in leases]
+    free.sort(key=lambda device: device.host != prefer_host)
+    selected = free[:count]
+    return selected if len(selected) >= count else []
+
+
+def assign_devices(task, worker_id: str, leases: Optional[Dict[str, int]] = None, host: str = '') -> bool:
+    """
+    为自动分配设备的任务选出满足条件的空闲设备并获取租约（需在领取任务的事务中调用），
+    写入任务的设备列表并创建设备执行记录。空闲设备不足时返回False
+    """
+    devices = select_free_devices(task.requested_devices, task.device_filter, leases, prefer_host=host)
+    if not devices or not acquire_devices(task.id, [d.device_id for d in devices], worker_id):
+        return False
+
+    task.devices = [d.device_id for d in devices]
+    task.save(update_fields=['devices', 'updated_time'])
+    TaskDeviceResult.objects.bulk_create([
+        TaskDeviceResult(task=task, device_id=d.device_id, device_name=d.name, status='pending')
+        for d in devices
+    ])
+    logger.info(f"任务 {task.id} 自动分配设备: {task.devices}")
+    return True
+
+
+def host_devices_filter(host: str, field: str = 'device_id') -> Q:
+    """
+    构造"设备位于指定主机"的查询条件
+
+    本机（空字符串）包括未被任何代理上报过的设备，与引入代理之前的行为一致
+    """
+    if host:
+        return Q(**{f'{field}__in': Device.objects.filter(host=host).values('device_id')})
+    return ~Q(**{f'{field}__in': Device.objects.exclude(host='').values('device_id')})
@@ -1,3 +1,983 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from Automation_Platform.events import EventBroker, sse_stream
+from Automation_Platform.toolchain import Toolchain, ToolNotFoundError
+from cases.models import TestCase as ScriptCase
+from .apk_cache import evict as evict_apks, get_build
+from .airtest_log import LOG_FILE_NAME, LogFollower, analyze_log, get_run_log_dir, iter_log_entries
+from .async_engine import AsyncEngine
+from .installer import install_apk
+from .live_output import OUTPUT_FILE_NAME, RotatingOutputFile, read_output_tail, run_streaming_process
+from .cancellation import cancel_local, cancel_task, clear as clear_cancellation
+from .executor import DeviceExecutor, fail_device_result, finish_task, get_per_task_limit, save_device_result
+from .progress import ProgressReporter
+from .models import ApkBuild, DeviceLease, Task, TaskArchive, TaskDeviceResult, TaskEvent
+from .queue import _claim_job, claim_next_job, requeue_stale_tasks
+from .management.commands.benchmark_db import SCENARIOS
+from .retention import RetentionEngine
+from .runners import (AirtestProjectRunner, AirtestRunner, ScriptRunner, StageTimer, get_runner,
+                      get_stage_timeout, prepare_script, register_runner)
+from .scheduler import acquire_devices, release_devices
+
+
+def create_script(name='script', **fields):
+    """测试用例（脚本），同名的测试用例已存在时直接返回"""
+    defaults = {'file_path': 'script.py', 'file_type': 'python', 'file_size': 1, **fields}
+    return ScriptCase.objects.get_or_create(name=name, defaults=defaults)[0]
+
+
+def create_task(results=None, script=None, result_fields=None, **fields):
+    """
+    任务，只需指定与默认值不同的字段；results为 {设备ID: 状态} 时同时创建这些设备的执行记录
+    （设备名称与设备ID相同），result_fields为设备执行记录的其他字段
+    """
+    results = results or {}
+    fields = {'name': 'task', 'devices': list(results), 'platform': 'android', **fields}
+    task = Task.objects.create(test_case=script or create_script(), **fields)
+    TaskDeviceResult.objects.bulk_create([
+        TaskDeviceResult(task=task, device_id=device_id, device_name=device_id, status=status,
+                         **(result_fields or {}))
+        for device_id, status in results.items()
+    ])
+    return task
+
+
+class ListingQueryCountTests(TestCase):
+    """任务列表和状态轮询接口的查询次数与任务数量无关"""
+
+    def setUp(self):
+        self.script = create_script(status='available')
+
+    def create_tasks(self, count):
+        for i in range(count):
+            create_task({'AAA': 'success', 'BBB': 'running'}, script=self.script, name=f'task-{i}')
+
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_bounded(self, url, params=None, limit=5):
+        """任务数量从2个增加到40个，查询次数不变且不超过limit"""
+        self.create_tasks(2)
+        small = self.count_queries(url, params)
+        self.create_tasks(38)
+        large = self.count_queries(url, params)
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, limit)
+
+    def test_running_tasks_page(self):
+        self.assert_bounded(reverse('tasks:running_tasks'))
+
+    def test_all_tasks_status(self):
+        self.assert_bounded(reverse('tasks:get_all_tasks_status'), {'status': 'pending,running', 'page_size': 15})
+
+    def test_task_changes(self):
+        self.assert_bounded(reverse('tasks:get_task_changes'), {'cursor': 0})
+
+    def test_task_status(self):
+        self.create_tasks(1)
+        task = Task.objects.first()
+        self.assertEqual(self.count_queries(reverse('tasks:get_task_status', args=[task.id])), 1)
+
+    def test_case_list_page(self):
+        for i in range(30):
+            create_script(name=f'case-{i}')
+        self.assertLessEqual(self.count_queries(reverse('cases:case_list')), 3)
+
+
+class CursorPaginationTests(TestCase):
+    """任务状态列表按(创建时间, id)游标翻页"""
+
+    def setUp(self):
+        script = create_script()
+        created_time = timezone.now()
+        # 部分任务创建时间相同，翻页依靠id区分
+        self.tasks = [
+            create_task(script=script, name=f'task-{i}', created_time=created_time - timedelta(seconds=i // 3))
+            for i in range(25)
+        ]
+
+    def get_page(self, **params):
+        response = self.client.get(reverse('tasks:get_all_tasks_status'), {'page_size': 10, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_walk_forward_and_back(self):
+        expected = [task.id for task in sorted(self.tasks, key=lambda t: (t.created_time, t.id), reverse=True)]
+        pages = [self.get_page(count='approximate')]
+        while pages[-1]['pagination']['has_next']:
+            pages.append(self.get_page(after=pages[-1]['pagination']['next_cursor']))
+
+        self.assertEqual([task['id'] for page in pages for task in page['tasks']], expected)
+        self.assertEqual(pages[0]['pagination']['total'], 25)
+        self.assertFalse(pages[0]['pagination']['has_previous'])
+
+        previous = self.get_page(before=pages[-1]['pagination']['previous_cursor'])
+        self.assertEqual(previous['tasks'], pages[-2]['tasks'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('tasks:get_all_tasks_status'), {'after': 'invalid'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RetentionTests(TestCase):
+    """过期任务归档后只保留摘要，执行日志按期限和配额清理"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
+        self.log_root = os.path.join(self.temp_dir, 'logs')
+        overrides = override_settings(AIRTEST_LOG_ROOT=self.log_root,
+                                      TASK_ARCHIVE_DIR=os.path.join(self.temp_dir, 'archive'))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def create_task(self, status, age_days):
+        end_time = timezone.now() - timedelta(days=age_days)
+        task = create_task(name=f'{status}-{age_days}', devices=['AAA'], status=status, end_time=end_time)
+        log_dir = os.path.join(self.log_root, f'task_{task.id}', 'AAA')
+        os.makedirs(log_dir)
+        for file_name in ('log.txt', 'screen.jpg'):
+            with open(os.path.join(log_dir, file_name), 'w') as f:
+                f.write('x' * 100)
+            os.utime(os.path.join(log_dir, file_name), (end_time.timestamp(), end_time.timestamp()))
+        task.device_results.create(device_id='AAA', device_name='AAA', status='success', log_dir=log_dir)
+        return task, log_dir
+
+    def test_archive_expired_tasks(self):
+        old, old_log_dir = self.create_task('success', 40)
+        recent, recent_log_dir = self.create_task('failed', 1)
+        running, _ = self.create_task('running', 40)
+
+        stats = RetentionEngine(task_days=30, log_days=30).run()
+
+        self.assertEqual(stats['archived_tasks'], 1)
+        self.assertEqual(set(Task.objects.values_list('id', flat=True)), {recent.id, running.id})
+        self.assertFalse(os.path.exists(old_log_dir))
+        self.assertTrue(os.path.exists(recent_log_dir))
+
+        archive = TaskArchive.objects.get(task_id=old.id)
+        self.assertEqual((archive.status, archive.device_count, archive.success_count), ('success', 1, 1))
+        with gzip.open(archive.archive_file, 'rt', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([record['id'] for record in records], [old.id])
+        self.assertEqual(records[0]['device_results'][0]['device_id'], 'AAA')
+
+    def test_prune_logs(self):
+        _, old_log_dir = self.create_task('success', 10)
+        _, recent_log_dir = self.create_task('success', 3)
+        _, running_log_dir = self.create_task('running', 10)
+
+        stats = RetentionEngine(task_days=30, screenshot_days=7, log_days=30).run()
+
+        self.assertEqual(stats['deleted_screenshots'], 1)
+        self.assertFalse(os.path.exists(os.path.join(old_log_dir, 'screen.jpg')))
+        self.assertTrue(os.path.exists(os.path.join(recent_log_dir, 'screen.jpg')))
+        self.assertTrue(os.path.exists(os.path.join(running_log_dir, 'screen.jpg')))
+
+        # 超过配额时从最早的目录开始删除，运行中任务的日志保留
+        stats = RetentionEngine(task_days=30, log_days=30, log_max_bytes=400).run()
+
+        self.assertEqual(stats['deleted_log_dirs'], 1)
+        self.assertFalse(os.path.exists(old_log_dir))
+        self.assertTrue(os.path.exists(recent_log_dir))
+        self.assertTrue(os.path.exists(running_log_dir))
+        self.assertFalse(TaskDeviceResult.objects.filter(log_dir=old_log_dir).exists())
+
+
+class EventStreamTests(SimpleTestCase):
+    """SSE异步流等待事件时不占用线程，其他线程发布的事件立即送达"""
+
+    def test_async_stream(self):
+        broker = EventBroker()
+
+        async def consume():
+            stream = sse_stream(broker.subscribe('topic'), initial={'id': 1, 'type': 'snapshot'}, timeout=5)
+            messages = [await stream.__anext__(), await stream.__anext__()]
+            threading.Timer(0.1, broker.publish, args=('topic', {'id': 2, 'type': 'changed'})).start()
+            messages.append(await asyncio.wait_for(stream.__anext__(), 2))
+            await stream.aclose()
+            return messages
+
+        messages = asyncio.run(consume())
+        self.assertTrue(messages[0].startswith('retry:'))
+        self.assertIn('event: snapshot', messages[1])
+        self.assertIn('event: changed', messages[2])
+        self.assertEqual(broker.subscriber_count('topic'), 0)
+
+    def test_stream_timeout(self):
+        broker = EventBroker()
+
+        async def consume():
+            return [message async for message in sse_stream(broker.subscribe('topic'), keepalive=0.05,
+                                                            timeout=0.2)]
+
+        messages = asyncio.run(consume())
+        self.assertIn(': keepalive\n\n', messages)
+        self.assertEqual(broker.subscriber_count('topic'), 0)
+
+
+class TaskChangesTests(TestCase):
+    """增量变化接口不遗漏同一时间戳的记录和晚提交的记录"""
+
+    def fetch_all(self, cursor):
+        """按has_more连续请求，返回所有变化的任务id和最终游标"""
+        task_ids = set()
+        while True:
+            data = self.client.get(reverse('tasks:get_task_changes'), {'cursor': cursor}).json()
+            task_ids.update(task['id'] for task in data['tasks'])
+            cursor = data['cursor']
+            if not data['has_more']:
+                return task_ids, cursor
+
+    @mock.patch('tasks.views.CHANGES_LIMIT', 3)
+    def test_same_timestamp_across_pages(self):
+        cursor = self.client.get(reverse('tasks:get_task_changes')).json()['cursor']
+        tasks = [create_task(name=f'task-{i}') for i in range(7)]
+        # 批量更新使所有任务的更新时间相同
+        Task.objects.update(status='running', updated_time=timezone.now())
+
+        task_ids, _ = self.fetch_all(cursor)
+        self.assertEqual(task_ids, {task.id for task in tasks})
+
+    def test_late_commit_within_lookback(self):
+        stamped = timezone.now()
+        cursor = self.client.get(reverse('tasks:get_task_changes')).json()['cursor']
+        _, cursor = self.fetch_all(cursor)
+
+        # 更新时间早于上一次请求、但之后才提交的写入
+        task = create_task(name='late')
+        Task.objects.filter(id=task.id).update(updated_time=stamped)
+
+        task_ids, _ = self.fetch_all(cursor)
+        self.assertIn(task.id, task_ids)
+
+
+class FinishTaskTests(TestCase):
+    """任务在最后一台设备结束（或被取消）时只结束一次"""
+
+    def test_finish_is_idempotent(self):
+        task = create_task({'AAA': 'success', 'BBB': 'failed'}, status='running')
+
+        self.assertTrue(finish_task(task))
+        self.assertFalse(finish_task(Task.objects.get(id=task.id)))
+        self.assertEqual(Task.objects.get(id=task.id).status, 'failed')
+        self.assertEqual(TaskEvent.objects.filter(task=task, event_type='task_finished').count(), 1)
+
+    def test_waits_for_unfinished_devices(self):
+        task = create_task({'AAA': 'success', 'BBB': 'running'}, status='running')
+
+        self.assertFalse(finish_task(task))
+        self.assertEqual(Task.objects.get(id=task.id).status, 'running')
+
+    def test_cancel_last_device_finishes_task(self):
+        task = create_task({'AAA': 'success', 'BBB': 'pending'}, status='running')
+
+        self.assertEqual(cancel_task(task.id, 'BBB'), 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'success')
+        self.assertIsNotNone(task.end_time)
+        self.assertEqual(TaskEvent.objects.filter(task=task, event_type='task_finished').count(), 1)
+
+
+class DeviceExecutorTests(SimpleTestCase):
+    """单个任务的并发设备数不超过单任务上限，所有任务合计不超过线程池大小"""
+
+    def test_per_task_and_total_caps(self):
+        executor = DeviceExecutor(3)
+        lock = threading.Lock()
+        running = {'total': 0}
+        peaks = {'total': 0}
+
+        def make_job(task):
+            def job(device_id):
+                with lock:
+                    for key in (task, 'total'):
+                        running[key] = running.get(key, 0) + 1
+                        peaks[key] = max(peaks.get(key, 0), running[key])
+                time.sleep(0.05)
+                with lock:
+                    running[task] -= 1
+                    running['total'] -= 1
+                if device_id == 'bad':
+                    raise RuntimeError('boom')
+                return device_id.lower()
+            return job
+
+        results = {}
+        threads = [
+            threading.Thread(target=lambda task=task: results.update(
+                {task: executor.run_all(['AAA', 'BBB', 'CCC', 'bad'], make_job(task), per_task_limit=2)}))
+            for task in ('first', 'second')
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(peaks['first'], 2)
+        self.assertEqual(peaks['second'], 2)
+        self.assertEqual(peaks['total'], 3)
+        for task_results in results.values():
+            self.assertEqual(task_results['AAA'], 'aaa')
+            self.assertIsInstance(task_results['bad'], RuntimeError)
+
+    @override_settings(TASK_MAX_DEVICES_PER_TASK=4)
+    def test_per_task_limit(self):
+        self.assertEqual(get_per_task_limit(0), 1)
+        self.assertEqual(get_per_task_limit(2), 2)
+        self.assertEqual(get_per_task_limit(10), 4)
+
+
+class ProgressWriteTests(TestCase):
+    """进度和步骤事件按间隔批量写入，设备结束时立即写入；设备结果只保存变化的字段"""
+
+    def setUp(self):
+        self.task = create_task({'AAA': 'running', 'BBB': 'running'}, status='running')
+
+    def test_buffered_until_device_finished(self):
+        reporter = ProgressReporter(self.task, ['AAA', 'BBB'], flush_interval=60)
+        reporter.device_started('AAA')
+        for step in range(1, 4):
+            reporter.script_step('AAA', step, total=3)
+        self.assertFalse(TaskEvent.objects.exists())
+        self.assertEqual(Task.objects.get(id=self.task.id).progress, 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            reporter.device_finished('AAA', 'success')
+        # 一次进度UPDATE和一次事件bulk_create
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(TaskEvent.objects.count(), 5)
+        self.assertEqual(Task.objects.get(id=self.task.id).progress, 50)
+
+        reporter.script_step('BBB', 1)
+        reporter.close()
+        self.assertEqual(TaskEvent.objects.filter(device_id='BBB').count(), 1)
+
+    def test_progress_never_decreases(self):
+        Task.objects.filter(id=self.task.id).update(progress=80, updated_time=timezone.now())
+        reporter = ProgressReporter(self.task, ['AAA', 'BBB'], flush_interval=0)
+        reporter.device_finished('AAA', 'success')
+
+        self.assertEqual(Task.objects.get(id=self.task.id).progress, 80)
+
+    def test_save_changed_fields(self):
+        device_result = self.task.device_results.get(device_id='AAA')
+        device_result.status = 'success'
+        device_result.device_name = 'renamed'
+        save_device_result(device_result, ['status'])
+
+        saved = TaskDeviceResult.objects.get(id=device_result.id)
+        self.assertEqual((saved.status, saved.device_name), ('success', 'AAA'))
+
+    def test_cancelled_device(self):
+        first, second = self.task.device_results.order_by('device_id')
+        # 其他主机已在数据库中标记取消
+        TaskDeviceResult.objects.filter(id=first.id).update(status='cancelled', updated_time=timezone.now())
+        first.status = 'success'
+        save_device_result(first, ['status'])
+        # 本进程收到取消通知
+        self.addCleanup(clear_cancellation, self.task.id)
+        cancel_local(self.task.id, 'BBB')
+        fail_device_result(second, None, RuntimeError('killed'))
+
+        for device_result in (first, second):
+            saved = TaskDeviceResult.objects.get(id=device_result.id)
+            self.assertEqual(saved.status, 'cancelled')
+            self.assertNotEqual(saved.error_message, '')
+
+
+class RequeueStaleTasksTests(TestCase):
+    """心跳超时的任务重新入队时只重置未完成的设备作业"""
+
+    def create_stale_task(self, statuses):
+        stale = timezone.now() - timedelta(hours=1)
+        task = create_task(statuses, result_fields={'worker': 'dead:1'}, status='running', worker='dead:1',
+                           heartbeat_time=stale, requested_devices=2)
+        for device_id in statuses:
+            DeviceLease.objects.create(device_id=device_id, task=task, worker='dead:1', heartbeat_time=stale)
+        return task
+
+    def test_keeps_finished_results(self):
+        task = self.create_stale_task({'AAA': 'success', 'BBB': 'running'})
+
+        self.assertEqual(requeue_stale_tasks(), 1)
+        results = dict(TaskDeviceResult.objects.filter(task=task).values_list('device_id', 'status'))
+        self.assertEqual(results, {'AAA': 'success', 'BBB': 'pending'})
+        self.assertEqual(TaskDeviceResult.objects.get(task=task, device_id='BBB').worker, '')
+        self.assertEqual(Task.objects.get(id=task.id).devices, ['AAA', 'BBB'])
+        self.assertFalse(DeviceLease.objects.exists())
+
+    def test_idle_sweep_is_read_only(self):
+        self.create_stale_task({'AAA': 'success'})
+        Task.objects.update(heartbeat_time=timezone.now())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(requeue_stale_tasks(), 0)
+        self.assertTrue(queries.captured_queries)
+        self.assertTrue(all(query['sql'].startswith('SELECT') for query in queries.captured_queries))
+
+    def test_reassigns_unstarted_auto_task(self):
+        task = self.create_stale_task({'AAA': 'running', 'BBB': 'pending'})
+
+        self.assertEqual(requeue_stale_tasks(), 1)
+        self.assertFalse(TaskDeviceResult.objects.filter(task=task).exists())
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.devices), ('pending', []))
+
+
+class ClaimJobTests(TestCase):
+    """多个worker同时领取时，同一设备作业和同一台设备只能被领取一次"""
+
+    @staticmethod
+    def create_task(devices):
+        return create_task(dict.fromkeys(devices, 'pending'))
+
+    def test_same_task_claimed_once(self):
+        task = self.create_task(['AAA', 'BBB'])
+
+        claimed_task, device_ids = claim_next_job('worker-1')
+        self.assertEqual((claimed_task.id, device_ids), (task.id, ['AAA', 'BBB']))
+        # 另一个worker读到的是领取之前的租约快照
+        self.assertIsNone(_claim_job(task.id, 'worker-2', '', {}))
+        self.assertEqual(set(TaskDeviceResult.objects.values_list('worker', flat=True)), {'worker-1'})
+        self.assertEqual(Task.objects.get(id=task.id).worker, 'worker-1')
+
+    def test_device_leased_to_one_task(self):
+        first = self.create_task(['AAA'])
+        second = self.create_task(['AAA'])
+
+        self.assertEqual(claim_next_job('worker-1')[0].id, first.id)
+        self.assertIsNone(claim_next_job('worker-2'))
+        # 租约快照过期时由设备租约的唯一约束保证互斥，领取回滚
+        self.assertIsNone(_claim_job(second.id, 'worker-2', '', {}))
+        self.assertEqual(TaskDeviceResult.objects.get(task=second).worker, '')
+        self.assertEqual(Task.objects.get(id=second.id).status, 'pending')
+        self.assertEqual(list(DeviceLease.objects.values_list('device_id', 'task_id')), [('AAA', first.id)])
+
+
+class InstallApkTests(SimpleTestCase):
+    """安装阶段：跳过已安装的构建、流式安装失败时回退、复用已推送的安装包、阶段超时"""
+
+    def setUp(self):
+        self.calls = []
+        self.responses = {}
+        fd, self.apk_path = tempfile.mkstemp(suffix='.apk')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'apk-bytes')
+        self.addCleanup(os.remove, self.apk_path)
+        self.build = SimpleNamespace(package_name='com.example', version_code=7, sha256='a' * 64)
+
+    def fake_run_adb(self, device_id, args, timeout):
+        """按命令的第一个参数返回预设结果，未预设的命令执行成功"""
+        self.calls.append(args)
+        key = args[1] if args[0] == 'shell' else ' '.join(args[:3])
+        response = self.responses.get(key, (0, 'Success'))
+        if callable(response):
+            response = response()
+        return subprocess.CompletedProcess(args, response[0], response[1], '')
+
+    def install(self, build=None):
+        with mock.patch('tasks.installer.run_adb', side_effect=self.fake_run_adb):
+            return install_apk('AAA', self.apk_path, 'android', build)
+
+    def test_skip_installed_build(self):
+        self.responses['dumpsys'] = (0, 'versionCode=7 minSdk=24')
+
+        result = self.install(self.build)
+        self.assertTrue(result['skipped'])
+        self.assertEqual(len(self.calls), 1)
+
+    @override_settings(APK_INSTALL_MODE='streamed')
+    def test_streamed_falls_back_to_install(self):
+        self.responses['dumpsys'] = (0, 'versionCode=6')
+        self.responses['install -r --streaming'] = (1, 'unknown option')
+
+        result = self.install(self.build)
+        self.assertTrue(result['success'])
+        self.assertEqual(self.calls[-1], ['install', '-r', self.apk_path])
+        self.assertIn('wait', result['timing'])
+
+    @override_settings(APK_INSTALL_MODE='push')
+    def test_push_reuses_remote_apk(self):
+        self.responses['stat'] = (0, f'{os.path.getsize(self.apk_path)}\n')
+
+        result = self.install(self.build)
+        self.assertTrue(result['success'])
+        self.assertTrue(result['timing']['push_reused'])
+        self.assertFalse(any(args[0] == 'push' for args in self.calls))
+        self.assertEqual(self.calls[-1], ['shell', 'pm', 'install', '-r', f'/data/local/tmp/{"a" * 64}.apk'])
+
+    @override_settings(TASK_STAGE_TIMEOUTS={'install': 0.1})
+    def test_stage_deadline(self):
+        def slow_check():
+            time.sleep(0.15)
+            return 0, 'versionCode=6'
+        self.responses['dumpsys'] = slow_check
+
+        result = self.install(self.build)
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error'], '安装超时')
+        # 超过阶段截止时间后不再执行安装命令
+        self.assertEqual(len(self.calls), 1)
+
+
+class DeviceLeaseTests(TestCase):
+    """设备租约一次性获取全部设备，同一台设备同一时间只属于一个任务"""
+
+    def setUp(self):
+        self.first, self.second = [create_task(name=f'task-{i}') for i in range(2)]
+
+    def test_all_or_nothing(self):
+        self.assertTrue(acquire_devices(self.first.id, ['AAA']))
+        self.assertFalse(acquire_devices(self.second.id, ['BBB', 'AAA']))
+        self.assertEqual(list(DeviceLease.objects.values_list('device_id', 'task_id')), [('AAA', self.first.id)])
+
+        self.assertEqual(release_devices(self.first.id), 1)
+        self.assertTrue(acquire_devices(self.second.id, ['BBB', 'AAA']))
+
+    @override_settings(DEVICE_LEASE_TIMEOUT=60)
+    def test_expired_lease_taken_over(self):
+        self.assertTrue(acquire_devices(self.first.id, ['AAA']))
+        DeviceLease.objects.update(heartbeat_time=timezone.now() - timedelta(minutes=5))
+
+        self.assertTrue(acquire_devices(self.second.id, ['AAA']))
+        self.assertEqual(DeviceLease.objects.get(device_id='AAA').task_id, self.second.id)
+
+
+class AirtestLogTests(SimpleTestCase):
+    """流式解析log.txt：过大的call_args替换为None，转义字符和分段边界不影响解析"""
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir, ignore_errors=True)
+        self.log_path = os.path.join(self.log_dir, LOG_FILE_NAME)
+
+    def write_log(self, entries, trailing_newline=True):
+        text = '\n'.join(json.dumps(entry) for entry in entries)
+        with open(self.log_path, 'w', encoding='utf-8') as f:
+            f.write(text + ('\n' if trailing_newline else ''))
+
+    @staticmethod
+    def function_entry(name, depth, call_args, start, end, ret=None, traceback=None):
+        data = {'name': name, 'call_args': call_args, 'start_time': start, 'end_time': end, 'ret': ret}
+        if traceback:
+            data['traceback'] = traceback
+        return {'tag': 'function', 'depth': depth, 'time': end, 'data': data}
+
+    def sample_entries(self):
+        screen = [[[index % 256] * 3 for index in range(200)] for _ in range(200)]
+        return [
+            self.function_entry('_cv_match', 3, {'screen': screen, 'note': 'a "quoted" \\ value'}, 1.0, 1.2),
+            self.function_entry('loop_find', 2, {'query': {'filename': 'tpl \\"x\\".png'}, 'timeout': 20},
+                                0.9, 1.3, ret=[10, 20]),
+            self.function_entry('touch', 1, {'v': {'filename': 'C:\\images\\"btn".png'}, 'times': 1},
+                                0.8, 1.5, ret=[10, 20]),
+            self.function_entry('assert_exists', 1, None, 1.6, 2.0,
+                                traceback='Traceback:\nTargetNotFoundError: "btn" not found'),
+        ]
+
+    def test_chunk_boundaries(self):
+        entries = self.sample_entries()
+        self.write_log(entries, trailing_newline=False)
+
+        expected = json.loads(json.dumps(entries))
+        expected[0]['data']['call_args'] = None
+        # 分段大小取奇数和偶数，使转义符、引号和键名落在分段边界上
+        for chunk_size in (5, 6, 7, 64 * 1024):
+            with self.subTest(chunk_size=chunk_size), mock.patch('tasks.airtest_log.READ_CHUNK_SIZE', chunk_size):
+                self.assertEqual(list(iter_log_entries(self.log_path)), expected)
+
+    def test_skips_oversized_and_invalid_lines(self):
+        entries = self.sample_entries()
+        self.write_log(entries)
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write('{"tag": "function", "data": {"name": "broken"\n')
+            f.write(json.dumps({'tag': 'function', 'depth': 1, 'data': {'name': 'x' * 300 * 1024}}) + '\n')
+            f.write(json.dumps(entries[-1]) + '\n')
+
+        names = [entry['data']['name'] for entry in iter_log_entries(self.log_path)]
+        self.assertEqual(names, ['_cv_match', 'loop_find', 'touch', 'assert_exists', 'assert_exists'])
+
+    def test_analyze_log(self):
+        self.write_log(self.sample_entries())
+
+        index, summary = analyze_log(self.log_dir)
+        self.assertEqual(index['step_count'], 2)
+        self.assertEqual(index['duration'], 1.2)
+        self.assertEqual(index['failed_step'], {'index': 2, 'name': 'assert_exists',
+                                                'error': 'TargetNotFoundError: "btn" not found'})
+        self.assertEqual(summary['matches'], [{'template': 'tpl \\"x\\".png', 'pos': [10, 20], 'attempts': 1,
+                                               'duration': 0.4, 'success': True}])
+
+    def test_follower_waits_for_complete_line(self):
+        follower = LogFollower(self.log_dir)
+        self.addCleanup(follower.close)
+        self.assertEqual(follower.poll(), [])
+
+        line = json.dumps(self.sample_entries()[1])
+        with open(self.log_path, 'w', encoding='utf-8') as f:
+            f.write(line[:30])
+        self.assertEqual(follower.poll(), [])
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(line[30:] + '\n')
+        self.assertEqual([entry['data']['name'] for entry in follower.poll()], ['loop_find'])
+
+
+class DeviceLogIndexTests(TestCase):
+    """每次执行使用独立的日志目录，日志索引通过接口返回"""
+
+    def setUp(self):
+        self.log_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_root, ignore_errors=True)
+        overrides = override_settings(AIRTEST_LOG_ROOT=self.log_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_run_log_dirs(self):
+        first = get_run_log_dir(1, '192.168.1.2:5555')
+        second = get_run_log_dir(1, 'AAA')
+        other_task = get_run_log_dir(2, 'AAA')
+
+        self.assertEqual(first, os.path.join(self.log_root, 'task_1', '192.168.1.2_5555'))
+        self.assertEqual(len({first, second, other_task}), 3)
+        self.assertTrue(os.path.isdir(first))
+        self.assertEqual(get_run_log_dir(None, '../AAA'), os.path.join(self.log_root, 'adhoc', '.._AAA'))
+
+    def test_log_index_view(self):
+        log_index = {'step_count': 2, 'failed_step': None}
+        task = create_task({'AAA': 'success'}, result_fields={'log_dir': get_run_log_dir(1, 'AAA'),
+                                                              'log_index': log_index})
+        device_result = task.device_results.get()
+
+        data = self.client.get(reverse('tasks:get_device_log_index', args=[device_result.id])).json()
+        self.assertEqual(data['device_result']['log_index'], log_index)
+        response = self.client.get(reverse('tasks:get_device_log_index', args=[device_result.id + 1]))
+        self.assertEqual(response.status_code, 404)
+
+
+class LiveOutputTests(SimpleTestCase):
+    """脚本输出逐行写入滚动日志文件，执行结果和实时输出接口只返回尾部"""
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir, ignore_errors=True)
+        self.path = os.path.join(self.log_dir, OUTPUT_FILE_NAME)
+
+    def test_rotation(self):
+        output = RotatingOutputFile(self.path, max_bytes=20, backup_count=2)
+        for i in range(12):
+            output.write_line(f'line-{i:02d}')
+        output.close()
+
+        self.assertEqual(sorted(os.listdir(self.log_dir)), [OUTPUT_FILE_NAME, f'{OUTPUT_FILE_NAME}.1',
+                                                           f'{OUTPUT_FILE_NAME}.2'])
+        # 写满max_bytes后的下一行写入新文件，超出backup_count的最早输出被丢弃
+        for name, first in ((OUTPUT_FILE_NAME, 9), (f'{OUTPUT_FILE_NAME}.1', 6), (f'{OUTPUT_FILE_NAME}.2', 3)):
+            with open(os.path.join(self.log_dir, name), encoding='utf-8') as f:
+                self.assertEqual(f.read().splitlines(), [f'line-{i:02d}' for i in range(first, first + 3)])
+
+    @mock.patch('tasks.live_output.TAIL_READ_BYTES', 25)
+    def test_read_tail(self):
+        self.assertEqual(read_output_tail(self.log_dir)['lines'], [])
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(''.join(f'line-{i:02d}\n' for i in range(10)))
+
+        tail = read_output_tail(self.log_dir, lines=2)
+        self.assertEqual(tail['lines'], ['line-08', 'line-09'])
+        self.assertEqual(tail['size'], 80)
+        # 只读取文件末尾，丢弃读到一半的第一行
+        self.assertEqual(read_output_tail(self.log_dir, lines=100)['lines'], ['line-07', 'line-08', 'line-09'])
+
+    @mock.patch('tasks.live_output.RESULT_TAIL_LINES', 3)
+    def test_streaming_process(self):
+        script = "import sys\nfor i in range(10): print(f'out-{i}', flush=True)\nprint('err', file=sys.stderr)"
+        result = run_streaming_process([sys.executable, '-c', script], self.log_dir, timeout=10)
+
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout, 'out-7\nout-8\nout-9')
+        self.assertEqual(result.stderr, 'err')
+        lines = read_output_tail(self.log_dir)['lines']
+        self.assertEqual(len(lines), 11)
+        self.assertIn('[stderr] err', lines)
+
+    @override_settings(SCRIPT_STEP_POLL_INTERVAL=0.05)
+    def test_streaming_timeout(self):
+        script = "import time\nprint('started', flush=True)\ntime.sleep(30)"
+        started = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired) as raised:
+            run_streaming_process([sys.executable, '-c', script], self.log_dir, timeout=0.5)
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(raised.exception.output, 'started')
+
+
+class ApkCacheTests(TestCase):
+    """安装包缓存淘汰不删除等待中和运行中任务使用的构建"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+
+    def create_build(self, sha256, minutes_ago, status):
+        file_path = os.path.join(self.cache_dir, f"{sha256}.apk")
+        with open(file_path, 'wb') as f:
+            f.write(b'0' * 100)
+        ApkBuild.objects.create(sha256=sha256, file_path=file_path, file_size=100,
+                                last_used_time=timezone.now() - timedelta(minutes=minutes_ago))
+        create_task(name=sha256, status=status, apk_sha256=sha256)
+        return file_path
+
+    def test_evict_skips_in_use(self):
+        running = self.create_build('running', 40, 'running')
+        pending = self.create_build('pending', 30, 'pending')
+        finished = self.create_build('finished', 20, 'success')
+        current = self.create_build('current', 10, 'success')
+
+        self.assertEqual(evict_apks(max_bytes=100, keep='current'), 1)
+        self.assertTrue(os.path.exists(running))
+        self.assertTrue(os.path.exists(pending))
+        self.assertFalse(os.path.exists(finished))
+        self.assertTrue(os.path.exists(current))
+        self.assertIsNone(get_build('finished'))
+        self.assertEqual(get_build('running').file_path, running)
+
+
+class BenchmarkDbTests(SimpleTestCase):
+    """数据库写入基准测试命令在临时数据库上完成所有方案，不遗留连接和写线程"""
+
+    def test_smoke(self):
+        writer_threads = sum(thread.name == 'db-writer' for thread in threading.enumerate())
+        out = io.StringIO()
+        # 命令运行时才创建的临时数据库连接
+        aliases = frozenset(f'benchmark_{name}' for name in SCENARIOS)
+        with mock.patch.object(BenchmarkDbTests, 'databases', aliases):
+            call_command('benchmark_db', '--threads', '2', '--writes', '4', '--readers', '1', stdout=out)
+
+        lines = out.getvalue().splitlines()
+        for name in SCENARIOS:
+            self.assertTrue(any(line.split()[0] == name for line in lines[2:]), name)
+        self.assertFalse([alias for alias in connections.settings if alias.startswith('benchmark_')])
+        self.assertEqual(sum(thread.name == 'db-writer' for thread in threading.enumerate()), writer_threads)
+
+
+FAKE_ADB = """#!/bin/sh
+echo Success
+"""
+
+# 启动后写入标记文件，然后一直运行直到被结束
+FAKE_AIRTEST = """#!/bin/sh
+touch "$0.started"
+sleep 30
+"""
+
+
+def write_tools(directory, scripts):
+    """在directory中写入可执行的假工具脚本，返回可用作TOOLCHAIN_PATHS的 {工具名称: 路径}"""
+    tools = {}
+    for name, content in scripts.items():
+        tools[name] = os.path.join(directory, name)
+        with open(tools[name], 'w') as f:
+            f.write(content)
+        os.chmod(tools[name], 0o755)
+    return tools
+
+
+class AsyncEngineTests(TransactionTestCase):
+    """asyncio引擎用异步子进程执行安装和脚本，超时和取消时结束子进程"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
+        tools = write_tools(self.temp_dir, {'adb': FAKE_ADB, 'airtest': FAKE_AIRTEST})
+        self.started_marker = tools['airtest'] + '.started'
+        overrides = override_settings(TOOLCHAIN_PATHS=tools, AIRTEST_LOG_ROOT=os.path.join(self.temp_dir, 'logs'),
+                                      TASK_PROGRESS_FLUSH_INTERVAL=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.task = create_task({'AAA': 'running'}, status='running')
+        self.device_result = self.task.device_results.get()
+        self.engine = AsyncEngine(max_sessions=4)
+        self.engine.start()
+        self.addCleanup(self.engine.stop)
+        self.addCleanup(clear_cancellation, self.task.id)
+
+    def run_device(self):
+        reporter = ProgressReporter(self.task, ['AAA'], flush_interval=0)
+        prepared = prepare_script(self.task.test_case, 'android')
+        coroutine = self.engine.run_device(self.task, prepared, self.device_result, 'app.apk', None, reporter)
+        return asyncio.run_coroutine_threadsafe(coroutine, self.engine._loop)
+
+    @override_settings(TASK_STAGE_TIMEOUTS={'install': 10, 'run': 0.5})
+    def test_run_timeout(self):
+        started = time.monotonic()
+        self.run_device().result(timeout=10)
+
+        self.assertLess(time.monotonic() - started, 5)
+        result = TaskDeviceResult.objects.get(id=self.device_result.id)
+        self.assertEqual(result.status, 'failed')
+        self.assertEqual(result.error_message, '执行超时')
+        self.assertTrue(result.result_data['install_result']['success'])
+
+    def test_cancel_kills_script(self):
+        started = time.monotonic()
+        future = self.run_device()
+        while not os.path.exists(self.started_marker):
+            self.assertLess(time.monotonic() - started, 5)
+            time.sleep(0.05)
+
+        cancel_task(self.task.id, 'AAA')
+        self.assertEqual(cancel_local(self.task.id, 'AAA'), 1)
+        future.result(timeout=10)
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(TaskDeviceResult.objects.get(id=self.device_result.id).status, 'cancelled')
+
+
+class ToolchainTests(SimpleTestCase):
+    """工具路径解析一次后缓存，配置变化时重新解析；工具缺失时给出明确提示，健康检查返回503"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
+        self.tools = write_tools(self.temp_dir, {'adb': FAKE_ADB})
+        self.tools['airtest'] = os.path.join(self.temp_dir, 'missing-airtest')
+
+    def test_probe_is_cached(self):
+        toolchain = Toolchain()
+        with override_settings(TOOLCHAIN_PATHS=self.tools), \
+                mock.patch('Automation_Platform.toolchain.subprocess.run', wraps=subprocess.run) as run:
+            self.assertEqual(toolchain.get_path('adb'), self.tools['adb'])
+            probed = run.call_count
+            toolchain.get_path('adb')
+            self.assertEqual(run.call_count, probed)
+
+            with self.assertRaises(ToolNotFoundError) as raised:
+                toolchain.get_path('airtest')
+            self.assertIsInstance(raised.exception, FileNotFoundError)
+            self.assertIn('TOOLCHAIN_PATHS', str(raised.exception))
+
+        # 配置变化后重新解析
+        with override_settings(TOOLCHAIN_PATHS={'adb': os.path.join(self.temp_dir, 'missing-adb')}):
+            with self.assertRaises(ToolNotFoundError):
+                toolchain.get_path('adb')
+
+    def test_health(self):
+        with override_settings(TOOLCHAIN_PATHS=self.tools, TOOLCHAIN_REQUIRED=['adb', 'airtest']):
+            response = self.client.get(reverse('health'))
+            self.assertEqual(response.status_code, 503)
+            data = response.json()
+            self.assertFalse(data['success'])
+            self.assertIn('airtest', data['message'])
+            self.assertEqual(data['tools']['adb']['version'], 'Success')
+
+        with override_settings(TOOLCHAIN_PATHS=self.tools, TOOLCHAIN_REQUIRED=['adb']):
+            response = self.client.get(reverse('health'))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.json()['success'])
+
+
+class ScriptRunnerTests(SimpleTestCase):
+    """按注册顺序匹配运行器，准备失败时返回带原因的结果，阶段计时和超时"""
+
+    class ShellRunner(ScriptRunner):
+        name = 'shell'
+        platforms = ('android', 'ios')
+
+        def matches(self, test_case):
+            return test_case.file_path.endswith('.sh')
+
+        def prepare(self, test_case):
+            raise OSError('missing')
+
+    @staticmethod
+    def script(file_type, file_path):
+        return SimpleNamespace(file_type=file_type, file_path=file_path)
+
+    def test_registry(self):
+        self.assertIsInstance(get_runner(self.script('airtest', 'project.zip')), AirtestProjectRunner)
+        self.assertIsInstance(get_runner(self.script('airtest', 'script.air')), AirtestRunner)
+        self.assertIsInstance(get_runner(self.script('python', 'script.py')), AirtestRunner)
+        self.assertIsNone(get_runner(self.script('shell', 'script.sh')))
+
+        with mock.patch('tasks.runners._runners', []) as runners:
+            register_runner(AirtestRunner())
+            register_runner(self.ShellRunner(), first=True)
+            self.assertEqual([runner.name for runner in runners], ['shell', 'airtest'])
+            self.assertEqual(get_runner(self.script('python', 'script.sh')).name, 'shell')
+
+    def test_prepare_errors(self):
+        self.assertEqual(prepare_script(self.script('shell', 'script.sh'), 'android').error, '不支持的脚本类型')
+        self.assertEqual(prepare_script(self.script('python', 'script.py'), 'ios').error, 'iOS设备暂不支持')
+        with mock.patch('tasks.runners._runners', [self.ShellRunner()]):
+            prepared = prepare_script(self.script('shell', 'script.sh'), 'ios')
+        self.assertEqual(prepared.error, '脚本准备失败: missing')
+
+        prepared = prepare_script(self.script('python', 'script.py'), 'android')
+        self.assertEqual(prepared.error, '')
+        self.assertEqual(prepared.script_path, os.path.abspath('script.py'))
+        self.assertEqual(prepared.start_timer().timing, {'prepare': prepared.prepare_time})
+
+    def test_stage_timer(self):
+        timer = StageTimer()
+        with self.assertRaises(RuntimeError), timer.stage('run'):
+            raise RuntimeError('boom')
+        self.assertIn('run', timer.timing)
+
+        with override_settings(TASK_STAGE_TIMEOUTS={'run': 5}):
+            self.assertEqual(get_stage_timeout('run'), 5)
+            self.assertEqual(get_stage_timeout('install'), 180)
+
+
+@override_settings(AGENT_TOKEN='secret')
+class TaskArtifactTests(TestCase):
+    """任务文件只提供给携带代理令牌的请求"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
+        script_path = os.path.join(self.temp_dir, 'script.py')
+        with open(script_path, 'w') as f:
+            f.write('touch()')
+        self.task = create_task(script=create_script(file_path=script_path, file_size=7))
+        self.url = reverse('tasks:download_task_artifact', args=[self.task.id, 'script'])
+
+    def test_requires_token(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(self.url, headers={'X-Agent-Token': 'wrong'}).status_code, 403)
+        with override_settings(AGENT_TOKEN=''):
+            self.assertEqual(self.client.get(self.url, headers={'X-Agent-Token': ''}).status_code, 403)
+
+        response = self.client.get(self.url, headers={'X-Agent-Token': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'touch()')
+
+    def test_hides_errors(self):
+        with mock.patch('tasks.views.FileResponse', side_effect=OSError('/secret/path')), \
+                self.assertLogs('tasks.views', 'ERROR'):
+            response = self.client.get(self.url, headers={'X-Agent-Token': 'secret'})
+        self.assertEqual(response.status_code, 500)
+        self.assertNotIn('/secret/path', response.json()['message'])
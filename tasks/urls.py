@@ -7,4 +7,11 @@ urlpatterns = [
     path('', views.running_tasks, name='running_tasks'),  # 任务运行页
     path('api/status/<int:task_id>/', views.get_task_status, name='get_task_status'),  # 获取单个任务状态
     path('api/status/all/', views.get_all_tasks_status, name='get_all_tasks_status'),  # 获取所有任务状态
+    path('api/changes/', views.get_task_changes, name='get_task_changes'),  # 增量获取任务状态变化
+    path('api/stream/', views.task_event_stream, name='task_event_stream'),  # 任务进度推送
+    path('api/results/<int:result_id>/log/', views.get_device_log_index, name='get_device_log_index'),  # 设备执行日志索引
+    path('api/results/<int:result_id>/output/', views.get_device_output, name='get_device_output'),  # 设备执行实时输出
+    path('api/artifacts/<int:task_id>/<str:kind>/', views.download_task_artifact, name='download_task_artifact'),  # 设备代理下载任务文件
+    path('api/cancel/<int:task_id>/', views.cancel_task_view, name='cancel_task'),  # 取消任务或单台设备
+    path('api/builds/', views.list_apk_builds, name='list_apk_builds'),  # 已缓存安装包列表
 ]
\ No newline at end of file
@@ -1,469 +1,434 @@
 from django.shortcuts import render
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.http import JsonResponse
-from .models import Task, TaskDeviceResult
-import subprocess
-import threading
-import time
-import os
+from django.db.models import Count, Q
+from django.http import JsonResponse, FileResponse
+from django.views.decorators.http import require_POST
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Task, TaskDeviceResult, ApkBuild
+from .progress import TASK_EVENTS_TOPIC, get_events_after, start_event_relay
+from .live_output import read_output_tail
+from .cancellation import cancel_task
+from .agent import is_agent_request
+from Automation_Platform.events import broker, sse_response
+from Automation_Platform.pagination import EPOCH, CursorPaginator, InvalidCursor
 from django.conf import settings
 from django.utils import timezone
+from datetime import datetime, time, timedelta
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
 
 def running_tasks(request):
     """任务运行页"""
-    # 获取所有任务
-    all_tasks = Task.objects.all().order_by('-created_time')
-
-    # 分页处理
-    paginator = Paginator(all_tasks, 15)  # 每页显示15条
-    page = request.GET.get('page', 1)
+    # 页面渲染前的时间点作为增量更新的起始游标
+    changes_cursor = to_cursor(timezone.now() - get_changes_lookback())
 
+    # 按(创建时间, id)游标分页，深层页面与首页开销相同
+    paginator = CursorPaginator(Task.objects.all(), 'created_time', 15)  # 每页显示15条
     try:
-        tasks = paginator.page(page)
-    except PageNotAnInteger:
-        tasks = paginator.page(1)
-    except EmptyPage:
-        tasks = paginator.page(paginator.num_pages)
-
-    return render(request, 'tasks/running_tasks.html', {"tasks": tasks, "nav": "tasks"})
-def execute_task_async(task_id):
-    """异步执行任务"""
-    try:
-        task = Task.objects.get(id=task_id)
-
-        # 添加调试信息
-        print(f"[DEBUG] 开始执行任务 {task_id}: {task.name}")
-
-        # 更新任务状态为运行中
-        task.status = 'running'
-        task.start_time = timezone.now()
-        task.save()
-
-        # 获取任务详情
-        test_case = task.test_case
-        devices = task.devices
-        app_file = task.app_file
-        platform = task.platform
-
-        print(f"[DEBUG] 任务详情: 设备={devices}, 平台={platform}, 脚本={test_case.file_path}")
-        print(f"[DEBUG] APK文件路径: {app_file}")
-        print(f"[DEBUG] APK文件是否存在: {os.path.exists(app_file) if app_file else 'None'}")
-
-        # 为每个设备创建执行记录
-        device_results = {}
-        for device_id in devices:
-            device_result = TaskDeviceResult.objects.create(
-                task=task,
-                device_id=device_id,
-                device_name=f"Device ({device_id[:8]}...)",
-                status='running',
-                start_time=timezone.now()
-            )
-            device_results[device_id] = device_result
-
-        # 真实任务执行
-        def real_execution():
-            print(f"[DEBUG] 后台线程开始执行")
-            try:
-                # 更新任务进度
-                task.progress = 10
-                task.save()
-
-                for device_id, device_result in device_results.items():
-                    device_result.status = 'running'
-                    device_result.save()
-
-                # 为每个设备执行任务
-                for device_id, device_result in device_results.items():
-                    try:
-                        # 1. 安装APK
-                        install_result = install_apk(device_id, app_file, platform)
-                        if not install_result['success']:
-                            raise Exception(f"APK安装失败: {install_result['error']}")
-
-                        # 2. 执行测试脚本
-                        execute_result = execute_test_script(device_id, test_case, platform)
-
-                        # 3. 更新设备结果
-                        device_result.status = 'success' if execute_result['success'] else 'failed'
-                        device_result.end_time = timezone.now()
-                        device_result.result_data = {
-                            'install_result': install_result,
-                            'execute_result': execute_result,
-                            'message': '测试执行成功' if execute_result['success'] else '测试执行失败'
-                        }
-                        if not execute_result['success']:
-                            device_result.error_message = execute_result.get('error', '未知错误')
-                        device_result.save()
-
-                    except Exception as e:
-                        device_result.status = 'failed'
-                        device_result.end_time = timezone.now()
-                        device_result.error_message = str(e)
-                        device_result.save()
-
-                # 检查所有设备的执行结果，决定任务最终状态
-                failed_count = 0
-                for device_id, device_result in device_results.items():
-                    if device_result.status == 'failed':
-                        failed_count += 1
-
-                # 如果有设备失败，任务状态为失败；否则为成功
-                if failed_count > 0:
-                    task.status = 'failed'
-                    task.error_message = f"有 {failed_count} 个设备执行失败"
-                else:
-                    task.status = 'success'
-
-                task.end_time = timezone.now()
-                task.progress = 100
-                task.save()
-
-                # 删除APK文件（不存储在服务器）
-                try:
-                    if os.path.exists(app_file):
-                        os.remove(app_file)
-                except:
-                    pass
-
-            except Exception as e:
-                # 更新任务状态为失败
-                task.status = 'failed'
-                task.end_time = timezone.now()
-                task.error_message = str(e)
-                task.save()
-
-        # 在后台线程中执行
-        print(f"[DEBUG] 准备启动后台线程")
-        thread = threading.Thread(target=real_execution)
-        thread.daemon = True
-
-        # 在后台线程中执行任务，确保立即返回响应
-        thread.start()
-        print(f"[DEBUG] 后台线程已启动，线程ID: {thread.ident}")
+        tasks = paginator.page(after=request.GET.get('after'), before=request.GET.get('before'), with_count=True)
+    except InvalidCursor:
+        tasks = paginator.page(with_count=True)
+
+    return render(request, 'tasks/running_tasks.html', {
+        "tasks": tasks,
+        "nav": "tasks",
+        "changes_cursor": changes_cursor,
+    })
 
+def get_task_status(request, task_id):
+    """获取任务状态的API（进度由执行器写入，这里只读）"""
+    try:
+        task = annotate_device_stats(Task.objects.filter(id=task_id)).get()
+        return JsonResponse({
+            'success': True,
+            'task': serialize_task(task, get_annotated_device_stats(task))
+        })
     except Task.DoesNotExist:
-        pass
+        return JsonResponse({'success': False, 'message': '任务不存在'}, status=404)
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=500)
+
+DEVICE_STAT_STATUSES = ['pending', 'running', 'success', 'failed']
+
+
+def annotate_device_stats(queryset):
+    """用一次GROUP BY查询为每个任务附加设备结果统计"""
+    annotations = {'stats_total': Count('device_results')}
+    for status in DEVICE_STAT_STATUSES:
+        annotations[f'stats_{status}'] = Count('device_results', filter=Q(device_results__status=status))
+    return queryset.annotate(**annotations)
+
+
+def get_annotated_device_stats(task):
+    """读取annotate_device_stats附加的统计结果"""
+    device_stats = {'total': task.stats_total}
+    for status in DEVICE_STAT_STATUSES:
+        device_stats[status] = getattr(task, f'stats_{status}')
+    return device_stats
+
+
+def serialize_task(task, device_stats):
+    """任务状态的JSON格式"""
+    return {
+        'id': task.id,
+        'name': task.name,
+        'status': task.status,
+        'status_display': task.get_status_display(),
+        'progress': task.progress,
+        'runtime': task.runtime,
+        'device_count': task.device_count,
+        'device_stats': device_stats,
+        'created_time': task.created_time.strftime('%Y/%m/%d %H:%M:%S'),
+        'start_time': task.start_time.strftime('%Y/%m/%d %H:%M:%S') if task.start_time else None,
+        'end_time': task.end_time.strftime('%Y/%m/%d %H:%M:%S') if task.end_time else None,
+        'error_message': task.error_message
+    }
+
+
+def parse_time_param(value):
+    """解析时间筛选参数，支持ISO日期时间或日期"""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        parsed_date = parse_date(value)
+        if parsed_date is None:
+            raise ValueError(f"无效的时间参数: {value}")
+        parsed = datetime.combine(parsed_date, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
 
-def install_apk(device_id, apk_file_path, platform):
-    """安装APK到设备"""
+def get_all_tasks_status(request):
+    """
+    获取任务状态列表的API
+
+    查询参数：
+        status    按状态筛选，多个状态用逗号分隔
+        since     创建时间下限（含），ISO日期时间或日期
+        until     创建时间上限（不含）
+        after     下一页游标（上一次响应的pagination.next_cursor）
+        before    上一页游标（上一次响应的pagination.previous_cursor）
+        page_size 每页数量，默认15，最大100
+        count     为approximate时返回近似总数（仅未筛选时可用）
+    响应中的pagination.total在未请求或无法估算时为null
+    """
     try:
-        if platform == 'android':
-            # 使用adb install命令安装APK，修复编码问题
-            cmd = ['adb', '-s', device_id, 'install', apk_file_path]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60,
-                                  encoding='utf-8', errors='ignore')
-
-            if result.returncode == 0:
-                return {'success': True, 'output': result.stdout}
-            else:
-                return {'success': False, 'error': result.stderr}
-        else:
-            # iOS设备暂不支持
-            return {'success': False, 'error': 'iOS设备暂不支持'}
-    except subprocess.TimeoutExpired:
-        return {'success': False, 'error': '安装超时'}
+        tasks = Task.objects.all()
+
+        status = request.GET.get('status')
+        if status:
+            tasks = tasks.filter(status__in=[s for s in status.split(',') if s])
+
+        try:
+            since = parse_time_param(request.GET.get('since'))
+            until = parse_time_param(request.GET.get('until'))
+            page_size = min(100, max(1, int(request.GET.get('page_size', 15))))
+        except ValueError as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+        if since:
+            tasks = tasks.filter(created_time__gte=since)
+        if until:
+            tasks = tasks.filter(created_time__lt=until)
+
+        paginator = CursorPaginator(tasks, 'created_time', page_size)
+        try:
+            page = paginator.page(after=request.GET.get('after'), before=request.GET.get('before'),
+                                  with_count=request.GET.get('count') == 'approximate')
+        except InvalidCursor as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+        # 统计只针对当前页的任务，避免对整个筛选结果做GROUP BY
+        page_tasks = annotate_device_stats(Task.objects.filter(id__in=[task.id for task in page]))
+        stats = {task.id: get_annotated_device_stats(task) for task in page_tasks}
+        tasks_data = [serialize_task(task, stats[task.id]) for task in page]
+
+        return JsonResponse({
+            'success': True,
+            'tasks': tasks_data,
+            'pagination': {
+                'page_size': page_size,
+                'has_next': page.has_next,
+                'has_previous': page.has_previous,
+                'next_cursor': page.next_cursor,
+                'previous_cursor': page.previous_cursor,
+                'total': page.approximate_count,
+            }
+        })
     except Exception as e:
-        return {'success': False, 'error': str(e)}
-def execute_test_script(device_id, test_case, platform):
-    """执行测试脚本"""
+        return JsonResponse({'success': False, 'message': str(e)}, status=500)
+
+
+# 单次增量查询返回的最大记录数
+CHANGES_LIMIT = 500
+
+
+def get_changes_lookback():
+    """
+    增量游标的回看时长：updated_time在各进程写入时生成，提交可能晚于生成时间，
+    已取到最新变化时游标停在当前时间之前该时长处，稍后提交的变化在下一次请求中仍会返回
+    """
+    return timedelta(seconds=getattr(settings, 'TASK_CHANGES_LOOKBACK', 5))
+
+
+def to_cursor(value, result_pk=None, task_pk=None):
+    """
+    增量游标：<微秒时间戳>（返回该时间及之后的变化，可能重复），
+    或数据被截断时的 <微秒时间戳>_<设备结果id>_<任务id>（从各表的该位置之后继续）
+    """
+    micros = (value - EPOCH) // timedelta(microseconds=1)
+    if result_pk is None:
+        return str(micros)
+    return f"{micros}_{result_pk}_{task_pk}"
+
+
+def from_cursor(cursor):
+    """解析增量游标，返回(时间, 设备结果id, 任务id)，时间戳游标的id为None"""
+    parts = cursor.split('_')
+    if len(parts) not in (1, 3):
+        raise ValueError(cursor)
+    since = EPOCH + timedelta(microseconds=int(parts[0]))
+    if len(parts) == 1:
+        return since, None, None
+    return since, int(parts[1]), int(parts[2])
+
+
+def changed_since(queryset, since, pk):
+    """按(updated_time, id)取游标之后的变化"""
+    if pk is None:
+        queryset = queryset.filter(updated_time__gte=since)
+    else:
+        queryset = queryset.filter(Q(updated_time__gt=since) | Q(updated_time=since, id__gt=pk))
+    return queryset.order_by('updated_time', 'id')
+
+
+def last_pk_at(rows, value, pk):
+    """rows中更新时间等于value的最大id（包括之前已返回的pk）"""
+    pks = [row_pk for row_pk, updated_time in rows if updated_time == value]
+    return max(pks + [pk or 0])
+
+
+def serialize_device_result(device_result):
+    """设备执行结果的JSON格式（不含体积较大的result_data）"""
+    return {
+        'id': device_result.id,
+        'task_id': device_result.task_id,
+        'device_id': device_result.device_id,
+        'device_name': device_result.device_name,
+        'status': device_result.status,
+        'status_display': device_result.get_status_display(),
+        'start_time': device_result.start_time.strftime('%Y/%m/%d %H:%M:%S') if device_result.start_time else None,
+        'end_time': device_result.end_time.strftime('%Y/%m/%d %H:%M:%S') if device_result.end_time else None,
+        'error_message': device_result.error_message,
+    }
+
+
+def get_task_changes(request):
+    """
+    增量任务状态API：返回游标之后有变化的任务和设备结果
+
+    查询参数：
+        cursor  上一次响应返回的游标（微秒时间戳）；为空时只返回当前游标
+    响应中的cursor用于下一次请求，has_more为true时应立即继续请求
+    """
     try:
-        script_path = test_case.file_path
-        print(f"[DEBUG] 执行脚本: {script_path}, 类型: {test_case.file_type}")
-
-        if platform == 'android':
-            if test_case.file_type == 'python':
-                # Python脚本实际上是Airtest脚本，应该在服务器端执行
-                print(f"[DEBUG] 执行Python Airtest脚本: {script_path}")
-
-                # 1. 构建正确的device参数
-                device_uri = f"Android://127.0.0.1:5037/{device_id}"
-
-                # 2. 创建日志目录（使用绝对路径）
-                log_dir = os.path.abspath(os.path.join('logs', 'airtest'))
-                os.makedirs(log_dir, exist_ok=True)
-                log_file = os.path.join(log_dir, f"test_{device_id}_{int(time.time())}.log")
-
-                # 3. 构建Airtest命令
-                cmd = [
-                    'airtest', 'run',
-                    script_path,
-                    '--device', device_uri,
-                    '--log', log_dir
-                ]
-
-                print(f"[DEBUG] Python Airtest命令: {' '.join(cmd)}")
-
-                # 4. 检查Airtest是否可用
-                check_cmd = ['where', 'airtest'] if os.name == 'nt' else ['which', 'airtest']
-                check_result = subprocess.run(check_cmd, capture_output=True, text=True,
-                                            encoding='utf-8', errors='ignore')
-
-                if check_result.returncode != 0:
-                    return {'success': False, 'error': 'Airtest未安装或不在PATH中'}
-
-                # 5. 执行Airtest脚本
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=300,
-                                      encoding='utf-8', errors='ignore')
-                print(f"[DEBUG] Python Airtest执行结果: {result.returncode}")
-                print(f"[DEBUG] Python Airtest输出: {result.stdout}")
-                if result.stderr:
-                    print(f"[DEBUG] Python Airtest错误: {result.stderr}")
-
-                # 6. 检查执行结果
-                # Airtest有时会返回特殊错误码4294967295，但实际上脚本可能已执行
-                if result.returncode == 0 or result.returncode == 4294967295:
-                    # 检查是否有明显的错误信息
-                    if result.stderr and 'Error' in result.stderr and 'Traceback' in result.stderr:
-                        return {'success': False, 'error': f'Airtest执行出错: {result.stderr}'}
-                    else:
-                        return {'success': True, 'output': result.stdout, 'log_file': log_file}
-                else:
-                    error_msg = result.stderr if result.stderr else result.stdout
-                    return {'success': False, 'error': f'Airtest执行失败: {error_msg}'}
-
-            elif test_case.file_type == 'airtest':
-                # 检查是否是ZIP文件，如果是则解压
-                if script_path.endswith('.zip'):
-                    print(f"[DEBUG] 执行ZIP文件: {script_path}")
-                    zip_result = extract_and_run_zip_script(device_id, script_path, platform)
-                    return zip_result
-                else:
-                    # 执行Airtest脚本 - 修复关键问题
-                    print(f"[DEBUG] 执行Airtest脚本: {script_path}")
-
-                    # 1. 构建正确的device参数
-                    device_uri = f"Android://127.0.0.1:5037/{device_id}"
-
-                    # 2. 创建日志目录
-                    log_dir = os.path.join('logs', 'airtest')
-                    os.makedirs(log_dir, exist_ok=True)
-                    log_file = os.path.join(log_dir, f"test_{device_id}_{int(time.time())}.log")
-
-                    # 3. 构建Airtest命令
-                    cmd = [
-                        'airtest', 'run',
-                        script_path,
-                        '--device', device_uri,
-                        '--log', log_dir
-                    ]
-
-                    print(f"[DEBUG] Airtest命令: {' '.join(cmd)}")
-
-                    # 4. 检查Airtest是否可用
-                    check_cmd = ['where', 'airtest'] if os.name == 'nt' else ['which', 'airtest']
-                    check_result = subprocess.run(check_cmd, capture_output=True, text=True,
-                                                encoding='utf-8', errors='ignore')
-
-                    if check_result.returncode != 0:
-                        return {'success': False, 'error': 'Airtest未安装或不在PATH中'}
-
-                    # 5. 执行Airtest脚本
-                    result = subprocess.run(cmd, capture_output=True, text=True, timeout=300,
-                                          encoding='utf-8', errors='ignore')
-                    print(f"[DEBUG] Airtest执行结果: {result.returncode}")
-                    print(f"[DEBUG] Airtest输出: {result.stdout}")
-                    if result.stderr:
-                        print(f"[DEBUG] Airtest错误: {result.stderr}")
-
-                    # 6. 检查执行结果
-                    # Airtest有时会返回特殊错误码4294967295，但实际上脚本可能已执行
-                    if result.returncode == 0 or result.returncode == 4294967295:
-                        # 检查是否有明显的错误信息
-                        if result.stderr and 'Error' in result.stderr and 'Traceback' in result.stderr:
-                            return {'success': False, 'error': f'Airtest执行出错: {result.stderr}'}
-                        else:
-                            return {'success': True, 'output': result.stdout, 'log_file': log_file}
-                    else:
-                        error_msg = result.stderr if result.stderr else result.stdout
-                        return {'success': False, 'error': f'Airtest执行失败: {error_msg}'}
-            else:
-                return {'success': False, 'error': '不支持的脚本类型'}
+        cursor = request.GET.get('cursor')
+        if not cursor:
+            return JsonResponse({
+                'success': True,
+                'cursor': to_cursor(timezone.now() - get_changes_lookback()),
+                'tasks': [],
+                'device_results': [],
+                'has_more': False,
+            })
+
+        try:
+            since, result_pk, task_pk = from_cursor(cursor)
+        except (TypeError, ValueError, OverflowError):
+            return JsonResponse({'success': False, 'message': f"无效的游标: {cursor}"}, status=400)
+
+        device_results = list(
+            changed_since(TaskDeviceResult.objects.all(), since, result_pk)
+            .defer('result_data', 'log_index')[:CHANGES_LIMIT]
+        )
+        changed_tasks = list(
+            changed_since(Task.objects.all(), since, task_pk)
+            .values_list('id', 'updated_time')[:CHANGES_LIMIT]
+        )
+        results_truncated = len(device_results) == CHANGES_LIMIT
+        tasks_truncated = len(changed_tasks) == CHANGES_LIMIT
+        has_more = results_truncated or tasks_truncated
+
+        # 设备结果有变化的任务也需要返回最新统计
+        task_ids = {task_id for task_id, _ in changed_tasks}
+        task_ids.update(r.task_id for r in device_results)
+        tasks = annotate_device_stats(Task.objects.filter(id__in=task_ids)) if task_ids else []
+
+        if has_more:
+            # 数据被截断时游标推进到被截断的表中较早的末尾位置，并记录两张表在该时间上已返回的id
+            ends = []
+            if results_truncated:
+                ends.append(device_results[-1].updated_time)
+            if tasks_truncated:
+                ends.append(changed_tasks[-1][1])
+            end = min(ends)
+            result_rows = [(r.id, r.updated_time) for r in device_results]
+            next_cursor = to_cursor(end,
+                                    last_pk_at(result_rows, end, result_pk if end == since else None),
+                                    last_pk_at(changed_tasks, end, task_pk if end == since else None))
         else:
-            return {'success': False, 'error': 'iOS设备暂不支持'}
+            next_cursor = to_cursor(max(since, timezone.now() - get_changes_lookback()))
 
-    except subprocess.TimeoutExpired:
-        return {'success': False, 'error': '执行超时'}
+        return JsonResponse({
+            'success': True,
+            'cursor': next_cursor,
+            'tasks': [serialize_task(task, get_annotated_device_stats(task)) for task in tasks],
+            'device_results': [serialize_device_result(r) for r in device_results],
+            'has_more': has_more,
+        })
     except Exception as e:
-        print(f"[DEBUG] 执行脚本异常: {str(e)}")
-        return {'success': False, 'error': str(e)}
+        return JsonResponse({'success': False, 'message': str(e)}, status=500)
 
-def extract_and_run_zip_script(device_id, zip_path, platform):
-    """解压ZIP文件并执行脚本"""
-    import tempfile
-    import zipfile
 
-    try:
-        # 创建临时目录
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # 解压ZIP文件
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-
-            # 查找主要的脚本文件
-            main_script = None
-            for root, dirs, files in os.walk(temp_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    if file.endswith('.py'):
-                        main_script = file_path
-                        break
-                if main_script:
-                    break
-
-            if not main_script:
-                return {'success': False, 'error': 'ZIP文件中未找到Python脚本'}
-
-            print(f"[DEBUG] ZIP中找到脚本: {main_script}")
-
-            # 对于ZIP文件，假设是Airtest项目，在服务器上执行
-            # 1. 构建正确的device参数
-            device_uri = f"Android://127.0.0.1:5037/{device_id}"
-
-            # 2. 创建日志目录（使用绝对路径）
-            log_dir = os.path.abspath(os.path.join('logs', 'airtest'))
-            os.makedirs(log_dir, exist_ok=True)
-            log_file = os.path.join(log_dir, f"test_{device_id}_{int(time.time())}.log")
-
-            # 3. 构建Airtest命令
-            cmd = [
-                'airtest', 'run',
-                main_script,
-                '--device', device_uri,
-                '--log', log_dir
-            ]
-
-            print(f"[DEBUG] ZIP Airtest命令: {' '.join(cmd)}")
-
-            # 4. 检查Airtest是否可用
-            check_cmd = ['where', 'airtest'] if os.name == 'nt' else ['which', 'airtest']
-            check_result = subprocess.run(check_cmd, capture_output=True, text=True,
-                                        encoding='utf-8', errors='ignore')
-
-            if check_result.returncode != 0:
-                return {'success': False, 'error': 'Airtest未安装或不在PATH中'}
-
-            # 5. 执行Airtest脚本（在脚本所在目录执行，以便找到图片文件）
-            script_dir = os.path.dirname(main_script)
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300,
-                                  cwd=script_dir, encoding='utf-8', errors='ignore')
-            print(f"[DEBUG] ZIP Airtest执行结果: {result.returncode}")
-            print(f"[DEBUG] ZIP Airtest输出: {result.stdout}")
-            if result.stderr:
-                print(f"[DEBUG] ZIP Airtest错误: {result.stderr}")
-
-            # 6. 检查执行结果
-            # Airtest有时会返回特殊错误码4294967295，但实际上脚本可能已执行
-            if result.returncode == 0 or result.returncode == 4294967295:
-                # 检查是否有明显的错误信息
-                if result.stderr and 'Error' in result.stderr and 'Traceback' in result.stderr:
-                    return {'success': False, 'error': f'Airtest执行出错: {result.stderr}'}
-                else:
-                    return {'success': True, 'output': result.stdout, 'log_file': log_file}
-            else:
-                error_msg = result.stderr if result.stderr else result.stdout
-                return {'success': False, 'error': f'Airtest执行失败: {error_msg}'}
+def task_event_stream(request):
+    """
+    任务进度推送（SSE）
+
+    查询参数：
+        task_id  只推送指定任务的事件
+    浏览器重连时根据Last-Event-ID补发断线期间的事件
+    """
+    task_id = request.GET.get('task_id')
+    task_id = int(task_id) if task_id and task_id.isdigit() else None
+    last_event_id = request.headers.get('Last-Event-ID', '')
+
+    subscription = broker.subscribe(TASK_EVENTS_TOPIC)
+    start_event_relay()
+
+    replay = get_events_after(int(last_event_id), task_id=task_id) if last_event_id.isdigit() else []
+    sent = {'last_id': 0}
 
+    def predicate(event):
+        if task_id is not None and event['task_id'] != task_id:
+            return False
+        # 补发与实时推送可能重叠，跳过已发送的事件
+        if event['id'] <= sent['last_id']:
+            return False
+        sent['last_id'] = event['id']
+        return True
+
+    return sse_response(request, subscription, initial=replay, predicate=predicate)
+
+
+def list_apk_builds(request):
+    """获取已缓存安装包列表的API（按最近使用时间排序）"""
+    try:
+        builds = ApkBuild.objects.order_by('-last_used_time')[:20]
+        return JsonResponse({
+            'success': True,
+            'builds': [build.to_dict() for build in builds]
+        })
     except Exception as e:
-        print(f"[DEBUG] ZIP处理异常: {str(e)}")
-        return {'success': False, 'error': f'ZIP处理失败: {str(e)}'}
+        return JsonResponse({'success': False, 'message': str(e)}, status=500)
 
-def get_task_status(request, task_id):
-    """获取任务状态的API"""
+
+def get_device_log_index(request, result_id):
+    """获取单台设备执行的日志索引（步骤、耗时、失败步骤、截图）"""
     try:
-        task = Task.objects.get(id=task_id)
-
-        # 获取设备结果统计
-        device_results = task.device_results.all()
-        device_stats = {
-            'total': device_results.count(),
-            'pending': device_results.filter(status='pending').count(),
-            'running': device_results.filter(status='running').count(),
-            'success': device_results.filter(status='success').count(),
-            'failed': device_results.filter(status='failed').count(),
-        }
-
-        # 计算进度
-        if task.status == 'running':
-            # 根据设备完成情况计算进度
-            completed_devices = device_stats['success'] + device_stats['failed']
-            if device_stats['total'] > 0:
-                base_progress = (completed_devices / device_stats['total']) * 80
-                # 加上运行中设备的基础进度
-                running_progress = (device_stats['running'] / device_stats['total']) * 40
-                task.progress = min(90, int(base_progress + running_progress))
-            else:
-                task.progress = min(90, task.progress + 5)  # 缓慢增长
-            task.save()
+        device_result = (TaskDeviceResult.objects.filter(id=result_id)
+                         .values('id', 'task_id', 'device_id', 'status', 'log_dir', 'log_index')
+                         .first())
+        if device_result is None:
+            return JsonResponse({'success': False, 'message': '设备结果不存在'}, status=404)
+        return JsonResponse({'success': True, 'device_result': device_result})
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=500)
 
+
+def get_device_output(request, result_id):
+    """
+    获取单台设备执行的实时输出（脚本stdout/stderr的最后若干行）
+
+    查询参数：
+        lines  返回的行数，默认100，最大500
+    last_output_time长时间不变说明脚本可能已卡住
+    """
+    try:
+        device_result = (TaskDeviceResult.objects.filter(id=result_id)
+                         .values('id', 'task_id', 'device_id', 'status', 'log_dir')
+                         .first())
+        if device_result is None:
+            return JsonResponse({'success': False, 'message': '设备结果不存在'}, status=404)
+
+        lines = request.GET.get('lines', '100')
+        lines = int(lines) if lines.isdigit() else 100
+        output = read_output_tail(device_result['log_dir'], lines)
         return JsonResponse({
             'success': True,
-            'task': {
-                'id': task.id,
-                'name': task.name,
-                'status': task.status,
-                'status_display': task.get_status_display(),
-                'progress': task.progress,
-                'runtime': task.runtime,
-                'device_count': task.device_count,
-                'device_stats': device_stats,
-                'created_time': task.created_time.strftime('%Y/%m/%d %H:%M:%S'),
-                'start_time': task.start_time.strftime('%Y/%m/%d %H:%M:%S') if task.start_time else None,
-                'end_time': task.end_time.strftime('%Y/%m/%d %H:%M:%S') if task.end_time else None,
-                'error_message': task.error_message
-            }
+            'device_result': device_result,
+            'output': output,
         })
-    except Task.DoesNotExist:
-        return JsonResponse({'success': False, 'message': '任务不存在'}, status=404)
     except Exception as e:
         return JsonResponse({'success': False, 'message': str(e)}, status=500)
 
-def get_all_tasks_status(request):
-    """获取所有任务状态的API"""
+
+def download_task_artifact(request, task_id, kind):
+    """
+    下载任务的应用文件（kind=app）或测试脚本（kind=script），供其他主机上的设备代理获取执行所需的文件
+
+    只接受携带AGENT_TOKEN的请求（请求头X-Agent-Token）
+    """
+    if not is_agent_request(request):
+        return JsonResponse({'success': False, 'message': '无权访问'}, status=403)
     try:
-        tasks = Task.objects.all().order_by('-created_time')
-        tasks_data = []
-
-        for task in tasks:
-            # 获取设备结果统计
-            device_results = task.device_results.all()
-            device_stats = {
-                'total': device_results.count(),
-                'pending': device_results.filter(status='pending').count(),
-                'running': device_results.filter(status='running').count(),
-                'success': device_results.filter(status='success').count(),
-                'failed': device_results.filter(status='failed').count(),
-            }
+        task = Task.objects.select_related('test_case').filter(id=task_id).first()
+        if task is None:
+            return JsonResponse({'success': False, 'message': '任务不存在'}, status=404)
+        if kind == 'app':
+            file_path = task.app_file
+        elif kind == 'script':
+            file_path = task.test_case.file_path
+        else:
+            return JsonResponse({'success': False, 'message': '不支持的文件类型'}, status=400)
 
-            # 更新运行中任务的进度
-            if task.status == 'running':
-                completed_devices = device_stats['success'] + device_stats['failed']
-                if device_stats['total'] > 0:
-                    base_progress = (completed_devices / device_stats['total']) * 80
-                    running_progress = (device_stats['running'] / device_stats['total']) * 40
-                    task.progress = min(90, int(base_progress + running_progress))
-                else:
-                    task.progress = min(90, task.progress + 2)  # 缓慢增长
-                task.save()
-
-            tasks_data.append({
-                'id': task.id,
-                'name': task.name,
-                'status': task.status,
-                'status_display': task.get_status_display(),
-                'progress': task.progress,
-                'runtime': task.runtime,
-                'device_count': task.device_count,
-                'device_stats': device_stats,
-                'created_time': task.created_time.strftime('%Y/%m/%d %H:%M:%S'),
-                'start_time': task.start_time.strftime('%Y/%m/%d %H:%M:%S') if task.start_time else None,
-                'end_time': task.end_time.strftime('%Y/%m/%d %H:%M:%S') if task.end_time else None,
-                'error_message': task.error_message
-            })
+        if not file_path or not os.path.isfile(file_path):
+            return JsonResponse({'success': False, 'message': '文件不存在'}, status=404)
+        return FileResponse(open(file_path, 'rb'), as_attachment=True, filename=os.path.basename(file_path))
+    except Exception:
+        logger.exception(f"提供任务 {task_id} 的文件失败: {kind}")
+        return JsonResponse({'success': False, 'message': '获取文件失败'}, status=500)
 
+
+@require_POST
+def cancel_task_view(request, task_id):
+    """
+    取消任务API
+
+    POST参数：
+        device_id  只取消任务中的这台设备；为空时取消整个任务
+    正在执行的设备由worker进程在TASK_CANCEL_POLL_INTERVAL秒内结束其子进程
+    """
+    try:
+        task = Task.objects.filter(id=task_id).first()
+        if task is None:
+            return JsonResponse({'success': False, 'message': '任务不存在'}, status=404)
+
+        device_id = request.POST.get('device_id') or None
+        if device_id is not None and device_id not in (task.devices or []):
+            return JsonResponse({'success': False, 'message': f"任务中没有设备: {device_id}"}, status=400)
+        if task.status not in ('pending', 'running'):
+            return JsonResponse({'success': False, 'message': f"任务当前状态为{task.get_status_display()}，无法取消"},
+                                status=409)
+
+        cancelled = cancel_task(task.id, device_id)
         return JsonResponse({
             'success': True,
-            'tasks': tasks_data
+            'message': f"已取消设备 {device_id}" if device_id else f"任务 '{task.name}' 已取消",
+            'cancelled_devices': cancelled,
         })
     except Exception as e:
-        return JsonResponse({'success': False, 'message': str(e)}, status=500)
\ No newline at end of file
+        return JsonResponse({'success': False, 'message': str(e)}, status=500)